@@ -0,0 +1,182 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+from storage import atomic_write
+
+class AnalysisCache:
+    """Two-tier cache of dashboard analyses keyed by a hash of the image and request"""
+
+    def __init__(self, cache_dir=None, memory_entries=None, max_disk_bytes=None, ttl=None):
+        self.cache_dir = cache_dir or Config.ANALYSIS_CACHE_FOLDER
+        self.memory_entries = memory_entries if memory_entries is not None else Config.ANALYSIS_CACHE_MEMORY_ENTRIES
+        self.max_disk_bytes = max_disk_bytes if max_disk_bytes is not None else Config.ANALYSIS_CACHE_MAX_BYTES
+        self.ttl = ttl if ttl is not None else Config.ANALYSIS_CACHE_TTL
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._disk_bytes = self._scan_disk_usage()
+
+    @staticmethod
+    def make_key(image_data, model, prompt, temperature, **extra):
+        """Build a cache key from the normalized image payload and request parameters"""
+        digest = hashlib.sha256()
+        digest.update(image_data.encode('ascii') if isinstance(image_data, str) else image_data)
+        params = {'model': model, 'prompt': prompt, 'temperature': temperature}
+        params.update(extra)
+        digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        """Get the on-disk path for a cache key"""
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _is_expired(self, stored_at):
+        """Check whether an entry stored at the given time is past its TTL"""
+        return self.ttl > 0 and time.time() - stored_at > self.ttl
+
+    def get(self, key):
+        """Return a cached analysis, or None on a miss"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, analysis = entry
+                if not self._is_expired(stored_at):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    # Callers annotate results, so never hand out the cached object itself
+                    return copy.deepcopy(analysis)
+                del self._memory[key]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._remember(key, entry['stored_at'], entry['analysis'])
+            self.hits += 1
+        return copy.deepcopy(entry['analysis'])
+
+    def put(self, key, analysis):
+        """Store an analysis in both tiers"""
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, copy.deepcopy(analysis))
+        self._write_disk(key, stored_at, analysis)
+
+    def _remember(self, key, stored_at, analysis):
+        """Insert into the memory tier, evicting the least recently used entries"""
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = (stored_at, analysis)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key):
+        """Load an entry from the disk tier, dropping it if expired or unreadable"""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading analysis cache entry {key}: {e}")
+            self._remove_disk_entry(path)
+            return None
+
+        if self._is_expired(entry.get('stored_at', 0)):
+            self._remove_disk_entry(path)
+            return None
+        return entry
+
+    def _write_disk(self, key, stored_at, analysis):
+        """Atomically write an entry to the disk tier"""
+        path = self._entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = json.dumps({'stored_at': stored_at, 'analysis': analysis}, ensure_ascii=False)
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            atomic_write(path, data)
+            with self._lock:
+                self._disk_bytes += os.path.getsize(path) - previous_size
+                over_budget = self.max_disk_bytes > 0 and self._disk_bytes > self.max_disk_bytes
+            if over_budget:
+                self._evict_disk()
+        except Exception as e:
+            print(f"Error writing analysis cache entry {key}: {e}")
+
+    def _remove_disk_entry(self, path):
+        """Delete one disk entry and account for its size"""
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            with self._lock:
+                self._disk_bytes -= size
+        except OSError:
+            pass
+
+    def _list_disk_entries(self):
+        """List (mtime, size, path) for every disk entry"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if filename.endswith('.json'):
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_disk_usage(self):
+        """Total size of the disk tier"""
+        return sum(size for _, size, _ in self._list_disk_entries())
+
+    def _evict_disk(self):
+        """Drop expired entries, then the oldest ones until under the size budget"""
+        entries = sorted(self._list_disk_entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_disk_bytes * 0.9  # Leave headroom so we don't evict on every write
+        now = time.time()
+
+        for mtime, size, path in entries:
+            expired = self.ttl > 0 and now - mtime > self.ttl
+            if not expired and total <= target:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self):
+        """Remove every cached entry"""
+        with self._lock:
+            self._memory.clear()
+        for _, _, path in self._list_disk_entries():
+            self._remove_disk_entry(path)
+
+    def get_stats(self):
+        """Get hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'disk_bytes': self._disk_bytes
+            }
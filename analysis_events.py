@@ -0,0 +1,89 @@
+import threading
+import time
+from config import Config
+
+class AnalysisEventHub:
+    """In-process fan-out of per-job analysis events to server-sent-event listeners"""
+
+    def __init__(self, retention=None):
+        self.retention = retention if retention is not None else Config.STREAM_EVENT_RETENTION
+        self._channels = {}
+        self._seq = 0
+        self._changed = threading.Condition()
+
+    def _channel(self, job_id):
+        channel = self._channels.get(job_id)
+        if channel is None:
+            channel = {'events': [], 'partials': {}, 'closed_at': None}
+            self._channels[job_id] = channel
+        return channel
+
+    def publish(self, job_id, event, data):
+        """Append an event (e.g. 'result') to a job's stream"""
+        with self._changed:
+            self._seq += 1
+            self._channel(job_id)['events'].append((self._seq, event, data))
+            self._changed.notify_all()
+
+    def publish_partial(self, job_id, index, data):
+        """Replace the in-progress analysis of one image; listeners only ever see the latest"""
+        with self._changed:
+            self._seq += 1
+            self._channel(job_id)['partials'][index] = (self._seq, data)
+            self._changed.notify_all()
+
+    def restart_partial(self, job_id, index, data):
+        """Drop one image's in-progress analysis and tell listeners it starts over (e.g. a cascade escalation)"""
+        with self._changed:
+            self._seq += 1
+            channel = self._channel(job_id)
+            channel['partials'].pop(index, None)
+            channel['events'].append((self._seq, 'escalation', data))
+            self._changed.notify_all()
+
+    def close(self, job_id):
+        """Mark a job's stream finished and drop streams that finished long ago"""
+        with self._changed:
+            now = time.time()
+            self._seq += 1
+            channel = self._channel(job_id)
+            channel['events'].append((self._seq, 'done', {}))
+            channel['closed_at'] = now
+            # Partials are superseded by the results; late listeners don't need them
+            channel['partials'].clear()
+            for stale in [key for key, value in self._channels.items()
+                          if value['closed_at'] and now - value['closed_at'] > self.retention]:
+                del self._channels[stale]
+            self._changed.notify_all()
+
+    def has_stream(self, job_id):
+        """Whether anything was published for a job (and not yet expired)"""
+        with self._changed:
+            return job_id in self._channels
+
+    def listen(self, job_id, since=0, keepalive=None):
+        """Yield (seq, event, data) after seq `since` until 'done'; (None, None, None) on idle keepalives"""
+        keepalive = keepalive or Config.SSE_KEEPALIVE_SECONDS
+        while True:
+            with self._changed:
+                pending = self._pending(job_id, since)
+                if not pending:
+                    self._changed.wait(keepalive)
+                    pending = self._pending(job_id, since)
+            if not pending:
+                yield None, None, None
+                continue
+            for seq, event, data in pending:
+                since = max(since, seq)
+                yield seq, event, data
+                if event == 'done':
+                    return
+
+    def _pending(self, job_id, since):
+        """Events newer than `since`, in order; caller holds the lock"""
+        channel = self._channels.get(job_id)
+        if channel is None:
+            return []
+        pending = [item for item in channel['events'] if item[0] > since]
+        pending += [(seq, 'partial', data) for seq, data in channel['partials'].values() if seq > since]
+        return sorted(pending, key=lambda item: item[0])
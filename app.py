@@ -1,7 +1,7 @@
-from flask import Flask, request, render_template, jsonify, send_file, flash, redirect, url_for
+from flask import Flask, Response, request, render_template, jsonify, send_file, flash, redirect, url_for
 import os
-import uuid
-from werkzeug.utils import secure_filename
+import queue
+import threading
 from datetime import datetime
 import json
 
@@ -11,117 +11,296 @@ from report_generator import ReportGenerator
 from grafana_client import GrafanaClient
 from openai_processor import OpenAIProcessor
 from llm_report_generator import LLMReportGenerator
+from batch_executor import BatchExecutor, OrderedResultEmitter
+from job_queue import JobQueue
+from upload_store import UploadStore
+from report_catalog import ReportCatalog
+from rollups import MetricRollups
+from analysis_events import AnalysisEventHub
+from hybrid_router import HybridProcessor
+import columnar_writer
+from columnar_writer import COLUMNAR_FORMATS
+from datasource_query import json_default
 
 app = Flask(__name__)
 Config.init_app(app)
 
 # Initialize components
 image_processor = ImageProcessor()
-report_generator = ReportGenerator()
+report_catalog = ReportCatalog()
+report_generator = ReportGenerator(report_catalog)
 grafana_client = GrafanaClient()
 openai_processor = OpenAIProcessor()
-llm_report_generator = LLMReportGenerator()
+hybrid_processor = HybridProcessor(openai_processor)
+llm_report_generator = LLMReportGenerator(report_catalog)
+metric_rollups = MetricRollups()
+batch_executor = BatchExecutor()
+upload_store = UploadStore()
+analysis_events = AnalysisEventHub()
 
 @app.route('/')
 def index():
     """Main page"""
     return render_template('index.html')
 
+REPORT_FORMATS = {'csv', 'txt', 'json'} | set(COLUMNAR_FORMATS)
+PROCESSING_METHODS = {'llm', 'ocr', 'hybrid'}
+
+def sse_event(event, data, event_id=None):
+    """Format one server-sent event"""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, default=json_default)}"]
+    return '\n'.join(lines) + '\n\n'
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def run_upload_job(payload, progress=None, job_id=None):
+    """Analyze the images of an upload job and write its report"""
+    output_format = payload['output_format']
+    processing_method = payload['processing_method']
+    custom_prompt = payload.get('custom_prompt', '')
+    uploaded_files = payload['files']
+    
+    # In-memory buffers when this process received the upload, saved files otherwise
+    images = [upload_store.get_source(item) for item in uploaded_files]
+    
+    # Tabular rows are streamed to disk as images finish; TXT/JSON need the whole batch
+    report_stream = None
+    # Hybrid results share the LLM analysis structure, so they use the LLM reports
+    llm_shaped = processing_method in ('llm', 'hybrid')
+    if output_format == 'csv':
+        if llm_shaped:
+            report_stream = llm_report_generator.open_llm_csv_stream()
+        else:
+            report_stream = report_generator.open_csv_stream()
+    elif output_format in COLUMNAR_FORMATS:
+        if llm_shaped:
+            report_stream = llm_report_generator.open_llm_columnar_stream(output_format)
+        else:
+            report_stream = report_generator.open_columnar_stream(output_format)
+    
+    processed_data = []
+    processed_count = 0
+    
+    def emit(index, result):
+        """Receive finished results in upload order"""
+        nonlocal processed_count
+        if not result:
+            return
+        if llm_shaped:
+            # Add image info to result
+            result['image_info'] = {
+                'filename': uploaded_files[index]['filename'],
+                'filepath': uploaded_files[index]['filepath'],
+                'processing_method': processing_method
+            }
+        else:
+            result['processing_method'] = 'ocr'
+        processed_count += 1
+        # Keep the scheduler's daily/weekly aggregates current without rereading reports
+        metric_rollups.record(result)
+        if report_stream:
+            report_stream.write(result)
+        else:
+            processed_data.append(result)
+    
+    emit_in_order = OrderedResultEmitter(emit)
+    
+    def on_result(index, result):
+        if progress:
+            progress(index, bool(result))
+        if job_id:
+            # Listeners get each result as soon as it finishes, before upload order is restored
+            analysis_events.publish(job_id, 'result', {
+                'index': index,
+                'filename': uploaded_files[index]['filename'],
+                # Copy: emit adds image_info while listeners may still be serializing it
+                'analysis': dict(result) if result else None
+            })
+        emit_in_order(index, result)
+    
+    def analyze_llm(item):
+        """Analyze one (index, image), streaming partial analyses to event listeners"""
+        index, image = item
+        on_partial = on_escalate = None
+        if job_id:
+            on_partial = lambda partial: analysis_events.publish_partial(job_id, index, {
+                'index': index,
+                'filename': uploaded_files[index]['filename'],
+                'analysis': partial
+            })
+            # A cascade escalation discards what was streamed from the rejected tier
+            on_escalate = lambda info: analysis_events.restart_partial(job_id, index, {
+                'index': index,
+                'filename': uploaded_files[index]['filename'],
+                **info
+            })
+        if custom_prompt:
+            return openai_processor.process_image_with_custom_prompt(image, custom_prompt, on_partial)
+        if processing_method == 'hybrid':
+            return hybrid_processor.process_image(image, on_partial=on_partial, on_escalate=on_escalate)
+        return openai_processor.analyze_dashboard_image(image, on_partial=on_partial, on_escalate=on_escalate)
+    
+    try:
+        # Process the whole batch concurrently; the emitter restores upload order
+        if llm_shaped:
+            # Use OpenAI LLM processing (hybrid runs OCR first inside the same workers)
+            batch_executor.process_llm_batch(analyze_llm, list(enumerate(images)),
+                                             on_result=on_result, keep_results=False)
+        else:
+            # Use traditional OCR processing
+            batch_executor.process_ocr_batch(images, on_result=on_result, keep_results=False)
+    finally:
+        # Buffers are no longer needed once every image has been analyzed
+        upload_store.discard(uploaded_files)
+        if report_stream:
+            report_stream.close()
+    
+    if not processed_count:
+        if report_stream:
+            os.remove(report_stream.filepath)
+            report_catalog.remove(os.path.basename(report_stream.filepath))
+        raise ValueError('No images could be processed')
+    
+    # Generate report based on processing method
+    if report_stream:
+        report_path = report_stream.filepath
+    elif llm_shaped:
+        if output_format == 'txt':
+            report_path = llm_report_generator.generate_llm_txt_report(processed_data)
+        else:
+            report_path = llm_report_generator.generate_llm_json_report(processed_data)
+    else:
+        # Use traditional report generator
+        if output_format == 'txt':
+            report_path = report_generator.generate_txt_report(processed_data)
+        else:
+            report_path = report_generator.generate_json_report(processed_data)
+    
+    if not report_path:
+        raise RuntimeError('Failed to generate report')
+    
+    # Generate summary for the job result
+    return {
+        'total_images': processed_count,
+        'report_file': os.path.basename(report_path),
+        'output_format': output_format,
+        'processing_method': processing_method,
+        'processed_at': datetime.now().isoformat()
+    }
+
+def recover_upload_job(payload):
+    """Reason a job queued by a previous process can't run, or None to run it"""
+    uploaded_files = payload['files']
+    missing = upload_store.missing(uploaded_files)
+    if len(missing) < len(uploaded_files):
+        # Images that are still on disk get processed; the lost ones are reported as failed
+        return None
+    upload_store.discard(uploaded_files)
+    return f"Uploaded images were lost when the server restarted ({len(missing)} image(s)); please upload them again"
+
+# Event stream listeners are told to fetch the final job status only once it has been stored
+job_queue = JobQueue(run_upload_job, recover=recover_upload_job,
+                     on_finish=lambda job_id, status: analysis_events.close(job_id))
+
+@app.before_request
+def ensure_job_workers():
+    """Start the background job workers in the serving process"""
+    job_queue.start()
+
 @app.route('/upload', methods=['POST'])
 def upload_files():
-    """Handle file upload and processing"""
+    """Handle file upload and queue it for background processing"""
     try:
         if 'files' not in request.files:
             return jsonify({'error': 'No files provided'}), 400
         
         files = request.files.getlist('files')
         output_format = request.form.get('output_format', 'csv')
-        processing_method = request.form.get('processing_method', 'llm')  # 'llm' or 'ocr'
+        processing_method = request.form.get('processing_method', 'llm')  # 'llm', 'ocr' or 'hybrid'
         custom_prompt = request.form.get('custom_prompt', '')
         
         if not files or files[0].filename == '':
             return jsonify({'error': 'No files selected'}), 400
         
-        processed_data = []
+        if output_format not in REPORT_FORMATS:
+            return jsonify({'error': 'Invalid output format'}), 400
+        
+        if processing_method not in PROCESSING_METHODS:
+            return jsonify({'error': 'Invalid processing method'}), 400
+        
+        if output_format in COLUMNAR_FORMATS and not columnar_writer.is_available():
+            return jsonify({'error': 'Parquet/Arrow output requires pyarrow to be installed'}), 400
+        
         uploaded_files = []
         
         for file in files:
             if file and Config.allowed_file(file.filename):
-                # Save uploaded file
-                filename = secure_filename(file.filename)
-                unique_filename = f"{uuid.uuid4()}_{filename}"
-                filepath = os.path.join(Config.UPLOAD_FOLDER, unique_filename)
-                file.save(filepath)
-                uploaded_files.append(filepath)
-                
-                # Process image based on method
-                if processing_method == 'llm':
-                    # Use OpenAI LLM processing
-                    if custom_prompt:
-                        result = openai_processor.process_image_with_custom_prompt(filepath, custom_prompt)
-                    else:
-                        result = openai_processor.analyze_dashboard_image(filepath)
-                    
-                    if result:
-                        # Add image info to result
-                        result['image_info'] = {
-                            'filename': filename,
-                            'filepath': filepath,
-                            'processing_method': 'llm'
-                        }
-                        processed_data.append(result)
-                else:
-                    # Use traditional OCR processing
-                    result = image_processor.process_image(filepath)
-                    if result:
-                        result['processing_method'] = 'ocr'
-                        processed_data.append(result)
-        
-        if not processed_data:
-            return jsonify({'error': 'No images could be processed'}), 400
+                uploaded_files.append(upload_store.add(file))
         
-        # Generate report based on processing method
-        if processing_method == 'llm':
-            if output_format == 'csv':
-                report_path = llm_report_generator.generate_llm_csv_report(processed_data)
-            elif output_format == 'txt':
-                report_path = llm_report_generator.generate_llm_txt_report(processed_data)
-            elif output_format == 'json':
-                report_path = llm_report_generator.generate_llm_json_report(processed_data)
-            else:
-                return jsonify({'error': 'Invalid output format'}), 400
-        else:
-            # Use traditional report generator
-            if output_format == 'csv':
-                report_path = report_generator.generate_csv_report(processed_data)
-            elif output_format == 'txt':
-                report_path = report_generator.generate_txt_report(processed_data)
-            elif output_format == 'json':
-                report_path = report_generator.generate_json_report(processed_data)
-            else:
-                return jsonify({'error': 'Invalid output format'}), 400
+        if not uploaded_files:
+            return jsonify({'error': 'No images could be processed'}), 400
         
-        if report_path:
-            # Generate summary for response
-            summary = {
-                'total_images': len(processed_data),
-                'report_file': os.path.basename(report_path),
+        job_id = job_queue.enqueue(
+            {
+                'files': uploaded_files,
                 'output_format': output_format,
                 'processing_method': processing_method,
-                'processed_at': datetime.now().isoformat()
-            }
-            
-            return jsonify({
-                'success': True,
-                'summary': summary,
-                'report_path': report_path
-            })
-        else:
-            return jsonify({'error': 'Failed to generate report'}), 500
+                'custom_prompt': custom_prompt
+            },
+            [item['filename'] for item in uploaded_files]
+        )
+        
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'total_images': len(uploaded_files),
+            'status_url': url_for('get_job_status', job_id=job_id),
+            'events_url': url_for('stream_job_events', job_id=job_id)
+        }), 202
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>')
+def get_job_status(job_id):
+    """Get status, per-image progress and result of an upload job"""
+    try:
+        job = job_queue.get_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>/events')
+def stream_job_events(job_id):
+    """Stream partial and finished analyses of an upload job as server-sent events"""
+    try:
+        job = job_queue.get_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        # EventSource resends the last id it saw when it reconnects
+        since = int(request.headers.get('Last-Event-ID') or request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid event id'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        if job['status'] in ('completed', 'failed') and not analysis_events.has_stream(job_id):
+            yield sse_event('done', {})
+            return
+        for seq, event, data in analysis_events.listen(job_id, since):
+            if event is None:
+                # Comment line keeps proxies from closing an idle stream
+                yield ': keepalive\n\n'
+                continue
+            yield sse_event(event, data, seq)
+    
+    return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
 @app.route('/download/<filename>')
 def download_file(filename):
     """Download generated report"""
@@ -130,6 +309,8 @@ def download_file(filename):
         if os.path.exists(file_path):
             return send_file(file_path, as_attachment=True)
         else:
+            # Deleted outside the app; drop the stale catalog entry
+            report_catalog.remove(filename)
             return jsonify({'error': 'File not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -149,6 +330,55 @@ def test_openai_connection():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/cache-stats')
+def get_cache_stats():
+    """Get hit rates of the analysis caches"""
+    try:
+        return jsonify(openai_processor.get_cache_stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/parse-stats')
+def get_parse_stats():
+    """Get how many LLM answers parsed, needed recovery or were lost"""
+    try:
+        return jsonify(openai_processor.get_parse_stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/routing-stats')
+def get_routing_stats():
+    """Get how many hybrid images stayed on OCR or went to the vision model"""
+    try:
+        return jsonify(hybrid_processor.get_stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/cascade-stats')
+def get_cascade_stats():
+    """Get how often dashboard analyses escalated from the cheap model to a larger one"""
+    try:
+        return jsonify(openai_processor.get_cascade_stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/rate-limits')
+def get_rate_limits():
+    """Get the OpenAI limiter's concurrency limit, remaining budgets and 429 count"""
+    try:
+        return jsonify(openai_processor.get_rate_limit_stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/usage')
+def get_usage():
+    """Get LLM token, latency and cost aggregates for the last `days` days"""
+    try:
+        days = max(1, request.args.get('days', 7, type=int))
+        return jsonify(openai_processor.get_usage_summary(days))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/analyze-with-prompt', methods=['POST'])
 def analyze_with_custom_prompt():
     """Analyze image with custom prompt"""
@@ -164,6 +394,10 @@ def analyze_with_custom_prompt():
         if not os.path.exists(image_path):
             return jsonify({'error': 'Image not found'}), 404
         
+        if request.args.get('stream') == '1':
+            return Response(stream_custom_prompt(image_path, custom_prompt),
+                            mimetype='text/event-stream', headers=SSE_HEADERS)
+        
         # Analyze with custom prompt
         result = openai_processor.process_image_with_custom_prompt(image_path, custom_prompt)
         
@@ -179,6 +413,33 @@ def analyze_with_custom_prompt():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def stream_custom_prompt(image_path, custom_prompt):
+    """Relay a streamed custom-prompt analysis as server-sent events"""
+    events = queue.Queue()
+    
+    def run():
+        try:
+            result = openai_processor.process_image_with_custom_prompt(
+                image_path, custom_prompt, on_partial=lambda partial: events.put(('partial', {'analysis': partial}))
+            )
+            if result:
+                events.put(('result', {'analysis': result, 'processed_at': datetime.now().isoformat()}))
+            else:
+                events.put(('error', {'error': 'Failed to analyze image'}))
+        finally:
+            events.put(('done', {}))
+    
+    threading.Thread(target=run, name='prompt-stream', daemon=True).start()
+    while True:
+        try:
+            event, data = events.get(timeout=Config.SSE_KEEPALIVE_SECONDS)
+        except queue.Empty:
+            yield ': keepalive\n\n'
+            continue
+        yield sse_event(event, data)
+        if event == 'done':
+            return
+
 @app.route('/api/generate-comparative-report', methods=['POST'])
 def generate_comparative_report():
     """Generate comparative report from multiple analyses"""
@@ -236,11 +497,52 @@ def test_grafana_connection():
 def get_dashboards():
     """Get list of Grafana dashboards"""
     try:
-        dashboards = grafana_client.get_dashboards()
+        refresh = request.args.get('refresh', '').lower() in ('1', 'true')
+        dashboards = grafana_client.get_dashboards(use_cache=not refresh)
         return jsonify(dashboards)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/dashboards/<uid>/query')
+def query_dashboard(uid):
+    """Read a dashboard's panel data straight from its datasources instead of a screenshot"""
+    try:
+        time_from = request.args.get('from', 'now-1h')
+        time_to = request.args.get('to', 'now')
+        output_format = request.args.get('format', '')
+        
+        if output_format and output_format not in REPORT_FORMATS:
+            return jsonify({'error': f'Unsupported output format: {output_format}'}), 400
+        if output_format in COLUMNAR_FORMATS and not columnar_writer.is_available():
+            return jsonify({'error': 'Parquet/Arrow output requires pyarrow to be installed'}), 400
+        
+        analysis = grafana_client.query_dashboard(uid, time_from, time_to)
+        if analysis is None:
+            return jsonify({'error': f'Dashboard {uid} could not be loaded'}), 404
+        
+        metric_rollups.record(analysis)
+        
+        # Same structure as an LLM analysis, so the LLM report generators apply
+        report_path = None
+        if output_format == 'csv':
+            report_path = llm_report_generator.generate_llm_csv_report([analysis])
+        elif output_format in COLUMNAR_FORMATS:
+            report_path = llm_report_generator.generate_llm_columnar_report([analysis], output_format)
+        elif output_format == 'txt':
+            report_path = llm_report_generator.generate_llm_txt_report([analysis])
+        elif output_format == 'json':
+            report_path = llm_report_generator.generate_llm_json_report([analysis])
+        
+        body = {
+            'success': True,
+            'analysis': analysis,
+            'report_file': os.path.basename(report_path) if report_path else None
+        }
+        # Series are NumPy arrays, which Flask's JSON encoder doesn't handle
+        return Response(json.dumps(body, default=json_default), mimetype='application/json')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/process-text', methods=['POST'])
 def process_text():
     """Process raw text input (for testing)"""
@@ -264,22 +566,33 @@ def process_text():
 
 @app.route('/api/reports')
 def list_reports():
-    """List generated reports"""
+    """List generated reports (newest first) from the report catalog"""
     try:
-        reports = []
-        if os.path.exists(Config.OUTPUT_FOLDER):
-            for filename in os.listdir(Config.OUTPUT_FOLDER):
-                filepath = os.path.join(Config.OUTPUT_FOLDER, filename)
-                if os.path.isfile(filepath):
-                    stat = os.stat(filepath)
-                    reports.append({
-                        'filename': filename,
-                        'size': stat.st_size,
-                        'created': datetime.fromtimestamp(stat.st_ctime).isoformat(),
-                        'modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
-                    })
-        
-        return jsonify(reports)
+        try:
+            start = request.args.get('from')
+            end = request.args.get('to')
+            start = datetime.fromisoformat(start) if start else None
+            end = datetime.fromisoformat(end) if end else None
+            limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+            offset = max(int(request.args.get('offset', 0)), 0)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+        
+        reports, total = report_catalog.list_reports(
+            kind=request.args.get('kind'),
+            file_format=request.args.get('format'),
+            start=start,
+            end=end,
+            limit=limit,
+            offset=offset
+        )
+        
+        # Body stays a plain list for existing clients; paging info goes in headers
+        response = jsonify(reports)
+        response.headers['X-Total-Count'] = str(total)
+        response.headers['X-Offset'] = str(offset)
+        response.headers['X-Limit'] = str(limit)
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,194 @@
+import json
+import os
+import time
+import uuid
+from config import Config
+from usage_ledger import BudgetExceededError
+
+# Batch states after which nothing more will happen
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+# Anything with submit/poll/download/cancel can replace OpenAIBatchBackend, and
+# OPENAI_BATCH_BASE_URL points the default one at a local server speaking the same API.
+class OpenAIBatchBackend:
+    """Submit and poll JSONL batch jobs through the OpenAI Batch API"""
+
+    def __init__(self, client=None, completion_window=None):
+        if client is None:
+            import openai
+            client = openai.OpenAI(api_key=Config.OPENAI_API_KEY, base_url=Config.OPENAI_BATCH_BASE_URL or None)
+        self.client = client
+        self.completion_window = completion_window or Config.OPENAI_BATCH_COMPLETION_WINDOW
+
+    def submit(self, jsonl_path, endpoint='/v1/chat/completions'):
+        """Upload a request file and start a batch; returns the batch id"""
+        with open(jsonl_path, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=endpoint,
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def poll(self, batch_id):
+        """Current state: {status, output_file_id, error_file_id}"""
+        batch = self.client.batches.retrieve(batch_id)
+        return {
+            'status': batch.status,
+            'output_file_id': batch.output_file_id,
+            'error_file_id': batch.error_file_id
+        }
+
+    def download(self, file_id):
+        """Text content of a result file"""
+        return self.client.files.content(file_id).text
+
+    def cancel(self, batch_id):
+        """Stop a batch that is no longer wanted"""
+        self.client.batches.cancel(batch_id)
+
+class BatchAnalysisRunner:
+    """Analyze many images with one offline batch job instead of one chat call each"""
+
+    def __init__(self, openai_processor, backend=None, work_dir=None, poll_interval=None, timeout=None):
+        self.openai_processor = openai_processor
+        self.backend = backend or OpenAIBatchBackend()
+        self.work_dir = work_dir or Config.OPENAI_BATCH_FOLDER
+        self.poll_interval = poll_interval or Config.OPENAI_BATCH_POLL_INTERVAL
+        self.timeout = timeout or Config.OPENAI_BATCH_TIMEOUT
+        self.max_requests = Config.OPENAI_BATCH_MAX_REQUESTS
+        self.max_bytes = Config.OPENAI_BATCH_MAX_BYTES
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def run(self, images, additional_context=""):
+        """Analyze images (paths, bytes or ImageContexts); returns analyses (or None) in input order"""
+        results = [None] * len(images)
+        run_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        pending = {}
+        input_files = self._write_requests(run_id, images, additional_context, results, pending)
+        if not pending:
+            return results
+
+        if self.openai_processor.usage_ledger:
+            try:
+                self.openai_processor.usage_ledger.check_budget()
+            except BudgetExceededError as e:
+                print(f"Not submitting batch: {e}")
+                for path in input_files:
+                    os.remove(path)
+                return results
+
+        batches = {}
+        for path in input_files:
+            try:
+                batches[self.backend.submit(path)] = path
+            except Exception as e:
+                print(f"Error submitting batch {os.path.basename(path)}: {e}")
+            # The request files hold every encoded image; the backend has its own copy now
+            os.remove(path)
+        print(f"Submitted {len(pending)} analysis request(s) in {len(batches)} batch job(s)")
+
+        for batch_id, state in self._wait(batches).items():
+            if state is None or state['status'] != 'completed':
+                print(f"Batch {batch_id} ended without results: {state['status'] if state else 'timed out'}")
+            for file_id in (state or {}).get('output_file_id'), (state or {}).get('error_file_id'):
+                if file_id:
+                    self._collect(file_id, pending, results)
+        return results
+
+    def _write_requests(self, run_id, images, additional_context, results, pending):
+        """Write one JSONL line per uncached image, split at the per-batch request and size limits"""
+        paths = []
+        output = None
+        count = size = 0
+        try:
+            for index, image in enumerate(images):
+                # No second round to escalate in, so batch jobs go straight to the final cascade tier
+                request = self.openai_processor.prepare_analysis_request(image, additional_context,
+                                                                         self.openai_processor.cascade_models[-1])
+                if not request:
+                    continue
+                if 'cached' in request:
+                    results[index] = request['cached']
+                    continue
+
+                custom_id = f"{run_id}-{index}"
+                line = json.dumps({
+                    'custom_id': custom_id,
+                    'method': 'POST',
+                    'url': '/v1/chat/completions',
+                    'body': request.pop('body')
+                }) + '\n'
+                if output is None or count >= self.max_requests or size + len(line) > self.max_bytes:
+                    if output:
+                        output.close()
+                    paths.append(os.path.join(self.work_dir, f"batch_{run_id}_{len(paths)}.jsonl"))
+                    output = open(paths[-1], 'w', encoding='utf-8')
+                    count = size = 0
+                output.write(line)
+                count += 1
+                size += len(line)
+                # Keep only what's needed to finish the analysis, not the encoded image
+                pending[custom_id] = (index, request)
+        finally:
+            if output:
+                output.close()
+        return paths
+
+    def _wait(self, batches):
+        """Poll every batch until it reaches a terminal state or the timeout passes"""
+        states = {batch_id: None for batch_id in batches}
+        deadline = time.monotonic() + self.timeout
+        while True:
+            for batch_id in states:
+                if states[batch_id] and states[batch_id]['status'] in TERMINAL_STATUSES:
+                    continue
+                try:
+                    states[batch_id] = self.backend.poll(batch_id)
+                except Exception as e:
+                    print(f"Error polling batch {batch_id}: {e}")
+            waiting = [batch_id for batch_id, state in states.items()
+                       if not state or state['status'] not in TERMINAL_STATUSES]
+            if not waiting:
+                return states
+            if time.monotonic() >= deadline:
+                for batch_id in waiting:
+                    try:
+                        self.backend.cancel(batch_id)
+                    except Exception as e:
+                        print(f"Error cancelling batch {batch_id}: {e}")
+                    states[batch_id] = None
+                return states
+            time.sleep(self.poll_interval)
+
+    def _collect(self, file_id, pending, results):
+        """Map each result line back to its image by custom_id"""
+        try:
+            content = self.backend.download(file_id)
+        except Exception as e:
+            print(f"Error downloading batch results {file_id}: {e}")
+            return
+
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                index, request = pending[item['custom_id']]
+                response = item.get('response') or {}
+                if item.get('error') or response.get('status_code') != 200:
+                    print(f"Batch request {item['custom_id']} failed: {item.get('error') or response.get('body')}")
+                    continue
+                message = response['body']['choices'][0]['message']
+                usage = response['body'].get('usage') or {}
+                call = {
+                    'model': response['body'].get('model', self.openai_processor.model),
+                    'prompt_tokens': usage.get('prompt_tokens', 0),
+                    'completion_tokens': usage.get('completion_tokens', 0),
+                    'batch': True
+                }
+                results[index] = self.openai_processor.complete_analysis(request, message.get('content'),
+                                                                         message.get('refusal'), call)
+            except Exception as e:
+                print(f"Error reading batch result line: {e}")
@@ -0,0 +1,162 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from config import Config
+
+# ImageProcessor owned by the current OCR worker process
+_worker_image_processor = None
+
+def _init_ocr_worker(panel_workers=None):
+    """Create the ImageProcessor used by an OCR worker process"""
+    global _worker_image_processor
+    # Imported here so the parent process pays no cost when running serially
+    from image_processor import ImageProcessor
+    from ocr_engine import get_ocr_engine
+    _worker_image_processor = ImageProcessor(panel_workers=panel_workers)
+    # Start the worker's Tesseract engine up front; it lives as long as the process
+    get_ocr_engine()
+
+def _process_image_in_worker(image_path):
+    """Run the OCR pipeline for a single image inside a worker"""
+    if _worker_image_processor is None:
+        _init_ocr_worker()
+    return _worker_image_processor.process_image(image_path)
+
+class OrderedResultEmitter:
+    """Re-sequence out-of-order batch results so a callback sees them in input order"""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._pending = {}
+        self._next_index = 0
+
+    def __call__(self, index, result):
+        self._pending[index] = result
+        # Only results that finished ahead of an earlier one are held back
+        while self._next_index in self._pending:
+            index = self._next_index
+            self._next_index += 1
+            try:
+                self.callback(index, self._pending.pop(index))
+            except Exception as e:
+                # Held-back results behind a failing callback must still be delivered
+                print(f"Error handling result for batch item {index}: {e}")
+
+class BatchExecutor:
+    """Run per-image processing for an upload batch concurrently"""
+
+    def __init__(self, mode=None, ocr_workers=None, llm_workers=None):
+        self.mode = mode or Config.BATCH_EXECUTOR
+        self.ocr_workers = max(1, ocr_workers or Config.OCR_WORKERS)
+        self.llm_workers = max(1, llm_workers or Config.LLM_WORKERS)
+        self._ocr_pool = None
+        self._llm_pool = None
+        self._lock = threading.Lock()
+
+    def _get_ocr_pool(self):
+        """Get the process pool for CPU-bound OCR work, creating it on first use"""
+        with self._lock:
+            if self._ocr_pool is None:
+                # Each worker's panel threads share the cores with the other workers,
+                # so OCR_WORKERS = cpu_count leaves every worker one thread (serial panels)
+                panel_workers = max(1, (os.cpu_count() or 1) // self.ocr_workers)
+                self._ocr_pool = ProcessPoolExecutor(
+                    max_workers=self.ocr_workers,
+                    initializer=_init_ocr_worker,
+                    initargs=(panel_workers,)
+                )
+            return self._ocr_pool
+
+    def _get_llm_pool(self):
+        """Get the bounded thread pool for network-bound LLM calls"""
+        with self._lock:
+            if self._llm_pool is None:
+                self._llm_pool = ThreadPoolExecutor(
+                    max_workers=self.llm_workers,
+                    thread_name_prefix='llm-worker'
+                )
+            return self._llm_pool
+
+    def process_ocr_batch(self, images, on_result=None, keep_results=True):
+        """OCR a batch of images, returning results in input order"""
+        if self.mode == 'serial' or len(images) <= 1:
+            return self._run_serial(_process_image_in_worker, images, on_result, keep_results)
+
+        return self._run_ordered(self._get_ocr_pool(), _process_image_in_worker, images, on_result, keep_results)
+
+    def process_llm_batch(self, analyze_func, items, on_result=None, keep_results=True):
+        """Run an LLM analysis function over a batch, returning results in input order"""
+        if self.mode == 'serial' or len(items) <= 1:
+            return self._run_serial(analyze_func, items, on_result, keep_results)
+
+        return self._run_ordered(self._get_llm_pool(), analyze_func, items, on_result, keep_results)
+
+    def _run_serial(self, func, items, on_result=None, keep_results=True):
+        """Process items one after another in the calling thread"""
+        results = [None] * len(items)
+        for index, item in enumerate(items):
+            try:
+                result = func(item)
+            except Exception as e:
+                print(f"Error processing batch item {index}: {e}")
+                result = None
+            if keep_results:
+                results[index] = result
+            if on_result and not self._deliver(on_result, index, result):
+                results[index] = None
+        return results
+
+    def _run_ordered(self, pool, func, items, on_result=None, keep_results=True):
+        """Fan items out to a pool and collect results back into input order"""
+        results = [None] * len(items)
+        futures = {pool.submit(func, item): index for index, item in enumerate(items)}
+
+        for future in as_completed(futures):
+            index = futures.pop(future)
+            result = None
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                # A worker died (e.g. Tesseract crashed); drop the pool so the next batch gets a fresh one
+                print(f"Worker pool broken while processing batch item {index}: {e}")
+                self._discard_pool(pool)
+            except Exception as e:
+                # A single failed image must not sink the rest of the batch
+                print(f"Error processing batch item {index}: {e}")
+            # Streaming callers pass keep_results=False so finished results can be freed
+            if keep_results:
+                results[index] = result
+            if on_result and not self._deliver(on_result, index, result):
+                results[index] = None
+
+        return results
+
+    @staticmethod
+    def _deliver(on_result, index, result):
+        """Hand one result to the caller's callback; False when the callback failed"""
+        try:
+            on_result(index, result)
+            return True
+        except Exception as e:
+            # A failing report write or listener counts as a failed item, not a failed batch
+            print(f"Error handling result for batch item {index}: {e}")
+            return False
+
+    def _discard_pool(self, pool):
+        """Forget a broken pool so it is recreated on next use"""
+        with self._lock:
+            if pool is self._ocr_pool:
+                self._ocr_pool = None
+            elif pool is self._llm_pool:
+                self._llm_pool = None
+
+    def shutdown(self):
+        """Shut down any worker pools"""
+        with self._lock:
+            if self._ocr_pool is not None:
+                self._ocr_pool.shutdown(wait=False, cancel_futures=True)
+                self._ocr_pool = None
+            if self._llm_pool is not None:
+                self._llm_pool.shutdown(wait=False, cancel_futures=True)
+                self._llm_pool = None
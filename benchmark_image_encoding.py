@@ -0,0 +1,121 @@
+"""Payload size, token cost and extraction accuracy of vision image encodings.
+
+Compares the legacy encoding (JPEG, longest side 2048, quality 85) with the
+token-budget encoder at several budgets on real dashboard screenshots. For
+each encoding it reports bytes, estimated image input tokens and an
+extraction-accuracy proxy: the share of numeric values and status words
+Tesseract reads off the original screenshot that it can still read off the
+encoded image. With --live each encoding is also sent to the configured
+model and the metrics it returns are compared with the legacy one.
+
+Usage:
+    python benchmark_image_encoding.py screenshot.png [more.png ...] [--budgets 255,765,1105] [--live]
+"""
+import argparse
+import base64
+import io
+import json
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from image_context import ImageContext
+from image_encoder import VisionImageEncoder, estimate_image_tokens
+from metric_extractor import MetricExtractor
+from ocr_engine import get_ocr_engine
+
+def legacy_payload(context):
+    """The encoding OpenAIProcessor used before the token-budget encoder"""
+    height, width = context.bgr.shape[:2]
+    scale = min(1.0, 2048 / max(width, height))
+    size = (int(width * scale), int(height * scale))
+    data = context.jpeg_base64(max_size=2048, quality=85)
+    return {
+        'base64': data,
+        'format': 'jpeg',
+        'detail': 'auto',
+        'width': size[0],
+        'height': size[1],
+        'crop': None,
+        'bytes': len(base64.b64decode(data)),
+        'estimated_tokens': estimate_image_tokens(size[0], size[1])
+    }
+
+def readable_values(gray):
+    """Numbers and status words Tesseract can read off an image"""
+    metrics = MetricExtractor().extract(get_ocr_engine().image_to_string(gray))
+    values = {f"{value}{unit}".lower() for value, unit in metrics.get('numbers', [])}
+    values.update(status.upper() for status in metrics.get('status_indicators', []))
+    return values
+
+def decoded_gray(payload, original_shape):
+    """Decode a payload and scale it back to the original size, as the model would see it enlarged"""
+    img = Image.open(io.BytesIO(base64.b64decode(payload['base64']))).convert('L')
+    gray = np.asarray(img)
+    if payload.get('crop'):
+        x, y, w, h = payload['crop']
+        canvas = np.full(original_shape, 255, dtype=np.uint8)
+        canvas[y:y + h, x:x + w] = cv2.resize(gray, (w, h), interpolation=cv2.INTER_CUBIC)
+        return canvas
+    height, width = original_shape
+    return cv2.resize(gray, (width, height), interpolation=cv2.INTER_CUBIC)
+
+def live_metrics(context, payload):
+    """Metrics the configured model extracts from one encoding"""
+    from openai_processor import OpenAIProcessor
+    processor = OpenAIProcessor()
+    processor.cache = None
+    processor.phash_index = None
+    processor.prepare_image = lambda image: payload
+    result = processor.analyze_dashboard_image(context) or {}
+    return result.get('metrics') or {}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark vision image encodings')
+    parser.add_argument('images', nargs='+', help='dashboard screenshots')
+    parser.add_argument('--budgets', default='255,765,1105', help='comma-separated token budgets to try')
+    parser.add_argument('--formats', default='png,webp,jpeg', help='formats the encoder may choose from')
+    parser.add_argument('--live', action='store_true', help='also compare model output (uses API credits)')
+    args = parser.parse_args()
+
+    formats = [name.strip() for name in args.formats.split(',') if name.strip()]
+    encoders = [(f"budget {budget}", VisionImageEncoder(token_budget=int(budget), formats=formats))
+                for budget in args.budgets.split(',')]
+    totals = {}
+
+    for path in args.images:
+        context = ImageContext.from_path(path)
+        reference = readable_values(context.gray)
+        payloads = [('legacy', legacy_payload(context))]
+        payloads += [(name, encoder.encode(context)) for name, encoder in encoders]
+        reference_metrics = live_metrics(context, payloads[0][1]) if args.live else None
+
+        print(f"\n{path}  ({context.bgr.shape[1]}x{context.bgr.shape[0]}, {len(reference)} readable values)")
+        print(f"{'encoding':<14}{'format':<8}{'detail':<8}{'size':<12}{'bytes':>10}{'tokens':>8}{'recall':>8}")
+        for name, payload in payloads:
+            recall = 1.0
+            if reference:
+                recall = len(reference & readable_values(decoded_gray(payload, context.gray.shape))) / len(reference)
+            line = (f"{name:<14}{payload['format']:<8}{payload['detail']:<8}"
+                    f"{payload['width']}x{payload['height']:<7}{payload['bytes']:>10}"
+                    f"{payload['estimated_tokens']:>8}{recall:>8.0%}")
+            if args.live:
+                metrics = live_metrics(context, payload)
+                agree = sum(1 for key, value in reference_metrics.items() if metrics.get(key) == value)
+                line += f"  model agreement {agree}/{len(reference_metrics)}"
+            print(line)
+
+            total = totals.setdefault(name, {'bytes': 0, 'tokens': 0, 'recall': 0.0})
+            total['bytes'] += payload['bytes']
+            total['tokens'] += payload['estimated_tokens']
+            total['recall'] += recall
+
+    count = len(args.images)
+    print("\nAverages per image:")
+    print(json.dumps({name: {'bytes': total['bytes'] // count, 'tokens': total['tokens'] // count,
+                             'recall': round(total['recall'] / count, 3)}
+                      for name, total in totals.items()}, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+from datetime import datetime
+from config import Config
+
+# pyarrow is only needed for the Parquet/Arrow report formats
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+COLUMNAR_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+def is_available():
+    """Whether pyarrow is installed"""
+    return pa is not None
+
+def to_float(value):
+    """Coerce a reported value to float, or None if it isn't numeric"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).strip().rstrip('%'))
+    except (TypeError, ValueError):
+        return None
+
+def to_int(value):
+    """Coerce a reported value to int, or None if it isn't numeric"""
+    number = to_float(value)
+    return int(number) if number is not None else None
+
+def to_timestamp(value):
+    """Parse an ISO timestamp string, or None"""
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+class StreamingColumnarWriter:
+    """Write report records to a Parquet or Arrow IPC file in record batches"""
+
+    def __init__(self, filepath, schema, row_builder, output_format='parquet', batch_size=None, on_close=None):
+        if pa is None:
+            raise RuntimeError("Parquet/Arrow output requires pyarrow; install it with 'pip install pyarrow'")
+        if output_format not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unsupported columnar format: {output_format}")
+
+        self.filepath = filepath
+        self.schema = schema
+        self.row_builder = row_builder
+        self.output_format = output_format
+        self.batch_size = batch_size or Config.COLUMNAR_BATCH_SIZE
+        self.on_close = on_close
+        self.rows_written = 0
+        self._rows = []
+
+        if output_format == 'parquet':
+            self._writer = pq.ParquetWriter(filepath, schema, compression='zstd')
+        else:
+            # IPC file format (not stream) so readers can memory-map it with random access
+            self._sink = pa.OSFile(filepath, 'wb')
+            self._writer = ipc.new_file(self._sink, schema)
+
+    def write(self, record):
+        """Buffer a record, writing a record batch once enough rows are pending"""
+        self._rows.append(self.row_builder(record))
+        self.rows_written += 1
+        if len(self._rows) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        """Write pending rows as one record batch"""
+        if not self._rows:
+            return
+        batch = pa.RecordBatch.from_pylist(self._rows, schema=self.schema)
+        self._writer.write_batch(batch)
+        self._rows = []
+
+    def close(self):
+        """Flush remaining rows and finalize the file footer"""
+        if self._writer is None:
+            return
+        try:
+            self._flush()
+        finally:
+            self._writer.close()
+            if self.output_format == 'arrow':
+                self._sink.close()
+            self._writer = None
+        if self.on_close:
+            self.on_close(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def read_report(filepath):
+    """Read a Parquet or Arrow report back as a pyarrow Table, memory-mapping the file"""
+    if pa is None:
+        raise RuntimeError("Reading Parquet/Arrow reports requires pyarrow")
+    if filepath.endswith('.arrow'):
+        # The table's buffers point into the mapping, so leave it open for their lifetime
+        return ipc.open_file(pa.memory_map(filepath, 'r')).read_all()
+    return pq.read_table(filepath, memory_map=True)
+
+def ocr_report_schema():
+    """Arrow schema for OCR report rows"""
+    panel = pa.struct([
+        ('x', pa.int32()),
+        ('y', pa.int32()),
+        ('width', pa.int32()),
+        ('height', pa.int32()),
+        ('psm', pa.int8()),
+        ('text', pa.string()),
+        ('numbers', pa.list_(pa.float64())),
+    ])
+    return pa.schema([
+        ('filename', pa.string()),
+        ('processed_at', pa.timestamp('us')),
+        ('dashboard_title', pa.string()),
+        ('image_width', pa.int32()),
+        ('image_height', pa.int32()),
+        ('file_size', pa.int64()),
+        ('numbers', pa.list_(pa.struct([('value', pa.float64()), ('unit', pa.string())]))),
+        ('percentages', pa.list_(pa.float64())),
+        ('status_indicators', pa.list_(pa.string())),
+        ('panel_titles', pa.list_(pa.string())),
+        ('panels', pa.list_(panel)),
+        ('raw_text_length', pa.int64()),
+    ])
+
+def llm_report_schema():
+    """Arrow schema for LLM analysis report rows"""
+    panel = pa.struct([
+        ('title', pa.string()),
+        ('type', pa.string()),
+        ('current_value', pa.float64()),
+        ('unit', pa.string()),
+        ('status', pa.string()),
+        ('threshold', pa.float64()),
+    ])
+    metric = pa.struct([
+        ('name', pa.string()),
+        ('value', pa.float64()),
+        ('unit', pa.string()),
+    ])
+    return pa.schema([
+        ('analyzed_at', pa.timestamp('us')),
+        ('model_used', pa.string()),
+        ('image_file', pa.string()),
+        ('dashboard_title', pa.string()),
+        ('time_range', pa.string()),
+        ('panel_count', pa.int32()),
+        ('dashboard_theme', pa.string()),
+        ('health_status', pa.string()),
+        ('cpu_usage', pa.float64()),
+        ('memory_usage', pa.float64()),
+        ('disk_usage', pa.float64()),
+        ('network_in', pa.float64()),
+        ('network_out', pa.float64()),
+        ('other_metrics', pa.list_(metric)),
+        ('panels', pa.list_(panel)),
+        ('alerts', pa.list_(pa.string())),
+        ('insights', pa.list_(pa.string())),
+        ('analysis_error', pa.string()),
+        ('custom_prompt', pa.string()),
+    ])
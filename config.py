@@ -12,6 +12,15 @@ class Config:
     GRAFANA_USERNAME = os.getenv('GRAFANA_USERNAME', '')
     GRAFANA_PASSWORD = os.getenv('GRAFANA_PASSWORD', '')
     GRAFANA_API_KEY = os.getenv('GRAFANA_API_KEY', '')
+    GRAFANA_CONNECT_TIMEOUT = float(os.getenv('GRAFANA_CONNECT_TIMEOUT', 5))
+    GRAFANA_READ_TIMEOUT = float(os.getenv('GRAFANA_READ_TIMEOUT', 30))
+    GRAFANA_RENDER_TIMEOUT = float(os.getenv('GRAFANA_RENDER_TIMEOUT', 120))  # image renderer is slow
+    GRAFANA_MAX_RETRIES = int(os.getenv('GRAFANA_MAX_RETRIES', 3))
+    GRAFANA_BACKOFF_BASE = float(os.getenv('GRAFANA_BACKOFF_BASE', 0.5))  # seconds
+    GRAFANA_BACKOFF_MAX = float(os.getenv('GRAFANA_BACKOFF_MAX', 30))
+    GRAFANA_POOL_SIZE = int(os.getenv('GRAFANA_POOL_SIZE', 16))
+    GRAFANA_MAX_CONCURRENCY = int(os.getenv('GRAFANA_MAX_CONCURRENCY', 8))
+    DATASOURCE_MAX_DATA_POINTS = int(os.getenv('DATASOURCE_MAX_DATA_POINTS', 1000))  # per series in direct queries
     
     # OpenAI Configuration
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
@@ -19,19 +28,134 @@ class Config:
     USE_OPENAI_VISION = os.getenv('USE_OPENAI_VISION', 'true').lower() == 'true'
     OPENAI_MAX_TOKENS = int(os.getenv('OPENAI_MAX_TOKENS', 4000))
     OPENAI_TEMPERATURE = float(os.getenv('OPENAI_TEMPERATURE', 0.1))
+    OPENAI_STRUCTURED_OUTPUT = os.getenv('OPENAI_STRUCTURED_OUTPUT', 'json_schema')  # 'json_schema', 'json_object' or 'off'
+    OPENAI_STREAMING = os.getenv('OPENAI_STREAMING', 'true').lower() == 'true'  # stream partial analyses to the browser
+    OPENAI_CASCADE_ENABLED = os.getenv('OPENAI_CASCADE_ENABLED', 'false').lower() == 'true'
+    OPENAI_CASCADE_MODELS = [m.strip() for m in os.getenv('OPENAI_CASCADE_MODELS', f'gpt-4.1-mini,{OPENAI_MODEL}').split(',') if m.strip()]  # cheapest per image first
+    VISION_ENCODER = os.getenv('VISION_ENCODER', 'budget')  # 'budget' or 'legacy' (2048px JPEG q85)
+    VISION_TOKEN_BUDGET = int(os.getenv('VISION_TOKEN_BUDGET', 1105))  # OPENAI_MODEL image tokens per request (85 + 170 per tile)
+    VISION_DETAIL = os.getenv('VISION_DETAIL', 'auto')  # 'auto', 'high' or 'low'
+    VISION_IMAGE_FORMATS = [f.strip().lower() for f in os.getenv('VISION_IMAGE_FORMATS', 'png,webp,jpeg').split(',') if f.strip()]
+    VISION_LOSSY_QUALITY = int(os.getenv('VISION_LOSSY_QUALITY', 90))
+    VISION_LOSSLESS_SLACK = float(os.getenv('VISION_LOSSLESS_SLACK', 1.5))  # keep PNG if within this factor of the smallest
+    VISION_CROP_MARGINS = os.getenv('VISION_CROP_MARGINS', 'true').lower() == 'true'
+    VISION_BASE_TOKENS = int(os.getenv('VISION_BASE_TOKENS', 85))
+    VISION_TILE_TOKENS = int(os.getenv('VISION_TILE_TOKENS', 170))
+    # Models whose image pricing differs from VISION_BASE_TOKENS/VISION_TILE_TOKENS: 'model=base/tile' or 'model=patch*multiplier'
+    VISION_MODEL_PRICING = os.getenv('VISION_MODEL_PRICING', 'gpt-4o-mini=2833/5667,gpt-4.1-mini=patch*1.62,gpt-4.1-nano=patch*2.46,o4-mini=patch*1.72')
+    
+    # OpenAI Rate Limiting Configuration (shared by every realtime OpenAI call in the process)
+    OPENAI_RATE_LIMIT_ENABLED = os.getenv('OPENAI_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    OPENAI_REQUESTS_PER_MINUTE = int(os.getenv('OPENAI_REQUESTS_PER_MINUTE', 500))  # 0 = unlimited
+    OPENAI_TOKENS_PER_MINUTE = int(os.getenv('OPENAI_TOKENS_PER_MINUTE', 30000))  # 0 = unlimited
+    OPENAI_MODEL_RATE_LIMITS = os.getenv('OPENAI_MODEL_RATE_LIMITS', 'gpt-4o-mini=500/200000,gpt-4.1-mini=500/200000')  # 'model=requests/tokens,...' per-model overrides of the two above
+    OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', 8))
+    OPENAI_MIN_CONCURRENCY = int(os.getenv('OPENAI_MIN_CONCURRENCY', 1))
+    OPENAI_CONCURRENCY_DECREASE = float(os.getenv('OPENAI_CONCURRENCY_DECREASE', 0.5))  # limit multiplier on 429
+    OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 5))
+    OPENAI_BACKOFF_BASE = float(os.getenv('OPENAI_BACKOFF_BASE', 1.0))  # seconds, when no retry-after is given
+    OPENAI_BACKOFF_MAX = float(os.getenv('OPENAI_BACKOFF_MAX', 60))
     
     # Flask Configuration
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
     OUTPUT_FOLDER = os.getenv('OUTPUT_FOLDER', 'outputs')
     MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
+    DATA_FOLDER = os.getenv('DATA_FOLDER', 'data')
+    IN_MEMORY_UPLOADS = os.getenv('IN_MEMORY_UPLOADS', 'true').lower() == 'true'
+    PERSIST_UPLOADS = os.getenv('PERSIST_UPLOADS', 'true').lower() == 'true'
+    UPLOAD_SPOOL_FOLDER = os.getenv('UPLOAD_SPOOL_FOLDER', os.path.join(DATA_FOLDER, 'upload_spool'))  # queued uploads when not persisted
+    UPLOAD_BUFFER_MAX_BYTES = int(os.getenv('UPLOAD_BUFFER_MAX_BYTES', 256 * 1024 * 1024))  # beyond this, queued uploads are read from disk
     
     # OCR Configuration
     TESSERACT_PATH = os.getenv('TESSERACT_PATH', r'C:\Program Files\Tesseract-OCR\tesseract.exe')
+    OCR_ENGINE = os.getenv('OCR_ENGINE', 'auto')  # 'auto', 'tesserocr' or 'pytesseract'
+    OCR_LANGUAGE = os.getenv('OCR_LANGUAGE', 'eng')
+    TESSDATA_PATH = os.getenv('TESSDATA_PATH', '')
+    PANEL_SEGMENTATION = os.getenv('PANEL_SEGMENTATION', 'false').lower() == 'true'  # changes raw_text to per-panel blocks
+    PANEL_OCR_WORKERS = int(os.getenv('PANEL_OCR_WORKERS', 4))  # outside the OCR process pool; its workers get cpu_count // OCR_WORKERS
+    PANEL_MIN_AREA_RATIO = float(os.getenv('PANEL_MIN_AREA_RATIO', 0.01))
+    PANEL_MAX_COUNT = int(os.getenv('PANEL_MAX_COUNT', 64))
+    
+    # Hybrid Processing Configuration (OCR first, vision model only when OCR is unsure)
+    HYBRID_CONFIDENCE_THRESHOLD = float(os.getenv('HYBRID_CONFIDENCE_THRESHOLD', 0.6))  # 0-1; below this escalates
+    HYBRID_WORD_CONFIDENCE_WEIGHT = float(os.getenv('HYBRID_WORD_CONFIDENCE_WEIGHT', 0.6))  # rest is metric coverage
+    HYBRID_MIN_CATEGORIES = int(os.getenv('HYBRID_MIN_CATEGORIES', 3))  # metric categories filled for full coverage
+    HYBRID_PANEL_ESCALATION_RATIO = float(os.getenv('HYBRID_PANEL_ESCALATION_RATIO', 0.5))  # above: send whole image
+    
+    # Batch Processing Configuration
+    BATCH_EXECUTOR = os.getenv('BATCH_EXECUTOR', 'pool')  # 'pool' or 'serial'
+    OCR_WORKERS = int(os.getenv('OCR_WORKERS', os.cpu_count() or 1))
+    LLM_WORKERS = int(os.getenv('LLM_WORKERS', 8))
+    
+    # Background Job Configuration
+    JOB_DB_PATH = os.getenv('JOB_DB_PATH', os.path.join(DATA_FOLDER, 'jobs.db'))
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+    
+    # Analysis Cache Configuration
+    ANALYSIS_CACHE_ENABLED = os.getenv('ANALYSIS_CACHE_ENABLED', 'true').lower() == 'true'
+    ANALYSIS_CACHE_FOLDER = os.getenv('ANALYSIS_CACHE_FOLDER', os.path.join(DATA_FOLDER, 'analysis_cache'))
+    ANALYSIS_CACHE_MEMORY_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MEMORY_ENTRIES', 256))
+    ANALYSIS_CACHE_MAX_BYTES = int(os.getenv('ANALYSIS_CACHE_MAX_BYTES', 256 * 1024 * 1024))  # 256MB
+    ANALYSIS_CACHE_TTL = int(os.getenv('ANALYSIS_CACHE_TTL', 7 * 24 * 3600))  # 7 days
+    
+    # Near-Duplicate Detection Configuration
+    PHASH_ENABLED = os.getenv('PHASH_ENABLED', 'true').lower() == 'true'
+    PHASH_ALGORITHM = os.getenv('PHASH_ALGORITHM', 'phash')  # 'phash' or 'dhash'
+    PHASH_THRESHOLD = int(os.getenv('PHASH_THRESHOLD', 4))  # max Hamming distance out of 64 bits
+    PHASH_MAX_ENTRIES = int(os.getenv('PHASH_MAX_ENTRIES', 512))
+    PHASH_MAX_AGE = int(os.getenv('PHASH_MAX_AGE', 15 * 60))  # re-analyze near-duplicates older than this
+    PHASH_MIN_DETAIL = float(os.getenv('PHASH_MIN_DETAIL', 4.0))  # grey-level std below which images are never matched
+    
+    # Dashboard Metadata Cache Configuration
+    DASHBOARD_CACHE_ENABLED = os.getenv('DASHBOARD_CACHE_ENABLED', 'true').lower() == 'true'
+    DASHBOARD_CACHE_FOLDER = os.getenv('DASHBOARD_CACHE_FOLDER', os.path.join(DATA_FOLDER, 'dashboard_cache'))
+    DASHBOARD_SEARCH_TTL = int(os.getenv('DASHBOARD_SEARCH_TTL', 300))  # seconds before /api/search is repeated
+    DASHBOARD_MODEL_TTL = int(os.getenv('DASHBOARD_MODEL_TTL', 60))  # seconds before a model's version is rechecked
+    
+    # Scheduled Panel Rendering Configuration
+    SCHEDULED_RENDER_ENABLED = os.getenv('SCHEDULED_RENDER_ENABLED', 'false').lower() == 'true'
+    RENDER_INTERVAL_MINUTES = int(os.getenv('RENDER_INTERVAL_MINUTES', 60))
+    RENDER_DASHBOARD_UIDS = [uid.strip() for uid in os.getenv('RENDER_DASHBOARD_UIDS', '').split(',') if uid.strip()]  # empty = all
+    RENDER_TIME_RANGE = int(os.getenv('RENDER_TIME_RANGE', 3600))  # seconds of data shown in each panel
+    # Render window alignment and render-cache key: only runs inside the same bucket (manual reruns, retries)
+    # reuse PNGs; scheduled runs every RENDER_INTERVAL_MINUTES always start a new bucket and re-render
+    RENDER_BUCKET_SECONDS = int(os.getenv('RENDER_BUCKET_SECONDS', 900))
+    RENDER_PANEL_WIDTH = int(os.getenv('RENDER_PANEL_WIDTH', 1000))
+    RENDER_PANEL_HEIGHT = int(os.getenv('RENDER_PANEL_HEIGHT', 500))
+    RENDER_PROCESSING_METHOD = os.getenv('RENDER_PROCESSING_METHOD', 'llm' if USE_OPENAI_VISION else 'ocr')  # 'llm', 'ocr' or 'hybrid'
+    RENDER_OUTPUT_FORMAT = os.getenv('RENDER_OUTPUT_FORMAT', 'csv')
+    RENDER_CACHE_FOLDER = os.getenv('RENDER_CACHE_FOLDER', os.path.join(DATA_FOLDER, 'render_cache'))
+    RENDER_CACHE_MAX_AGE = int(os.getenv('RENDER_CACHE_MAX_AGE', 24 * 3600))
+    
+    # OpenAI Batch API Configuration (offline analysis for scheduled bulk runs)
+    OPENAI_BATCH_ENABLED = os.getenv('OPENAI_BATCH_ENABLED', 'false').lower() == 'true'
+    OPENAI_BATCH_BASE_URL = os.getenv('OPENAI_BATCH_BASE_URL', '')  # empty = api.openai.com
+    OPENAI_BATCH_FOLDER = os.getenv('OPENAI_BATCH_FOLDER', os.path.join(DATA_FOLDER, 'batch_jobs'))
+    OPENAI_BATCH_COMPLETION_WINDOW = os.getenv('OPENAI_BATCH_COMPLETION_WINDOW', '24h')
+    OPENAI_BATCH_POLL_INTERVAL = int(os.getenv('OPENAI_BATCH_POLL_INTERVAL', 30))  # seconds
+    OPENAI_BATCH_TIMEOUT = int(os.getenv('OPENAI_BATCH_TIMEOUT', 24 * 3600))  # give up (and cancel) after this
+    OPENAI_BATCH_MAX_REQUESTS = int(os.getenv('OPENAI_BATCH_MAX_REQUESTS', 50000))  # per batch file
+    OPENAI_BATCH_MAX_BYTES = int(os.getenv('OPENAI_BATCH_MAX_BYTES', 190 * 1024 * 1024))  # per batch file
+    
+    # LLM Usage Ledger Configuration (tokens, latency and cost of every OpenAI call)
+    USAGE_LEDGER_ENABLED = os.getenv('USAGE_LEDGER_ENABLED', 'true').lower() == 'true'
+    USAGE_DB_PATH = os.getenv('USAGE_DB_PATH', os.path.join(DATA_FOLDER, 'usage.db'))
+    USAGE_PRICES = os.getenv('USAGE_PRICES', 'gpt-4o=2.50/10.00,gpt-4o-mini=0.15/0.60,gpt-4.1=2.00/8.00,gpt-4.1-mini=0.40/1.60')  # USD per 1M input/output tokens
+    USAGE_BATCH_PRICE_RATIO = float(os.getenv('USAGE_BATCH_PRICE_RATIO', 0.5))  # Batch API discount
+    USAGE_DAILY_BUDGET = float(os.getenv('USAGE_DAILY_BUDGET', 0))  # USD; 0 = no limit
     
     # Report Configuration
     DEFAULT_OUTPUT_FORMAT = os.getenv('DEFAULT_OUTPUT_FORMAT', 'csv')
     REPORT_TIMESTAMP_FORMAT = os.getenv('REPORT_TIMESTAMP_FORMAT', '%Y-%m-%d_%H-%M-%S')
+    COLUMNAR_BATCH_SIZE = int(os.getenv('COLUMNAR_BATCH_SIZE', 1024))  # rows per Parquet/Arrow record batch
+    REPORT_CATALOG_PATH = os.getenv('REPORT_CATALOG_PATH', os.path.join(DATA_FOLDER, 'reports.db'))
+    ROLLUP_DB_PATH = os.getenv('ROLLUP_DB_PATH', os.path.join(DATA_FOLDER, 'rollups.db'))
+    
+    # Server-Sent Events Configuration
+    SSE_KEEPALIVE_SECONDS = int(os.getenv('SSE_KEEPALIVE_SECONDS', 15))
+    STREAM_EVENT_RETENTION = int(os.getenv('STREAM_EVENT_RETENTION', 600))  # seconds finished job streams stay replayable
     
     # Supported file extensions
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
@@ -42,6 +166,7 @@ class Config:
         # Create necessary directories
         os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
         os.makedirs(Config.OUTPUT_FOLDER, exist_ok=True)
+        os.makedirs(Config.DATA_FOLDER, exist_ok=True)
         
         # Set Flask configuration
         app.config['SECRET_KEY'] = Config.SECRET_KEY
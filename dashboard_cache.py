@@ -0,0 +1,114 @@
+import copy
+import json
+import os
+import threading
+import time
+from config import Config
+from storage import atomic_write
+
+# Search fields compared between hourly collections
+DIFF_FIELDS = ('title', 'folderTitle', 'tags', 'url')
+
+def diff_dashboards(previous, current):
+    """Compare two dashboard search listings keyed by UID"""
+    previous = {item.get('uid'): item for item in previous}
+    current = {item.get('uid'): item for item in current}
+
+    added = [current[uid] for uid in current if uid not in previous]
+    removed = [previous[uid] for uid in previous if uid not in current]
+    changed = []
+    for uid, item in current.items():
+        if uid not in previous:
+            continue
+        changes = {
+            field: [previous[uid].get(field), item.get(field)]
+            for field in DIFF_FIELDS
+            if previous[uid].get(field) != item.get(field)
+        }
+        if changes:
+            changed.append({'uid': uid, 'title': item.get('title'), 'changes': changes})
+
+    return {'added': added, 'removed': removed, 'changed': changed}
+
+class DashboardMetadataCache:
+    """Search results with a TTL, and dashboard models keyed by UID and version"""
+
+    def __init__(self, cache_dir=None, search_ttl=None, model_ttl=None):
+        self.cache_dir = cache_dir or Config.DASHBOARD_CACHE_FOLDER
+        self.search_ttl = search_ttl if search_ttl is not None else Config.DASHBOARD_SEARCH_TTL
+        self.model_ttl = model_ttl if model_ttl is not None else Config.DASHBOARD_MODEL_TTL
+        self._search = {}
+        self._models = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.cache_dir, 'models'), exist_ok=True)
+
+    def get_search(self, key):
+        """Cached search results, or None if missing or older than the TTL"""
+        with self._lock:
+            entry = self._search.get(key)
+            if entry is None or time.time() - entry[0] > self.search_ttl:
+                return None
+            return copy.deepcopy(entry[1])
+
+    def put_search(self, key, results):
+        """Store search results"""
+        with self._lock:
+            self._search[key] = (time.time(), copy.deepcopy(results))
+
+    def _model_path(self, uid):
+        return os.path.join(self.cache_dir, 'models', f"{uid}.json")
+
+    def get_model(self, uid):
+        """Cached model entry {version, checked_at, dashboard} from memory or disk"""
+        with self._lock:
+            entry = self._models.get(uid)
+        if entry is None:
+            try:
+                with open(self._model_path(uid), 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None
+            with self._lock:
+                self._models[uid] = entry
+        return {**entry, 'dashboard': copy.deepcopy(entry['dashboard'])}
+
+    def is_fresh(self, entry):
+        """Whether a model was checked recently enough to skip revalidation"""
+        return time.time() - entry['checked_at'] <= self.model_ttl
+
+    def put_model(self, uid, version, dashboard):
+        """Store a freshly downloaded model"""
+        entry = {'version': version, 'checked_at': time.time(), 'dashboard': copy.deepcopy(dashboard)}
+        with self._lock:
+            self._models[uid] = entry
+        self._write_json(self._model_path(uid), entry)
+
+    def touch_model(self, uid):
+        """Mark a cached model as revalidated (its version is unchanged), on disk too"""
+        with self._lock:
+            entry = self._models.get(uid)
+            if entry is None:
+                return
+            entry['checked_at'] = time.time()
+            entry = {**entry, 'dashboard': copy.deepcopy(entry['dashboard'])}
+        self._write_json(self._model_path(uid), entry)
+
+    def load_snapshot(self, name):
+        """Load a persisted snapshot (e.g. the last collected dashboard list), or None"""
+        try:
+            with open(os.path.join(self.cache_dir, f"{name}.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_snapshot(self, name, data):
+        """Persist a snapshot"""
+        self._write_json(os.path.join(self.cache_dir, f"{name}.json"), data)
+
+    @staticmethod
+    def _write_json(path, data):
+        """Write atomically so readers never see a partial file"""
+        try:
+            atomic_write(path, json.dumps(data))
+        except Exception as e:
+            print(f"Error writing dashboard cache file {path}: {e}")
@@ -0,0 +1,318 @@
+import json
+import re
+from datetime import datetime
+import numpy as np
+
+# Threshold step colors Grafana uses for bad states; anything else that isn't green is a warning
+CRITICAL_COLORS = {'red', 'dark-red', 'semi-dark-red', 'light-red', '#f2495c', '#e02f44', '#c4162a'}
+OK_COLORS = {'green', 'dark-green', 'semi-dark-green', 'light-green', '#73bf69', '#56a64b', '#37872d'}
+
+# Panel title keywords -> keys of the metrics summary the report generators expect
+METRIC_KEYWORDS = [
+    ('cpu_usage', ('cpu',)),
+    ('memory_usage', ('memory', 'mem', 'ram')),
+    ('disk_usage', ('disk', 'filesystem', 'storage')),
+    ('network_in', ('network in', 'received', 'receive', 'inbound', 'rx')),
+    ('network_out', ('network out', 'transmitted', 'transmit', 'outbound', 'tx')),
+]
+
+RELATIVE_TIME = re.compile(r'^now(?:-(\d+)([smhdwMy]))?$')
+UNIT_MS = {'s': 1000, 'm': 60000, 'h': 3600000, 'd': 86400000, 'w': 604800000,
+           'M': 30 * 86400000, 'y': 365 * 86400000}
+
+def range_ms(time_from, time_to):
+    """Length of a Grafana time range ('now-6h'/'now' or epoch milliseconds) in ms"""
+    def offset(value):
+        if isinstance(value, (int, float)) or str(value).isdigit():
+            return None, int(value)
+        match = RELATIVE_TIME.match(str(value))
+        if not match:
+            return None, None
+        amount, unit = match.groups()
+        return (int(amount) * UNIT_MS[unit]) if amount else 0, None
+
+    from_offset, from_epoch = offset(time_from)
+    to_offset, to_epoch = offset(time_to)
+    if from_epoch is not None and to_epoch is not None:
+        return max(to_epoch - from_epoch, 1)
+    if from_offset is not None and to_offset is not None:
+        return max(from_offset - to_offset, 1)
+    return 3600000
+
+def flatten_panels(panels):
+    """Yield panels in dashboard order, including those nested in collapsed rows"""
+    for panel in panels or []:
+        if panel.get('type') == 'row':
+            yield from flatten_panels(panel.get('panels'))
+        else:
+            yield panel
+
+def format_interval(ms):
+    """Grafana-style interval string for a duration in ms ('30s', '5m', '1500ms')"""
+    ms = int(ms)
+    for unit in ('y', 'w', 'd', 'h', 'm', 's'):
+        if ms >= UNIT_MS[unit] and ms % UNIT_MS[unit] == 0:
+            return f"{ms // UNIT_MS[unit]}{unit}"
+    return f"{ms}ms"
+
+def template_variables(dashboard, interval_ms, time_from, time_to):
+    """Current values of a dashboard's templating variables plus the $__interval/$__range built-ins"""
+    span = range_ms(time_from, time_to)
+    variables = {
+        '__interval': {'values': [format_interval(interval_ms)]},
+        '__interval_ms': {'values': [str(interval_ms)]},
+        '__range': {'values': [format_interval(span)]},
+        '__range_s': {'values': [str(span // 1000)]},
+        '__range_ms': {'values': [str(span)]},
+    }
+    for variable in (dashboard.get('templating') or {}).get('list') or []:
+        name = variable.get('name')
+        if not name or variable.get('type') == 'adhoc':
+            continue
+        current = (variable.get('current') or {}).get('value')
+        values = current if isinstance(current, list) else [current] if current not in (None, '') else []
+        values = [str(value) for value in values]
+        if '$__all' in values:
+            if variable.get('allValue'):
+                variables[name] = {'values': [variable['allValue']], 'raw': True}
+                continue
+            values = [str(option.get('value')) for option in variable.get('options') or []
+                      if option.get('value') not in (None, '$__all')]
+        elif any(value.startswith('$__auto') for value in values):
+            values = [format_interval(interval_ms)]
+        # A declared variable with nothing selected (e.g. query options never saved) stays unresolved
+        variables[name] = {'values': values or None, 'multi': bool(variable.get('multi') or variable.get('includeAll'))}
+    return variables
+
+class UnresolvedVariableError(ValueError):
+    """A target references a dashboard variable that has no current value to substitute"""
+
+# $var, ${var}, ${var:format}, ${var.field:format} and the deprecated [[var]] / [[var:format]]
+VARIABLE_PATTERN = re.compile(r'\$(\w+)|\[\[(\w+?)(?::(\w+))?\]\]|\$\{(\w+)(?:\.[^:}]+)?(?::([^}]+))?\}')
+REGEX_DATASOURCES = {'prometheus', 'loki'}
+SQL_DATASOURCES = {'mysql', 'postgres', 'grafana-postgresql-datasource', 'mssql', 'grafana-clickhouse-datasource'}
+
+def format_variable(variable, fmt, datasource_type):
+    """Render a variable's values the way Grafana would for the given format / datasource type"""
+    values = variable['values']
+    if variable.get('raw') or fmt in ('raw', 'text'):
+        return ','.join(values)
+    if fmt is None:
+        if datasource_type in REGEX_DATASOURCES:
+            fmt = 'regex' if variable.get('multi') else 'raw'
+        elif datasource_type in SQL_DATASOURCES:
+            fmt = 'sqlstring'
+        elif len(values) > 1:
+            fmt = 'glob'
+        else:
+            return values[0]
+    if fmt == 'regex':
+        escaped = [re.sub(r'([\\^$.|?*+()\[\]{}])', r'\\\1', value) for value in values]
+        return escaped[0] if len(escaped) == 1 else f"({'|'.join(escaped)})"
+    if fmt == 'pipe':
+        return '|'.join(values)
+    if fmt == 'csv':
+        return ','.join(values)
+    if fmt == 'glob':
+        return values[0] if len(values) == 1 else f"{{{','.join(values)}}}"
+    if fmt == 'json':
+        return json.dumps(values[0] if len(values) == 1 else values)
+    if fmt in ('singlequote', 'sqlstring'):
+        return ','.join("'" + value.replace("'", "''" if fmt == 'sqlstring' else "\\'") + "'" for value in values)
+    if fmt == 'doublequote':
+        return ','.join('"' + value.replace('"', '\\"') + '"' for value in values)
+    return ','.join(values)
+
+def interpolate(value, variables, datasource_type=None):
+    """Substitute dashboard variables in every string of a target; unknown $names are left untouched"""
+    if isinstance(value, dict):
+        return {key: interpolate(item, variables, datasource_type) for key, item in value.items()}
+    if isinstance(value, list):
+        return [interpolate(item, variables, datasource_type) for item in value]
+    if not isinstance(value, str) or ('$' not in value and '[[' not in value):
+        return value
+
+    def substitute(match):
+        name = match.group(1) or match.group(2) or match.group(4)
+        fmt = match.group(3) or match.group(5)
+        variable = variables.get(name)
+        if variable is None:
+            return match.group(0)
+        if variable['values'] is None:
+            raise UnresolvedVariableError(f"unresolved template variable ${name}")
+        return format_variable(variable, fmt, datasource_type)
+
+    return VARIABLE_PATTERN.sub(substitute, value)
+
+def panel_queries(panel, resolve_datasource, max_data_points, interval_ms, variables=None):
+    """Turn a panel's targets into /api/ds/query queries with dashboard variables substituted"""
+    # Raises UnresolvedVariableError when a target needs a variable that has no current value
+    variables = variables or {}
+    queries = []
+    for index, target in enumerate(panel.get('targets') or []):
+        if target.get('hide'):
+            continue
+        datasource = resolve_datasource(interpolate(target.get('datasource') or panel.get('datasource'), variables))
+        query = interpolate({key: value for key, value in target.items() if key not in ('refId', 'datasource')},
+                            variables, (datasource or {}).get('type'))
+        query['refId'] = target.get('refId') or chr(ord('A') + index)
+        query['datasource'] = datasource
+        query['maxDataPoints'] = max_data_points
+        query['intervalMs'] = interval_ms
+        queries.append(query)
+    return queries
+
+def frame_to_series(frame):
+    """Convert one data frame into series with NumPy timestamp and value arrays"""
+    fields = frame.get('schema', {}).get('fields', [])
+    values = frame.get('data', {}).get('values', [])
+    time_index = next((i for i, field in enumerate(fields) if field.get('type') == 'time'), None)
+    timestamps = None
+    if time_index is not None and time_index < len(values):
+        timestamps = np.asarray(values[time_index], dtype='int64').astype('datetime64[ms]')
+
+    series = []
+    for i, field in enumerate(fields):
+        if i == time_index or field.get('type') != 'number' or i >= len(values):
+            continue
+        config = field.get('config') or {}
+        series.append({
+            'name': config.get('displayNameFromDS') or config.get('displayName') or field.get('name', ''),
+            'labels': field.get('labels') or {},
+            'unit': config.get('unit'),
+            'timestamps': timestamps,
+            # None (gaps) become NaN
+            'values': np.asarray(values[i], dtype=np.float64)
+        })
+    return series
+
+def response_to_series(response):
+    """Series for every frame of a /api/ds/query response, plus any per-query errors"""
+    series, errors = [], []
+    for ref_id, result in (response.get('results') or {}).items():
+        if result.get('error'):
+            errors.append(f"{ref_id}: {result['error']}")
+        for frame in result.get('frames') or []:
+            series.extend(frame_to_series(frame))
+    return series, errors
+
+def last_value(values):
+    """Most recent non-NaN value, or None"""
+    finite = values[np.isfinite(values)]
+    return float(finite[-1]) if finite.size else None
+
+def threshold_status(value, field_config):
+    """Map a value onto the panel's absolute threshold steps: (status, first threshold value)"""
+    thresholds = (field_config.get('defaults') or {}).get('thresholds') or {}
+    steps = thresholds.get('steps') or []
+    limits = [step.get('value') for step in steps if step.get('value') is not None]
+    threshold = limits[0] if limits else None
+    if value is None or not steps or thresholds.get('mode', 'absolute') != 'absolute':
+        return 'UNKNOWN', threshold
+
+    color = steps[0].get('color', '')
+    for step in steps[1:]:
+        if step.get('value') is not None and value >= step['value']:
+            color = step.get('color', '')
+    color = color.lower()
+    if color in CRITICAL_COLORS:
+        return 'CRITICAL', threshold
+    if color in OK_COLORS:
+        return 'OK', threshold
+    return 'WARNING', threshold
+
+def display_unit(unit):
+    """Short unit label for a Grafana unit id"""
+    if unit in ('percent', 'percentunit'):
+        return '%'
+    return unit or ''
+
+def metric_key(title):
+    """metrics summary key a panel title maps to, if any"""
+    title = title.lower()
+    for key, keywords in METRIC_KEYWORDS:
+        if any(re.search(rf'\b{keyword}\b', title) for keyword in keywords):
+            return key
+    return None
+
+def build_panel(panel, series, errors):
+    """Panel entry in the analysis structure, with the raw series attached"""
+    field_config = panel.get('fieldConfig') or {}
+    unit = (field_config.get('defaults') or {}).get('unit') or (series[0]['unit'] if series else None)
+    current = last_value(series[0]['values']) if series else None
+    if current is not None and unit == 'percentunit':
+        current *= 100
+    status, threshold = threshold_status(current, field_config)
+
+    entry = {
+        'title': panel.get('title', ''),
+        'type': panel.get('type', ''),
+        'current_value': current,
+        'unit': display_unit(unit),
+        'status': status,
+        'threshold': threshold,
+        'series': series
+    }
+    if errors:
+        entry['error'] = '; '.join(errors)
+    return entry
+
+def build_dashboard_analysis(uid, dashboard_model, panels, time_from, time_to):
+    """Assemble the dashboard_overview/panels/metrics structure the report generators consume"""
+    dashboard = dashboard_model.get('dashboard', {})
+    tags = dashboard.get('tags') or []
+
+    metrics, alerts, insights = {}, [], []
+    for panel in panels:
+        key = metric_key(panel['title'])
+        if key and key not in metrics and panel['current_value'] is not None:
+            metrics[key] = round(panel['current_value'], 3)
+        if panel['status'] in ('WARNING', 'CRITICAL'):
+            alerts.append(f"{panel['title']}: {panel['current_value']:.2f}{panel['unit']} ({panel['status']})")
+        for series in panel['series'][:1]:
+            values = series['values'][np.isfinite(series['values'])]
+            if values.size:
+                insights.append(f"{panel['title']}: min {values.min():.2f}, max {values.max():.2f}, "
+                                f"mean {values.mean():.2f}{panel['unit']} over {values.size} points")
+
+    statuses = {panel['status'] for panel in panels}
+    if 'CRITICAL' in statuses:
+        health_status = 'CRITICAL'
+    elif 'WARNING' in statuses:
+        health_status = 'WARNING'
+    elif 'OK' in statuses:
+        health_status = 'HEALTHY'
+    else:
+        # No panel has thresholds to judge against
+        health_status = 'UNKNOWN'
+
+    return {
+        'dashboard_uid': uid,
+        'dashboard_overview': {
+            'title': dashboard.get('title', ''),
+            'time_range': f"{time_from} to {time_to}",
+            'panel_count': len(panels),
+            'theme': tags[0] if tags else ''
+        },
+        'panels': panels,
+        'metrics': metrics,
+        'health_status': health_status,
+        'alerts': alerts,
+        'insights': insights,
+        'processed_at': datetime.now().isoformat(),
+        'model_used': 'datasource-query',
+        'image_info': {
+            'filename': f"{uid}",
+            'processing_method': 'datasource'
+        }
+    }
+
+def json_default(value):
+    """json.dump fallback for NumPy arrays and scalars in datasource results"""
+    if isinstance(value, np.ndarray):
+        if np.issubdtype(value.dtype, np.datetime64):
+            return value.astype('int64').tolist()  # epoch milliseconds
+        return [None if np.isnan(v) else v for v in value.tolist()]
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
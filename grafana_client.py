@@ -1,7 +1,16 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from datetime import datetime
 from config import Config
+from dashboard_cache import DashboardMetadataCache
+import datasource_query
+
+# Responses worth retrying: rate limiting and transient server/proxy failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 class GrafanaClient:
     """Client for interacting with Grafana API"""
@@ -11,9 +20,26 @@ class GrafanaClient:
         self.username = Config.GRAFANA_USERNAME
         self.password = Config.GRAFANA_PASSWORD
         self.api_key = Config.GRAFANA_API_KEY
+        self.timeout = (Config.GRAFANA_CONNECT_TIMEOUT, Config.GRAFANA_READ_TIMEOUT)
+        self.render_timeout = (Config.GRAFANA_CONNECT_TIMEOUT, Config.GRAFANA_RENDER_TIMEOUT)
+        self.max_retries = Config.GRAFANA_MAX_RETRIES
+        self.backoff_base = Config.GRAFANA_BACKOFF_BASE
+        self.backoff_max = Config.GRAFANA_BACKOFF_MAX
+        self.max_concurrency = Config.GRAFANA_MAX_CONCURRENCY
+        self.metadata_cache = DashboardMetadataCache() if Config.DASHBOARD_CACHE_ENABLED else None
+        self._datasource_refs = {}
         self.session = requests.Session()
+        self._setup_transport()
         self._setup_auth()
     
+    def _setup_transport(self):
+        """Size the connection pool so concurrent bulk requests reuse connections"""
+        pool_size = max(Config.GRAFANA_POOL_SIZE, self.max_concurrency)
+        # Retries are handled in _request so backoff can be jittered and honor Retry-After
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
     def _setup_auth(self):
         """Setup authentication for Grafana API"""
         if self.api_key:
@@ -29,34 +55,109 @@ class GrafanaClient:
         else:
             raise ValueError("Either API key or username/password must be provided")
     
+    def _backoff_delay(self, attempt, response=None):
+        """Seconds to wait before the next attempt: Retry-After if given, else full-jitter exponential"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+    
+    def _request(self, method, path, timeout=None, **kwargs):
+        """Send a request with timeouts, retrying 429/5xx and connection failures with backoff"""
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._backoff_delay(attempt))
+                continue
+            
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            time.sleep(self._backoff_delay(attempt, response))
+    
+    def _map_concurrent(self, func, items, max_concurrency=None):
+        """Apply func to every item with at most max_concurrency requests in flight, keeping order"""
+        items = list(items)
+        if not items:
+            return []
+        workers = min(max_concurrency or self.max_concurrency, len(items))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='grafana') as executor:
+            return list(executor.map(func, items))
+    
     def test_connection(self):
         """Test connection to Grafana"""
         try:
-            response = self.session.get(f"{self.base_url}/api/health")
+            response = self._request('GET', "/api/health")
             return response.status_code == 200
         except Exception as e:
             print(f"Connection test failed: {e}")
             return False
     
-    def get_dashboards(self):
+    def get_dashboards(self, use_cache=True):
         """Get list of all dashboards"""
+        return self.search_dashboards(use_cache) or []
+    
+    def search_dashboards(self, use_cache=True):
+        """Get list of all dashboards, or None if the search failed"""
+        if self.metadata_cache and use_cache:
+            cached = self.metadata_cache.get_search('dash-db')
+            if cached is not None:
+                return cached
+        
         try:
-            response = self.session.get(f"{self.base_url}/api/search?type=dash-db")
+            response = self._request('GET', "/api/search", params={'type': 'dash-db'})
             if response.status_code == 200:
-                return response.json()
+                dashboards = response.json()
+                if self.metadata_cache:
+                    self.metadata_cache.put_search('dash-db', dashboards)
+                return dashboards
             else:
                 print(f"Failed to get dashboards: {response.status_code}")
-                return []
+                return None
         except Exception as e:
             print(f"Error getting dashboards: {e}")
-            return []
+            return None
+    
+    def get_dashboard_version(self, uid):
+        """Get a dashboard's latest version number without downloading its model"""
+        try:
+            response = self._request('GET', f"/api/dashboards/uid/{uid}/versions", params={'limit': 1})
+            if response.status_code != 200:
+                return None
+            data = response.json()
+            # Grafana 11 wraps the list as {"versions": [...]}; older releases return it bare
+            versions = data.get('versions', []) if isinstance(data, dict) else data
+            return versions[0].get('version') if versions else None
+        except Exception as e:
+            print(f"Error getting version of dashboard {uid}: {e}")
+            return None
     
     def get_dashboard_by_uid(self, uid):
-        """Get dashboard by UID"""
+        """Get dashboard by UID, reusing the cached model while its version is unchanged"""
+        cached = self.metadata_cache.get_model(uid) if self.metadata_cache else None
+        if cached is not None:
+            if self.metadata_cache.is_fresh(cached):
+                return cached['dashboard']
+            version = self.get_dashboard_version(uid)
+            if version is not None and version == cached['version']:
+                self.metadata_cache.touch_model(uid)
+                return cached['dashboard']
+        
         try:
-            response = self.session.get(f"{self.base_url}/api/dashboards/uid/{uid}")
+            response = self._request('GET', f"/api/dashboards/uid/{uid}")
             if response.status_code == 200:
-                return response.json()
+                dashboard = response.json()
+                if self.metadata_cache:
+                    version = dashboard.get('dashboard', {}).get('version')
+                    self.metadata_cache.put_model(uid, version, dashboard)
+                return dashboard
             else:
                 print(f"Failed to get dashboard {uid}: {response.status_code}")
                 return None
@@ -64,7 +165,13 @@ class GrafanaClient:
             print(f"Error getting dashboard {uid}: {e}")
             return None
     
-    def get_dashboard_snapshot(self, dashboard_id, panel_id=None, width=1000, height=500):
+    def get_dashboards_by_uid(self, uids, max_concurrency=None):
+        """Fetch many dashboards concurrently; returns {uid: dashboard or None}"""
+        uids = list(dict.fromkeys(uids))
+        dashboards = self._map_concurrent(self.get_dashboard_by_uid, uids, max_concurrency)
+        return dict(zip(uids, dashboards))
+    
+    def get_dashboard_snapshot(self, dashboard_id, panel_id=None, width=1000, height=500, time_from=None, time_to=None):
         """Get dashboard snapshot (if available)"""
         try:
             params = {
@@ -74,9 +181,13 @@ class GrafanaClient:
             }
             if panel_id:
                 params['panelId'] = panel_id
+            if time_from is not None:
+                params['from'] = time_from
+            if time_to is not None:
+                params['to'] = time_to
             
-            url = f"{self.base_url}/render/d-solo/{dashboard_id}"
-            response = self.session.get(url, params=params)
+            response = self._request('GET', f"/render/d-solo/{dashboard_id}", params=params,
+                                     timeout=self.render_timeout)
             
             if response.status_code == 200:
                 return response.content
@@ -87,11 +198,101 @@ class GrafanaClient:
             print(f"Error getting snapshot: {e}")
             return None
     
+    def render_panels(self, panels, max_concurrency=None, time_from=None, time_to=None):
+        """Render many panels concurrently; returns PNG bytes (or None) per panel, in order"""
+        # Each panel is a dict with dashboard_id and optionally panel_id, width, height, time_from and time_to;
+        # the time range arguments apply to panels that do not set their own
+        def render(panel):
+            return self.get_dashboard_snapshot(
+                panel['dashboard_id'],
+                panel_id=panel.get('panel_id'),
+                width=panel.get('width', 1000),
+                height=panel.get('height', 500),
+                time_from=panel.get('time_from', time_from),
+                time_to=panel.get('time_to', time_to)
+            )
+        
+        return self._map_concurrent(render, panels, max_concurrency)
+    
+    def _resolve_datasource(self, ref):
+        """Turn a panel/target datasource reference into the {type, uid} form /api/ds/query needs"""
+        if isinstance(ref, dict) and ref.get('uid') and not str(ref['uid']).startswith('$'):
+            return ref
+        
+        # Legacy name strings, and unset references meaning the default datasource
+        name = ref if isinstance(ref, str) and not ref.startswith('$') else None
+        key = name or '__default__'
+        if key not in self._datasource_refs:
+            resolved = None
+            try:
+                if name:
+                    response = self._request('GET', f"/api/datasources/name/{name}")
+                    if response.status_code == 200:
+                        resolved = response.json()
+                else:
+                    response = self._request('GET', "/api/datasources")
+                    if response.status_code == 200:
+                        resolved = next((ds for ds in response.json() if ds.get('isDefault')), None)
+            except Exception as e:
+                print(f"Error resolving datasource {key}: {e}")
+            self._datasource_refs[key] = {'type': resolved['type'], 'uid': resolved['uid']} if resolved else None
+        return self._datasource_refs[key]
+    
+    def query_datasources(self, queries, time_from='now-1h', time_to='now'):
+        """Run queries through /api/ds/query; returns the raw response JSON or None"""
+        try:
+            body = {'queries': queries, 'from': str(time_from), 'to': str(time_to)}
+            response = self._request('POST', "/api/ds/query", json=body)
+            # 207 Multi-Status: some queries failed, results carry per-refId errors
+            if response.status_code in (200, 207):
+                return response.json()
+            else:
+                print(f"Datasource query failed: {response.status_code} {response.text[:200]}")
+                return None
+        except Exception as e:
+            print(f"Error querying datasources: {e}")
+            return None
+    
+    def query_dashboard(self, uid, time_from='now-1h', time_to='now', max_data_points=None, max_concurrency=None):
+        """Query every panel's targets directly, skipping screenshots; returns an analysis dict or None"""
+        dashboard_model = self.get_dashboard_by_uid(uid)
+        if not dashboard_model:
+            return None
+        
+        max_data_points = max_data_points or Config.DATASOURCE_MAX_DATA_POINTS
+        interval_ms = max(datasource_query.range_ms(time_from, time_to) // max_data_points, 1000)
+        dashboard = dashboard_model.get('dashboard', {})
+        variables = datasource_query.template_variables(dashboard, interval_ms, time_from, time_to)
+        panels = [
+            panel for panel in datasource_query.flatten_panels(dashboard.get('panels'))
+            if panel.get('targets')
+        ]
+        
+        def query_panel(panel):
+            try:
+                queries = datasource_query.panel_queries(panel, self._resolve_datasource, max_data_points,
+                                                         interval_ms, variables)
+            except datasource_query.UnresolvedVariableError as e:
+                # Sending the literal $var would only come back as a datasource parse error
+                return datasource_query.build_panel(panel, [], [str(e)])
+            response = self.query_datasources(queries, time_from, time_to) if queries else None
+            if response is None:
+                return datasource_query.build_panel(panel, [], ['query failed'] if queries else [])
+            series, errors = datasource_query.response_to_series(response)
+            return datasource_query.build_panel(panel, series, errors)
+        
+        results = self._map_concurrent(query_panel, panels, max_concurrency)
+        return datasource_query.build_dashboard_analysis(uid, dashboard_model, results, time_from, time_to)
+    
     def validate_credentials(self):
         """Validate Grafana credentials"""
         try:
-            response = self.session.get(f"{self.base_url}/api/user")
+            response = self._request('GET', "/api/user")
             return response.status_code == 200
         except Exception as e:
             print(f"Credential validation failed: {e}")
             return False
+    
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
@@ -0,0 +1,190 @@
+import threading
+from datetime import datetime
+import cv2
+from config import Config
+from datasource_query import metric_key
+from image_context import ImageContext
+from image_processor import ImageProcessor
+from metric_extractor import METRIC_PATTERNS
+from report_catalog import HEALTH_SEVERITY
+
+METRIC_CATEGORIES = [name for name, _ in METRIC_PATTERNS]
+
+# OCR status words -> the per-panel status and dashboard health the LLM analysis uses
+PANEL_STATUS = {1: 'OK', 2: 'WARNING', 3: 'CRITICAL', 4: 'CRITICAL'}
+HEALTH_STATUS = {1: 'HEALTHY', 2: 'WARNING', 3: 'CRITICAL', 4: 'CRITICAL'}
+
+PANEL_CONTEXT = "This image is a single panel cropped from a larger dashboard; report it as one panel."
+
+def ocr_confidence(word_confidence, metrics):
+    """Score 0-1 for how far an OCR reading can be trusted without the vision model"""
+    words = (word_confidence or 0.0) / 100
+    filled = sum(1 for name in METRIC_CATEGORIES if metrics.get(name))
+    coverage = min(1.0, filled / max(1, Config.HYBRID_MIN_CATEGORIES))
+    weight = Config.HYBRID_WORD_CONFIDENCE_WEIGHT
+    return round(weight * words + (1 - weight) * coverage, 3)
+
+def worst_severity(statuses):
+    """Highest HEALTH_SEVERITY among status words, or None"""
+    known = [HEALTH_SEVERITY[status.upper()] for status in statuses if status.upper() in HEALTH_SEVERITY]
+    return max(known) if known else None
+
+def ocr_panel_analysis(panel):
+    """LLM-style panel entry from an OCR panel"""
+    metrics = panel.get('metrics', {})
+    lines = [line.strip() for line in panel.get('text', '').splitlines() if line.strip()]
+    value, unit = None, ''
+    if metrics.get('percentages'):
+        value, unit = metrics['percentages'][0], '%'
+    elif metrics.get('numbers'):
+        value, unit = metrics['numbers'][0]
+    severity = worst_severity(metrics.get('status_indicators', []))
+    return {
+        'title': (metrics.get('panel_titles') or lines or [''])[0],
+        'type': 'unknown',
+        'current_value': float(value) if value is not None else None,
+        'unit': unit,
+        'status': PANEL_STATUS.get(severity, 'UNKNOWN'),
+        'threshold': None,
+        'source': 'ocr',
+        'confidence': panel.get('confidence')
+    }
+
+def ocr_to_analysis(result):
+    """Convert an OCR result into the dashboard analysis structure the LLM reports consume"""
+    metrics = result.get('metrics', {})
+    panels = [ocr_panel_analysis(panel) for panel in result.get('panels', [])]
+    if not panels:
+        panels = [ocr_panel_analysis({'text': result.get('raw_text', ''), 'metrics': metrics,
+                                      'confidence': result.get('confidence')})]
+
+    summary = {}
+    for panel in panels:
+        key = metric_key(panel['title'])
+        if key and key not in summary and panel['current_value'] is not None:
+            summary[key] = panel['current_value']
+
+    statuses = [str(status).upper() for status in metrics.get('status_indicators', [])]
+    severity = worst_severity(statuses)
+    return {
+        'dashboard_overview': {
+            'title': metrics.get('dashboard_title', ''),
+            'time_range': '',
+            'panel_count': len(panels),
+            'theme': ''
+        },
+        'panels': panels,
+        'metrics': summary,
+        'health_status': HEALTH_STATUS.get(severity, 'UNKNOWN'),
+        'alerts': [f"{panel['title']}: {panel['status']}" for panel in panels if panel['status'] == 'CRITICAL'],
+        'insights': [],
+        'raw_text': result.get('raw_text', ''),
+        'processed_at': datetime.now().isoformat(),
+        'model_used': 'ocr'
+    }
+
+class HybridProcessor:
+    """OCR every image first and send only low-confidence images or panels to the vision model"""
+
+    def __init__(self, openai_processor, image_processor=None, threshold=None):
+        self.openai_processor = openai_processor
+        self.image_processor = image_processor or ImageProcessor(word_confidences=True)
+        self.threshold = threshold if threshold is not None else Config.HYBRID_CONFIDENCE_THRESHOLD
+        self._lock = threading.Lock()
+        self.routes = {'ocr': 0, 'panels': 0, 'vision': 0}
+        self.escalated_panels = 0
+
+    def _count(self, route, panels=0):
+        with self._lock:
+            self.routes[route] += 1
+            self.escalated_panels += panels
+
+    def process_image(self, image, on_partial=None, on_escalate=None):
+        """Analyze an image, calling the vision model only where OCR is unsure"""
+        try:
+            context = ImageContext.ensure(image)
+            ocr_result = self.image_processor.process_image(context)
+            if ocr_result is None:
+                return self._escalate_image(context, None, on_partial, on_escalate)
+
+            ocr_result['confidence'] = ocr_confidence(ocr_result.get('word_confidence'), ocr_result['metrics'])
+            panels = ocr_result.get('panels', [])
+            for panel in panels:
+                panel['confidence'] = ocr_confidence(panel.get('word_confidence'), panel['metrics'])
+            low = [index for index, panel in enumerate(panels) if panel['confidence'] < self.threshold]
+
+            if not panels and ocr_result['confidence'] < self.threshold:
+                return self._escalate_image(context, ocr_result, on_partial, on_escalate)
+            # Past this share of unsure panels one whole-image call beats several panel calls
+            if panels and len(low) > len(panels) * Config.HYBRID_PANEL_ESCALATION_RATIO:
+                return self._escalate_image(context, ocr_result, on_partial, on_escalate)
+
+            analysis = ocr_to_analysis(ocr_result)
+            if low:
+                self._escalate_panels(context, analysis, [(index, panels[index]) for index in low])
+            else:
+                self._count('ocr')
+            analysis['routing'] = {
+                'route': 'panels' if low else 'ocr',
+                'confidence': ocr_result['confidence'],
+                'threshold': self.threshold,
+                'escalated_panels': len(low)
+            }
+            return analysis
+        except Exception as e:
+            print(f"Error in hybrid processing: {e}")
+            return None
+
+    def _escalate_image(self, context, ocr_result, on_partial, on_escalate=None):
+        """Analyze the whole image with the vision model"""
+        self._count('vision')
+        analysis = self.openai_processor.analyze_dashboard_image(context, on_partial=on_partial, on_escalate=on_escalate)
+        if analysis is not None:
+            analysis['routing'] = {
+                'route': 'vision',
+                'confidence': ocr_result['confidence'] if ocr_result else None,
+                'threshold': self.threshold,
+                'escalated_panels': 0
+            }
+        return analysis
+
+    def _escalate_panels(self, context, analysis, low_panels):
+        """Replace unsure OCR panels with vision readings of their crops"""
+        self._count('panels', len(low_panels))
+        models = set()
+        for index, panel in low_panels:
+            x, y, w, h = panel['bbox']
+            ok, png = cv2.imencode('.png', context.bgr[y:y + h, x:x + w])
+            if not ok:
+                continue
+            crop = ImageContext.from_bytes(png.tobytes(), filename=f"{context.filename or 'image'}#panel{index}")
+            result = self.openai_processor.analyze_dashboard_image(crop, PANEL_CONTEXT)
+            if not result or 'parsing_error' in result or not result.get('panels'):
+                continue
+
+            # Cascade tiers may differ per crop; record the models that actually answered
+            models.add(result.get('model_used') or self.openai_processor.model)
+            vision_panels = [dict(item, source='vision') for item in result['panels']]
+            analysis['panels'][index:index + 1] = vision_panels[:1]
+            for key, value in (result.get('metrics') or {}).items():
+                if value is not None:
+                    analysis['metrics'].setdefault(key, value)
+            analysis['alerts'].extend(result.get('alerts') or [])
+            analysis['insights'].extend(result.get('insights') or [])
+            severity = HEALTH_SEVERITY.get(str(result.get('health_status', '')).upper())
+            current = HEALTH_SEVERITY.get(analysis['health_status'])
+            if severity and (current is None or severity > current):
+                analysis['health_status'] = HEALTH_STATUS[severity]
+        if models:
+            analysis['model_used'] = f"ocr+{'+'.join(sorted(models))}"
+
+    def get_stats(self):
+        """Get how many images each route handled"""
+        with self._lock:
+            total = sum(self.routes.values())
+            return {
+                'threshold': self.threshold,
+                'routes': dict(self.routes),
+                'escalated_panels': self.escalated_panels,
+                'vision_rate': self.routes['vision'] / total if total else 0.0
+            }
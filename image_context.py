@@ -0,0 +1,124 @@
+import base64
+import io
+import os
+import threading
+import cv2
+import numpy as np
+from PIL import Image
+
+class ImageContext:
+    """A screenshot decoded once, with derived artifacts memoized for every pipeline stage"""
+
+    def __init__(self, data, filename=None, path=None):
+        self.data = data
+        self.path = path
+        self.filename = filename or (os.path.basename(path) if path else 'image')
+        self._artifacts = {}
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        # Only ship the raw bytes to worker processes; artifacts are recomputed there
+        return {'data': bytes(self.data), 'filename': self.filename, 'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['data'], filename=state['filename'], path=state['path'])
+
+    @classmethod
+    def from_path(cls, image_path):
+        """Read an image file into a context"""
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        return cls(data, path=image_path)
+
+    @classmethod
+    def from_bytes(cls, data, filename=None):
+        """Wrap already loaded image bytes in a context"""
+        return cls(data, filename=filename)
+
+    @classmethod
+    def ensure(cls, source):
+        """Return the source as an ImageContext, loading it if given a path or bytes"""
+        if isinstance(source, cls):
+            return source
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return cls.from_bytes(source)
+        return cls.from_path(source)
+
+    def get_or_compute(self, name, factory):
+        """Return a memoized artifact, computing it with factory() on first use"""
+        with self._lock:
+            if name not in self._artifacts:
+                self._artifacts[name] = factory()
+            return self._artifacts[name]
+
+    def has(self, name):
+        """Whether an artifact has already been computed"""
+        return name in self._artifacts
+
+    def release(self, *names):
+        """Drop memoized artifacts to free memory (all pixel arrays if no names given)"""
+        with self._lock:
+            if not names:
+                names = [name for name, value in self._artifacts.items() if isinstance(value, np.ndarray)]
+            for name in names:
+                self._artifacts.pop(name, None)
+
+    @property
+    def bgr(self):
+        """Decoded BGR pixel array"""
+        return self.get_or_compute('bgr', self._decode)
+
+    @property
+    def gray(self):
+        """Grayscale version of the image"""
+        return self.get_or_compute('gray', lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def threshold(self):
+        """Otsu-thresholded binary image"""
+        def compute():
+            _, thresh = cv2.threshold(self.gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            return thresh
+        return self.get_or_compute('threshold', compute)
+
+    @property
+    def metadata(self):
+        """Basic image metadata, read from the header without decoding pixels"""
+        def compute():
+            with Image.open(io.BytesIO(self.data)) as image:
+                return {
+                    'filename': self.filename,
+                    'size': image.size,
+                    'format': image.format,
+                    'mode': image.mode,
+                    'file_size': len(self.data)
+                }
+        return self.get_or_compute('metadata', compute)
+
+    def _decode(self):
+        """Decode the raw bytes, falling back to PIL for formats OpenCV can't read (e.g. GIF)"""
+        buffer = np.frombuffer(self.data, dtype=np.uint8)
+        image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+        if image is not None:
+            return image
+
+        try:
+            with Image.open(io.BytesIO(self.data)) as pil_image:
+                rgb = np.asarray(pil_image.convert('RGB'))
+            return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+        except Exception as e:
+            raise ValueError(f"Could not read image: {self.filename}") from e
+
+    def jpeg_base64(self, max_size=2048, quality=85):
+        """JPEG-encoded, base64 payload of the image, downscaled to fit max_size"""
+        def compute():
+            img = Image.fromarray(cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB))
+
+            # Resize if too large (OpenAI has size limits)
+            if img.width > max_size or img.height > max_size:
+                img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+
+            img_byte_arr = io.BytesIO()
+            img.save(img_byte_arr, format='JPEG', quality=quality)
+            return base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
+        return self.get_or_compute(f'jpeg_base64:{max_size}:{quality}', compute)
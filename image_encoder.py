@@ -0,0 +1,178 @@
+import base64
+import io
+import math
+import cv2
+import numpy as np
+from PIL import Image
+from config import Config
+from image_context import ImageContext
+from model_catalog import match_model
+
+FORMAT_MIME = {'png': 'image/png', 'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+TILE_SIZE = 512
+# Patch-priced models (gpt-4.1-mini, ...) count 32px patches, capped at 1536, times a per-model multiplier
+PATCH_SIZE = 32
+MAX_PATCHES = 1536
+
+def parse_vision_pricing(spec):
+    """'model=base/tile' or 'model=patch*multiplier' entries -> {model: ('tile', base, tile) or ('patch', multiplier)}"""
+    pricing = {}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        model, _, rates = item.partition('=')
+        try:
+            if rates.strip().startswith('patch*'):
+                pricing[model.strip()] = ('patch', float(rates.strip()[len('patch*'):]))
+            else:
+                base, _, tile = rates.partition('/')
+                pricing[model.strip()] = ('tile', int(base), int(tile))
+        except ValueError:
+            print(f"Ignoring invalid vision pricing entry: {item}")
+    return pricing
+
+MODEL_VISION_PRICING = parse_vision_pricing(Config.VISION_MODEL_PRICING)
+
+def vision_pricing(model=None):
+    """How `model` bills images; models without an entry use VISION_BASE_TOKENS/VISION_TILE_TOKENS"""
+    name = match_model(model, MODEL_VISION_PRICING)
+    if name:
+        return MODEL_VISION_PRICING[name]
+    return 'tile', Config.VISION_BASE_TOKENS, Config.VISION_TILE_TOKENS
+
+def api_scaled_size(width, height):
+    """Size the API works on in high detail: fit in 2048x2048, then shortest side down to 768"""
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def patch_scaled_size(width, height, max_patches=MAX_PATCHES):
+    """Size a patch-priced model works on: shrunk until it covers at most max_patches 32px patches"""
+    if math.ceil(width / PATCH_SIZE) * math.ceil(height / PATCH_SIZE) <= max_patches:
+        return width, height
+    scale = math.sqrt(PATCH_SIZE * PATCH_SIZE * max_patches / (width * height))
+    cols, rows = width * scale / PATCH_SIZE, height * scale / PATCH_SIZE
+    scale *= min(max(1, math.floor(cols)) / cols, max(1, math.floor(rows)) / rows)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def estimate_image_tokens(width, height, detail='high', model=None):
+    """Input tokens an image costs on `model` (vision pricing differs a lot between models)"""
+    pricing = vision_pricing(model)
+    if pricing[0] == 'patch':
+        width, height = patch_scaled_size(width, height)
+        patches = min(MAX_PATCHES, math.ceil(width / PATCH_SIZE) * math.ceil(height / PATCH_SIZE))
+        return math.ceil(patches * pricing[1])
+    _, base_tokens, tile_tokens = pricing
+    if detail == 'low':
+        return base_tokens
+    width, height = api_scaled_size(width, height)
+    tiles = math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+    return base_tokens + tile_tokens * tiles
+
+def fit_to_tiles(width, height, max_tiles):
+    """Largest size (aspect kept, never upscaled) that covers at most max_tiles 512px tiles"""
+    best_scale = 0.0
+    for cols in range(1, max_tiles + 1):
+        rows = max_tiles // cols
+        scale = min(1.0, cols * TILE_SIZE / width, rows * TILE_SIZE / height)
+        best_scale = max(best_scale, scale)
+    return max(1, int(width * best_scale)), max(1, int(height * best_scale))
+
+def content_bbox(bgr, tolerance=12, padding=4):
+    """Bounding box (x, y, w, h) of everything that differs from the border background color"""
+    height, width = bgr.shape[:2]
+    corners = np.array([bgr[0, 0], bgr[0, -1], bgr[-1, 0], bgr[-1, -1]], dtype=np.int16)
+    background = np.median(corners, axis=0)
+    mask = (np.abs(bgr.astype(np.int16) - background).max(axis=2) > tolerance).astype(np.uint8)
+    points = cv2.findNonZero(mask)
+    if points is None:
+        return 0, 0, width, height
+    x, y, w, h = cv2.boundingRect(points)
+    x0, y0 = max(0, x - padding), max(0, y - padding)
+    x1, y1 = min(width, x + w + padding), min(height, y + h + padding)
+    return x0, y0, x1 - x0, y1 - y0
+
+class VisionImageEncoder:
+    """Pick crop, resolution, format and detail level to fit a per-image token budget"""
+
+    def __init__(self, token_budget=None, detail=None, formats=None, crop_margins=None, model=None):
+        # The budget is in the image tokens of `model`; other models get their own estimate per call
+        self.model = model or Config.OPENAI_MODEL
+        self.token_budget = token_budget or Config.VISION_TOKEN_BUDGET
+        self.detail = detail or Config.VISION_DETAIL
+        self.formats = formats or Config.VISION_IMAGE_FORMATS
+        self.crop_margins = Config.VISION_CROP_MARGINS if crop_margins is None else crop_margins
+        self.quality = Config.VISION_LOSSY_QUALITY
+        self.lossless_slack = Config.VISION_LOSSLESS_SLACK
+
+    def encode(self, image):
+        """Encoded payload dict for an image (path, bytes or ImageContext), memoized on the context"""
+        context = ImageContext.ensure(image)
+        key = f"vision:{self.model}:{self.token_budget}:{self.detail}:{','.join(self.formats)}:{self.crop_margins}"
+        return context.get_or_compute(key, lambda: self._encode(context))
+
+    def _encode(self, context):
+        bgr = context.bgr
+        original_height, original_width = bgr.shape[:2]
+
+        crop = None
+        if self.crop_margins:
+            x, y, w, h = content_bbox(bgr)
+            # Only trim real margins; never crop away most of the image
+            if (w, h) != (original_width, original_height) and w * h >= 0.2 * original_width * original_height:
+                bgr = bgr[y:y + h, x:x + w]
+                crop = [x, y, w, h]
+
+        height, width = bgr.shape[:2]
+        detail, size = self._choose_size(width, height)
+        if size != (width, height):
+            bgr = cv2.resize(bgr, size, interpolation=cv2.INTER_AREA)
+
+        image_format, data = self._choose_format(Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)))
+        return {
+            'base64': base64.b64encode(data).decode('utf-8'),
+            'mime_type': FORMAT_MIME[image_format],
+            'format': image_format,
+            'detail': detail,
+            'width': size[0],
+            'height': size[1],
+            'crop': crop,
+            'bytes': len(data),
+            'estimated_tokens': estimate_image_tokens(size[0], size[1], detail, self.model)
+        }
+
+    def _choose_size(self, width, height):
+        """Detail level and pixel size for the budget; anything above what the API keeps is wasted"""
+        pricing = vision_pricing(self.model)
+        if pricing[0] == 'patch':
+            # No detail levels to trade; cap the patch count instead
+            max_patches = max(1, min(MAX_PATCHES, int(self.token_budget / pricing[1])))
+            return 'high', patch_scaled_size(width, height, max_patches)
+        _, base_tokens, tile_tokens = pricing
+        if self.detail == 'low' or (self.detail == 'auto' and self.token_budget < base_tokens + tile_tokens):
+            # Low detail is a fixed-cost 512x512 view
+            scale = min(1.0, TILE_SIZE / max(width, height))
+            return 'low', (max(1, int(width * scale)), max(1, int(height * scale)))
+
+        scaled = api_scaled_size(width, height)
+        max_tiles = max(1, (self.token_budget - base_tokens) // tile_tokens)
+        return 'high', fit_to_tiles(scaled[0], scaled[1], max_tiles)
+
+    def _choose_format(self, img):
+        """Smallest encoding, keeping lossless PNG when it costs little more (text stays crisp)"""
+        encoded = {}
+        for image_format in self.formats:
+            buffer = io.BytesIO()
+            if image_format == 'png':
+                img.save(buffer, format='PNG', optimize=True)
+            elif image_format == 'webp':
+                img.save(buffer, format='WEBP', quality=self.quality, method=4)
+            else:
+                img.save(buffer, format='JPEG', quality=self.quality, optimize=True)
+            encoded[image_format] = buffer.getvalue()
+
+        smallest = min(encoded, key=lambda name: len(encoded[name]))
+        if 'png' in encoded and len(encoded['png']) <= len(encoded[smallest]) * self.lossless_slack:
+            return 'png', encoded['png']
+        return smallest, encoded[smallest]
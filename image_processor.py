@@ -1,175 +1,219 @@
 import cv2
 import numpy as np
 import pytesseract
-from PIL import Image
-import re
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from config import Config
+from metric_extractor import MetricExtractor
+from ocr_engine import get_ocr_engine
+from image_context import ImageContext
+from panel_segmenter import PanelSegmenter
+
+def mean_confidence(confidences):
+    """Mean Tesseract word confidence (0-100), or None when no words were recognized"""
+    return sum(confidences) / len(confidences) if confidences else None
 
 class ImageProcessor:
     """Process uploaded images and extract metrics using OCR"""
     
-    def __init__(self):
+    def __init__(self, word_confidences=False, panel_workers=None):
+        self.metric_extractor = MetricExtractor()
+        # Hybrid routing needs Tesseract's per-word confidences alongside the text
+        self.word_confidences = word_confidences
+        self.panel_segmenter = PanelSegmenter() if Config.PANEL_SEGMENTATION else None
+        self.panel_workers = max(1, panel_workers or Config.PANEL_OCR_WORKERS)
+        self._panel_pool = None
+        self._panel_pool_lock = threading.Lock()
+        
         # Set Tesseract path for Windows
         if os.path.exists(Config.TESSERACT_PATH):
             pytesseract.pytesseract.tesseract_cmd = Config.TESSERACT_PATH
         else:
             print(f"Warning: Tesseract not found at {Config.TESSERACT_PATH}")
     
-    def preprocess_image(self, image_path):
+    def preprocess_image(self, image):
         """Preprocess image for better OCR results"""
         try:
-            # Read image
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError(f"Could not read image: {image_path}")
-            
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Apply threshold to make text more visible
-            _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            
-            # Denoise
-            denoised = cv2.medianBlur(thresh, 5)
-            
-            # Resize for better OCR (if image is too small)
-            height, width = denoised.shape
-            if height < 500 or width < 500:
-                scale_factor = max(500/height, 500/width)
-                new_width = int(width * scale_factor)
-                new_height = int(height * scale_factor)
-                denoised = cv2.resize(denoised, (new_width, new_height), interpolation=cv2.INTER_CUBIC)
-            
-            return denoised
+            context = ImageContext.ensure(image)
+            return context.get_or_compute('preprocessed', lambda: self._preprocess(context))
         except Exception as e:
             print(f"Error preprocessing image: {e}")
             return None
     
-    def extract_text_from_image(self, image_path):
+    def _preprocess(self, context):
+        """Denoise and upscale the context's thresholded image"""
+        # Grayscale + Otsu threshold come memoized from the context
+        return self._prepare_for_ocr(context.threshold)
+    
+    def _prepare_for_ocr(self, thresh):
+        """Denoise and upscale a thresholded image (or panel crop) for Tesseract"""
+        # Denoise
+        denoised = cv2.medianBlur(thresh, 5)
+        
+        # Resize for better OCR (if image is too small)
+        height, width = denoised.shape
+        if height < 500 or width < 500:
+            scale_factor = max(500/height, 500/width)
+            new_width = int(width * scale_factor)
+            new_height = int(height * scale_factor)
+            denoised = cv2.resize(denoised, (new_width, new_height), interpolation=cv2.INTER_CUBIC)
+        
+        return denoised
+    
+    def extract_text_from_image(self, image):
         """Extract text from image using OCR"""
         try:
-            # Preprocess image
-            processed_image = self.preprocess_image(image_path)
-            if processed_image is None:
-                return ""
-            
-            # Convert to PIL Image
-            pil_image = Image.fromarray(processed_image)
-            
-            # Extract text using Tesseract
-            text = pytesseract.image_to_string(pil_image, config='--psm 6')
-            
-            return text.strip()
+            context = ImageContext.ensure(image)
+            return context.get_or_compute('ocr_text', lambda: self._run_ocr(context))
         except Exception as e:
             print(f"Error extracting text from image: {e}")
             return ""
     
+    def _run_ocr(self, context):
+        """OCR the preprocessed image of a context"""
+        # On multi-panel dashboards OCR each panel separately and in parallel
+        panels = self.ocr_panels(context)
+        if panels:
+            if self.word_confidences:
+                context.get_or_compute('ocr_confidences', lambda: [
+                    conf for panel in panels for conf in panel.get('word_confidences', [])
+                ])
+            return '\n'.join(panel['text'] for panel in panels if panel['text'])
+        
+        processed_image = self.preprocess_image(context)
+        if processed_image is None:
+            return ""
+        
+        # Extract text with this thread's long-lived Tesseract engine
+        if self.word_confidences:
+            text, confidences = get_ocr_engine().image_to_text_and_confidences(processed_image, psm=6)
+            context.get_or_compute('ocr_confidences', lambda: confidences)
+        else:
+            text = get_ocr_engine().image_to_string(processed_image, psm=6)
+        
+        return text.strip()
+    
+    def _get_panel_pool(self):
+        """Thread pool for per-panel OCR; Tesseract releases the GIL while recognizing"""
+        with self._panel_pool_lock:
+            if self._panel_pool is None:
+                self._panel_pool = ThreadPoolExecutor(
+                    max_workers=self.panel_workers,
+                    thread_name_prefix='panel-ocr'
+                )
+            return self._panel_pool
+    
+    def _ocr_panel(self, thresh, box):
+        """OCR one panel crop with a page segmentation mode suited to its shape"""
+        x, y, w, h = box
+        psm = PanelSegmenter.choose_psm(box)
+        confidences = []
+        try:
+            crop = self._prepare_for_ocr(thresh[y:y + h, x:x + w])
+            if self.word_confidences:
+                text, confidences = get_ocr_engine().image_to_text_and_confidences(crop, psm=psm)
+                text = text.strip()
+            else:
+                text = get_ocr_engine().image_to_string(crop, psm=psm).strip()
+        except Exception as e:
+            print(f"Error extracting text from panel {box}: {e}")
+            text = ""
+        panel = {'bbox': [x, y, w, h], 'psm': psm, 'text': text}
+        if self.word_confidences:
+            panel['word_confidences'] = confidences
+        return panel
+    
+    def ocr_panels(self, image):
+        """Segment a dashboard into panels and OCR them in parallel (empty if not segmentable)"""
+        if self.panel_segmenter is None:
+            return []
+        
+        context = ImageContext.ensure(image)
+        
+        def compute():
+            try:
+                boxes = self.panel_segmenter.find_panels(context)
+            except Exception as e:
+                print(f"Error segmenting panels: {e}")
+                return []
+            # A single region is just the whole-image path with extra overhead
+            if len(boxes) < 2:
+                return []
+            thresh = context.threshold
+            if self.panel_workers == 1:
+                # Already one of several OCR processes; more threads would only oversubscribe the cores
+                return [self._ocr_panel(thresh, box) for box in boxes]
+            return list(self._get_panel_pool().map(lambda box: self._ocr_panel(thresh, box), boxes))
+        
+        return context.get_or_compute('panels', compute)
+    
     def extract_metrics_from_text(self, text):
         """Extract metrics and values from OCR text"""
-        metrics = {}
-        
         try:
-            # Common patterns for metrics
-            patterns = {
-                'numbers': r'(\d+(?:\.\d+)?)\s*([%kmgtKMGT]?[Bb]?/?[sS]?)',
-                'percentages': r'(\d+(?:\.\d+)?)\s*%',
-                'time_values': r'(\d+(?:\.\d+)?)\s*(ms|s|m|h|d)',
-                'memory_values': r'(\d+(?:\.\d+)?)\s*(B|KB|MB|GB|TB)',
-                'network_values': r'(\d+(?:\.\d+)?)\s*(bps|Kbps|Mbps|Gbps)',
-                'status_indicators': r'(UP|DOWN|OK|ERROR|CRITICAL|WARNING|HEALTHY|UNHEALTHY)',
-                'timestamps': r'(\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}|\d{2}:\d{2}:\d{2})',
-                'labels': r'([A-Za-z_][A-Za-z0-9_]*)\s*[:=]\s*([^\n\r]+)'
-            }
-            
-            lines = text.split('\n')
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Extract different types of metrics
-                for pattern_name, pattern in patterns.items():
-                    matches = re.findall(pattern, line, re.IGNORECASE)
-                    if matches:
-                        if pattern_name not in metrics:
-                            metrics[pattern_name] = []
-                        metrics[pattern_name].extend(matches)
-            
-            # Extract dashboard title (usually at the top)
-            first_lines = text.split('\n')[:3]
-            dashboard_title = ""
-            for line in first_lines:
-                if line.strip() and len(line.strip()) > 5:
-                    dashboard_title = line.strip()
-                    break
-            
-            if dashboard_title:
-                metrics['dashboard_title'] = dashboard_title
-            
-            # Extract panel titles (lines that look like headers)
-            panel_titles = []
-            for line in lines:
-                line = line.strip()
-                if line and len(line) > 3 and len(line) < 50:
-                    if not any(char.isdigit() for char in line):
-                        panel_titles.append(line)
-            
-            if panel_titles:
-                metrics['panel_titles'] = panel_titles
-            
-            return metrics
+            return self.metric_extractor.extract(text)
         except Exception as e:
             print(f"Error extracting metrics: {e}")
             return {}
     
-    def process_image(self, image_path):
+    def process_image(self, image):
         """Main method to process image and extract all information"""
         try:
+            # Decode once; every stage below shares the same context
+            context = ImageContext.ensure(image)
+            
             # Extract text from image
-            text = self.extract_text_from_image(image_path)
+            text = self.extract_text_from_image(context)
             
             # Extract metrics from text
             metrics = self.extract_metrics_from_text(text)
             
             # Get image metadata
-            image_info = self.get_image_info(image_path)
+            image_info = self.get_image_info(context)
             
             # Combine all information
             result = {
-                'image_path': image_path,
+                'image_path': context.path or context.filename,
                 'processed_at': datetime.now().isoformat(),
                 'raw_text': text,
                 'metrics': metrics,
                 'image_info': image_info
             }
             
+            if self.word_confidences:
+                result['word_confidence'] = mean_confidence(context.get_or_compute('ocr_confidences', list))
+            
+            # Attribute metrics to the panel they were read from
+            panels = self.ocr_panels(context)
+            if panels:
+                result['panels'] = []
+                for panel in panels:
+                    panel = dict(panel, metrics=self.extract_metrics_from_text(panel['text']))
+                    if self.word_confidences:
+                        panel['word_confidence'] = mean_confidence(panel.pop('word_confidences'))
+                    result['panels'].append(panel)
+            
             return result
         except Exception as e:
             print(f"Error processing image: {e}")
             return None
     
-    def get_image_info(self, image_path):
+    def get_image_info(self, image):
         """Get basic image information"""
         try:
-            image = Image.open(image_path)
-            return {
-                'filename': os.path.basename(image_path),
-                'size': image.size,
-                'format': image.format,
-                'mode': image.mode,
-                'file_size': os.path.getsize(image_path)
-            }
+            return dict(ImageContext.ensure(image).metadata)
         except Exception as e:
             print(f"Error getting image info: {e}")
             return {}
     
-    def detect_chart_type(self, image_path):
+    def detect_chart_type(self, image, text=None):
         """Attempt to detect the type of chart/graph in the image"""
         try:
             # This is a basic implementation - could be enhanced with ML
-            text = self.extract_text_from_image(image_path)
+            # OCR text is memoized on the context, so this doesn't re-run Tesseract
+            if text is None:
+                text = self.extract_text_from_image(ImageContext.ensure(image))
             text_lower = text.lower()
             
             chart_types = {
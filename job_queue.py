@@ -0,0 +1,234 @@
+import json
+import threading
+import uuid
+from datetime import datetime
+from config import Config
+from storage import connect_database, prepare_database
+
+class JobQueue:
+    """Persistent background job queue backed by SQLite"""
+
+    def __init__(self, handler, db_path=None, workers=None, poll_interval=None, recover=None, on_finish=None):
+        self.handler = handler
+        # recover(payload) -> reason a job left by a previous process can't run, or None to run it
+        self.recover = recover
+        # on_finish(job_id, status) runs after a job's final status is stored
+        self.on_finish = on_finish
+        self.db_path = db_path or Config.JOB_DB_PATH
+        self.workers = max(1, workers or Config.JOB_WORKERS)
+        self.poll_interval = poll_interval or Config.JOB_POLL_INTERVAL
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+
+        prepare_database(self.db_path)
+        self._init_db()
+
+    def _init_db(self):
+        """Create the job tables if they do not exist"""
+        conn = connect_database(self.db_path)
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_images (
+                    job_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    filename TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    PRIMARY KEY (job_id, idx)
+                )
+            """)
+        finally:
+            conn.close()
+
+    def enqueue(self, payload, image_names):
+        """Persist a new job and wake a worker; returns the job ID"""
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+
+        conn = connect_database(self.db_path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, total, created_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(payload), len(image_names), now)
+            )
+            conn.executemany(
+                "INSERT INTO job_images (job_id, idx, filename, status) VALUES (?, ?, ?, 'pending')",
+                [(job_id, index, name) for index, name in enumerate(image_names)]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        self._wakeup.set()
+        return job_id
+
+    def get_job(self, job_id):
+        """Get job status, per-image progress and result"""
+        conn = connect_database(self.db_path)
+        try:
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            images = conn.execute(
+                "SELECT idx, filename, status FROM job_images WHERE job_id = ? ORDER BY idx",
+                (job_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        result = json.loads(job['result']) if job['result'] else None
+        return {
+            'job_id': job['id'],
+            'status': job['status'],
+            'total': job['total'],
+            'completed': sum(1 for image in images if image['status'] == 'done'),
+            'failed': sum(1 for image in images if image['status'] == 'failed'),
+            'images': [
+                {'index': image['idx'], 'filename': image['filename'], 'status': image['status']}
+                for image in images
+            ],
+            'result': result,
+            'report_file': result.get('report_file') if result else None,
+            'error': job['error'],
+            'created_at': job['created_at'],
+            'started_at': job['started_at'],
+            'finished_at': job['finished_at']
+        }
+
+    def update_image_status(self, job_id, index, status):
+        """Record the outcome of one image in a job"""
+        conn = connect_database(self.db_path)
+        try:
+            conn.execute(
+                "UPDATE job_images SET status = ? WHERE job_id = ? AND idx = ?",
+                (status, job_id, index)
+            )
+        finally:
+            conn.close()
+
+    def _finish(self, job_id, status, result=None, error=None):
+        """Mark a job as completed or failed"""
+        conn = connect_database(self.db_path)
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error,
+                 datetime.now().isoformat(), job_id)
+            )
+        finally:
+            conn.close()
+
+    def _claim_next(self):
+        """Atomically move the oldest queued job to running"""
+        conn = connect_database(self.db_path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, payload FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None, None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                (datetime.now().isoformat(), row['id'])
+            )
+            conn.execute("COMMIT")
+            return row['id'], json.loads(row['payload'])
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _requeue_interrupted(self):
+        """Put jobs left running by a previous process back on the queue"""
+        conn = connect_database(self.db_path)
+        try:
+            cursor = conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+            if cursor.rowcount:
+                print(f"Re-queued {cursor.rowcount} interrupted job(s)")
+            leftover = conn.execute("SELECT id, payload FROM jobs WHERE status = 'queued'").fetchall() if self.recover else []
+        finally:
+            conn.close()
+
+        # Queued jobs may depend on state the previous process held (e.g. in-memory uploads)
+        for row in leftover:
+            try:
+                reason = self.recover(json.loads(row['payload']))
+            except Exception as e:
+                reason = f"Could not recover job: {e}"
+            if reason:
+                print(f"Failing job {row['id']}: {reason}")
+                self._finish(row['id'], 'failed', error=reason)
+
+    def _run_job(self, job_id, payload):
+        """Run the handler for one job and store its outcome"""
+        def progress(index, succeeded):
+            self.update_image_status(job_id, index, 'done' if succeeded else 'failed')
+
+        try:
+            result = self.handler(payload, progress, job_id)
+            self._finish(job_id, 'completed', result=result)
+            status = 'completed'
+        except Exception as e:
+            print(f"Error running job {job_id}: {e}")
+            self._finish(job_id, 'failed', error=str(e))
+            status = 'failed'
+
+        if self.on_finish:
+            try:
+                self.on_finish(job_id, status)
+            except Exception as e:
+                print(f"Error notifying finish of job {job_id}: {e}")
+
+    def _worker_loop(self):
+        """Drain queued jobs, sleeping until woken or the poll interval elapses"""
+        while not self._stopping.is_set():
+            try:
+                job_id, payload = self._claim_next()
+            except Exception as e:
+                print(f"Error claiming job: {e}")
+                job_id = None
+
+            if job_id is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._run_job(job_id, payload)
+
+    def start(self):
+        """Start the worker threads; safe to call more than once"""
+        with self._start_lock:
+            if self._threads:
+                return
+            self._requeue_interrupted()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        """Signal the worker threads to exit after their current job"""
+        self._stopping.set()
+        self._wakeup.set()
@@ -1,45 +1,94 @@
-import pandas as pd
-import csv
 import json
 from datetime import datetime
 import os
 from config import Config
+from report_catalog import ReportCatalog, ReportSummary
+from datasource_query import json_default
+from tabular_writer import StreamingCSVWriter
+from columnar_writer import (StreamingColumnarWriter, COLUMNAR_FORMATS, llm_report_schema,
+                             to_float, to_int, to_timestamp)
+
+# Fixed CSV schema; columns a row has no value for are left empty
+LLM_CSV_COLUMNS = [
+    'analyzed_at', 'model_used', 'image_file', 'dashboard_title', 'time_range',
+    'panel_count', 'dashboard_theme', 'health_status', 'cpu_usage', 'memory_usage',
+    'disk_usage', 'network_in', 'network_out', 'other_metrics', 'total_panels', 'panels_with_alerts',
+    'panel_types', 'key_values', 'alert_count', 'has_alerts', 'insights_count',
+    'key_insights', 'analysis_error', 'custom_prompt_used', 'custom_prompt'
+]
 
 class LLMReportGenerator:
     """Generate reports from OpenAI LLM analysis of Grafana dashboards"""
     
-    def __init__(self):
+    def __init__(self, catalog=None):
         self.output_folder = Config.OUTPUT_FOLDER
         os.makedirs(self.output_folder, exist_ok=True)
+        self.catalog = catalog or ReportCatalog()
+    
+    @staticmethod
+    def _describe(analysis_data):
+        """Dashboard title and health status of one analysis, for the report catalog"""
+        title = analysis_data.get('dashboard_overview', {}).get('title')
+        health_status = analysis_data.get('health_status')
+        return title, [health_status] if health_status else []
+    
+    def _record(self, filepath, analysis_data_list=None, summary=None):
+        """Index a finished report in the catalog"""
+        if summary is None and analysis_data_list is not None:
+            summary = ReportSummary.from_records(analysis_data_list, self._describe)
+        self.catalog.record(filepath, summary=summary)
+    
+    def open_llm_csv_stream(self, filename=None):
+        """Open an LLM CSV report that rows can be appended to as analyses finish"""
+        if filename is None:
+            timestamp = datetime.now().strftime(Config.REPORT_TIMESTAMP_FORMAT)
+            filename = f"llm_grafana_report_{timestamp}.csv"
+        
+        filepath = os.path.join(self.output_folder, filename)
+        summary = ReportSummary()
+        return StreamingCSVWriter(filepath, LLM_CSV_COLUMNS, row_builder=summary.track(self._extract_llm_row_data, self._describe),
+                                  on_close=lambda writer: self._record(writer.filepath, summary=summary))
     
     def generate_llm_csv_report(self, analysis_data_list, filename=None):
         """Generate CSV report from LLM analysis data"""
         try:
-            if filename is None:
-                timestamp = datetime.now().strftime(Config.REPORT_TIMESTAMP_FORMAT)
-                filename = f"llm_grafana_report_{timestamp}.csv"
-            
-            filepath = os.path.join(self.output_folder, filename)
-            
-            # Prepare data for CSV
-            rows = []
-            
-            if not isinstance(analysis_data_list, list):
+            if isinstance(analysis_data_list, dict):
                 analysis_data_list = [analysis_data_list]
             
-            for analysis_data in analysis_data_list:
-                row = self._extract_llm_row_data(analysis_data)
-                rows.append(row)
+            # Rows are written one at a time, so any iterable of analyses works
+            with self.open_llm_csv_stream(filename) as writer:
+                for analysis_data in analysis_data_list:
+                    writer.write(analysis_data)
             
-            # Create DataFrame
-            df = pd.DataFrame(rows)
+            return writer.filepath
+        except Exception as e:
+            print(f"Error generating LLM CSV report: {e}")
+            return None
+    
+    def open_llm_columnar_stream(self, output_format='parquet', filename=None):
+        """Open a Parquet or Arrow LLM report that rows can be appended to in batches"""
+        if filename is None:
+            timestamp = datetime.now().strftime(Config.REPORT_TIMESTAMP_FORMAT)
+            filename = f"llm_grafana_report_{timestamp}{COLUMNAR_FORMATS[output_format]}"
+        
+        filepath = os.path.join(self.output_folder, filename)
+        summary = ReportSummary()
+        return StreamingColumnarWriter(filepath, llm_report_schema(), summary.track(self._extract_llm_columnar_row, self._describe),
+                                       output_format, on_close=lambda writer: self._record(writer.filepath, summary=summary))
+    
+    def generate_llm_columnar_report(self, analysis_data_list, output_format='parquet', filename=None):
+        """Generate Parquet or Arrow report from LLM analysis data"""
+        try:
+            if isinstance(analysis_data_list, dict):
+                analysis_data_list = [analysis_data_list]
             
-            # Write to CSV
-            df.to_csv(filepath, index=False)
+            with self.open_llm_columnar_stream(output_format, filename) as writer:
+                for analysis_data in analysis_data_list:
+                    writer.write(analysis_data)
             
-            return filepath
+            return writer.filepath
         except Exception as e:
-            print(f"Error generating LLM CSV report: {e}")
+            print(f"Error generating LLM {output_format} report: {e}")
             return None
     
     def generate_llm_txt_report(self, analysis_data_list, filename=None):
@@ -67,6 +116,7 @@ class LLMReportGenerator:
                     self._write_llm_analysis_to_txt(f, analysis_data)
                     f.write("\n" + "="*70 + "\n\n")
             
+            self._record(filepath, analysis_data_list)
             return filepath
         except Exception as e:
             print(f"Error generating LLM TXT report: {e}")
@@ -92,8 +142,10 @@ class LLMReportGenerator:
             }
             
             with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(report_data, f, indent=2, ensure_ascii=False)
+                # Datasource-query analyses carry their raw series as NumPy arrays
+                json.dump(report_data, f, indent=2, ensure_ascii=False, default=json_default)
             
+            self._record(filepath, analysis_data_list)
             return filepath
         except Exception as e:
             print(f"Error generating LLM JSON report: {e}")
@@ -128,6 +180,12 @@ class LLMReportGenerator:
             row['network_in'] = metrics.get('network_in', '')
             row['network_out'] = metrics.get('network_out', '')
         
+        # Metrics beyond the typed ones, as "name: value unit" pairs
+        other_metrics = [m for m in analysis_data.get('other_metrics') or [] if isinstance(m, dict)]
+        row['other_metrics'] = '; '.join(
+            f"{m.get('name', '')}: {m.get('value')} {m.get('unit', '')}".rstrip() for m in other_metrics
+        )
+        
         # Panels summary
         panels = analysis_data.get('panels', [])
         if panels:
@@ -169,6 +227,50 @@ class LLMReportGenerator:
         
         return row
     
+    def _extract_llm_columnar_row(self, analysis_data):
+        """Extract a typed row (panels kept as a nested list) for Parquet/Arrow"""
+        overview = analysis_data.get('dashboard_overview', {})
+        metrics = analysis_data.get('metrics', {})
+        
+        panels = [
+            {
+                'title': panel.get('title'),
+                'type': panel.get('type'),
+                'current_value': to_float(panel.get('current_value')),
+                'unit': panel.get('unit'),
+                'status': panel.get('status'),
+                'threshold': to_float(panel.get('threshold'))
+            }
+            for panel in analysis_data.get('panels', [])
+            if isinstance(panel, dict)
+        ]
+        
+        return {
+            'analyzed_at': to_timestamp(analysis_data.get('processed_at')) or datetime.now(),
+            'model_used': analysis_data.get('model_used', Config.OPENAI_MODEL),
+            'image_file': analysis_data.get('image_info', {}).get('filename', ''),
+            'dashboard_title': overview.get('title', ''),
+            'time_range': overview.get('time_range', ''),
+            'panel_count': to_int(overview.get('panel_count')),
+            'dashboard_theme': overview.get('theme', ''),
+            'health_status': analysis_data.get('health_status', 'UNKNOWN'),
+            'cpu_usage': to_float(metrics.get('cpu_usage')),
+            'memory_usage': to_float(metrics.get('memory_usage')),
+            'disk_usage': to_float(metrics.get('disk_usage')),
+            'network_in': to_float(metrics.get('network_in')),
+            'network_out': to_float(metrics.get('network_out')),
+            'other_metrics': [
+                {'name': m.get('name'), 'value': to_float(m.get('value')), 'unit': m.get('unit')}
+                for m in analysis_data.get('other_metrics') or []
+                if isinstance(m, dict)
+            ],
+            'panels': panels,
+            'alerts': [alert if isinstance(alert, str) else json.dumps(alert) for alert in analysis_data.get('alerts', [])],
+            'insights': [str(insight) for insight in analysis_data.get('insights', [])],
+            'analysis_error': analysis_data.get('error'),
+            'custom_prompt': analysis_data.get('custom_prompt')
+        }
+    
     def _write_llm_analysis_to_txt(self, file, analysis_data):
         """Write LLM analysis to text file"""
         try:
@@ -304,6 +406,7 @@ class LLMReportGenerator:
                 f.write("• Regular monitoring recommended for all systems\n")
                 f.write("• Consider setting up automated alerting for critical metrics\n")
             
+            self._record(filepath, analysis_data_list)
             return filepath
         except Exception as e:
             print(f"Error generating comparative report: {e}")
@@ -0,0 +1,80 @@
+import re
+
+# Metric patterns, compiled once at import. Order matters: it decides the key
+# order of the returned metrics dict, which callers and reports rely on.
+METRIC_PATTERNS = [
+    ('numbers', re.compile(r'(\d+(?:\.\d+)?)\s*([%kmgtKMGT]?[Bb]?/?[sS]?)', re.IGNORECASE)),
+    ('percentages', re.compile(r'(\d+(?:\.\d+)?)\s*%', re.IGNORECASE)),
+    ('time_values', re.compile(r'(\d+(?:\.\d+)?)\s*(ms|s|m|h|d)', re.IGNORECASE)),
+    ('memory_values', re.compile(r'(\d+(?:\.\d+)?)\s*(B|KB|MB|GB|TB)', re.IGNORECASE)),
+    ('network_values', re.compile(r'(\d+(?:\.\d+)?)\s*(bps|Kbps|Mbps|Gbps)', re.IGNORECASE)),
+    ('status_indicators', re.compile(r'(UP|DOWN|OK|ERROR|CRITICAL|WARNING|HEALTHY|UNHEALTHY)', re.IGNORECASE)),
+    ('timestamps', re.compile(r'(\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}|\d{2}:\d{2}:\d{2})', re.IGNORECASE)),
+    ('labels', re.compile(r'([A-Za-z_][A-Za-z0-9_]*)\s*[:=]\s*([^\n\r]+)', re.IGNORECASE)),
+]
+
+_DIGIT = re.compile(r'\d')
+
+# Patterns that need a digit somewhere in the line to match at all
+_NUMERIC_PATTERNS = {'numbers', 'percentages', 'time_values', 'memory_values', 'network_values', 'timestamps'}
+
+# Substrings a line must contain (after casefold) for a pattern to be worth running
+_REQUIRED_SUBSTRINGS = {
+    'percentages': ('%',),
+    'memory_values': ('b',),
+    'network_values': ('bps',),
+    'labels': (':', '='),
+}
+
+class MetricExtractor:
+    """Extract metrics, dashboard title and panel titles from OCR text in one pass"""
+
+    def __init__(self):
+        # (name, pattern, needs_digit, required substrings) in output order
+        self._plan = [
+            (name, pattern, name in _NUMERIC_PATTERNS, _REQUIRED_SUBSTRINGS.get(name))
+            for name, pattern in METRIC_PATTERNS
+        ]
+
+    def extract(self, text):
+        """Extract metrics from OCR text"""
+        metrics = {}
+        dashboard_title = ""
+        panel_titles = []
+
+        for line_number, raw_line in enumerate(text.split('\n')):
+            line = raw_line.strip()
+            if not line:
+                continue
+
+            # Dashboard title: first substantial line among the first three
+            if not dashboard_title and line_number < 3 and len(line) > 5:
+                dashboard_title = line
+
+            has_digit = _DIGIT.search(line) is not None
+            # casefold() so the pre-checks agree with re.IGNORECASE (e.g. long s)
+            folded_line = line.casefold()
+
+            for name, pattern, needs_digit, required in self._plan:
+                # Cheap pre-checks that rule out patterns which cannot match this line
+                if needs_digit and not has_digit:
+                    continue
+                if required and not any(token in folded_line for token in required):
+                    continue
+                matches = pattern.findall(line)
+                if matches:
+                    if name not in metrics:
+                        metrics[name] = []
+                    metrics[name].extend(matches)
+
+            # Panel titles: short lines without any digits look like headers
+            if not has_digit and 3 < len(line) < 50 and not any(char.isdigit() for char in line):
+                panel_titles.append(line)
+
+        if dashboard_title:
+            metrics['dashboard_title'] = dashboard_title
+
+        if panel_titles:
+            metrics['panel_titles'] = panel_titles
+
+        return metrics
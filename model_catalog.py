@@ -0,0 +1,16 @@
+import re
+
+# Dated snapshots ('gpt-4o-2024-08-06') share their base model's pricing and limits
+SNAPSHOT_SUFFIX = re.compile(r'-\d{4}-\d{2}-\d{2}$')
+
+def base_model(model):
+    """Model name without a dated snapshot suffix"""
+    return SNAPSHOT_SUFFIX.sub('', model)
+
+def match_model(model, names):
+    """Configured name `model` is, or is a dated snapshot of; None when nothing matches"""
+    if not model:
+        return None
+    if model in names:
+        return model
+    return base_model(model) if base_model(model) in names else None
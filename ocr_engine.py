@@ -0,0 +1,107 @@
+import threading
+import pytesseract
+from PIL import Image
+from config import Config
+
+# tesserocr binds the Tesseract C++ API directly; it needs a compiled wheel, so
+# fall back to pytesseract (one tesseract process per call) when it is missing.
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+_fallback_warned = False
+_fallback_lock = threading.Lock()
+
+def _warn_fallback(reason):
+    """Say once per process that OCR is on the slow subprocess path"""
+    global _fallback_warned
+    with _fallback_lock:
+        if _fallback_warned:
+            return
+        _fallback_warned = True
+    print(f"Warning: {reason}; OCR falls back to pytesseract, which spawns a tesseract process per image "
+          f"and panel. Install tesserocr (see README) for in-process OCR, or set OCR_ENGINE=pytesseract "
+          f"to silence this warning.")
+
+class OCREngine:
+    """Long-lived Tesseract engine that reads in-memory image buffers"""
+
+    def __init__(self, language=None, tessdata_path=None, backend=None):
+        self.language = language or Config.OCR_LANGUAGE
+        self.tessdata_path = tessdata_path or Config.TESSDATA_PATH
+        self.backend = backend or Config.OCR_ENGINE
+        self._api = None
+
+        if self.backend in ('auto', 'tesserocr'):
+            if tesserocr is not None:
+                try:
+                    kwargs = {'lang': self.language}
+                    if self.tessdata_path:
+                        kwargs['path'] = self.tessdata_path
+                    self._api = tesserocr.PyTessBaseAPI(**kwargs)
+                except Exception as e:
+                    _warn_fallback(f"could not start the tesserocr engine ({e})")
+            else:
+                _warn_fallback("tesserocr is not installed")
+
+    @property
+    def is_persistent(self):
+        """Whether OCR runs in-process rather than spawning tesseract per call"""
+        return self._api is not None
+
+    def image_to_string(self, image, psm=6):
+        """OCR a grayscale numpy array or PIL image with the given page segmentation mode"""
+        if self._api is None:
+            pil_image = image if isinstance(image, Image.Image) else Image.fromarray(image)
+            return pytesseract.image_to_string(pil_image, config=f'--psm {psm}', lang=self.language)
+
+        self._api.SetPageSegMode(psm)
+        if isinstance(image, Image.Image):
+            self._api.SetImage(image)
+        else:
+            # Hand the raw pixel buffer straight to Tesseract, no PIL or temp file round-trip
+            height, width = image.shape[:2]
+            channels = 1 if image.ndim == 2 else image.shape[2]
+            self._api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+        return self._api.GetUTF8Text()
+
+    def image_to_text_and_confidences(self, image, psm=6):
+        """OCR an image, returning its text and the per-word confidences (0-100)"""
+        if self._api is not None:
+            text = self.image_to_string(image, psm=psm)
+            # tesserocr keeps the last recognition, so confidences cost nothing extra
+            return text, [float(conf) for conf in self._api.AllWordConfidences()]
+
+        # One tesseract run: rebuild the text from the word data instead of running image_to_string too
+        pil_image = image if isinstance(image, Image.Image) else Image.fromarray(image)
+        data = pytesseract.image_to_data(pil_image, config=f'--psm {psm}', lang=self.language,
+                                         output_type=pytesseract.Output.DICT)
+        lines, confidences = {}, []
+        for index, word in enumerate(data['text']):
+            if not word.strip():
+                continue
+            key = (data['block_num'][index], data['par_num'][index], data['line_num'][index])
+            lines.setdefault(key, []).append(word)
+            if float(data['conf'][index]) >= 0:
+                confidences.append(float(data['conf'][index]))
+        text = '\n'.join(' '.join(words) for _, words in sorted(lines.items()))
+        return text, confidences
+
+    def close(self):
+        """Release the underlying Tesseract instance"""
+        if self._api is not None:
+            self._api.End()
+            self._api = None
+
+# Tesseract instances are not thread-safe, so each thread (and therefore each
+# single-threaded pool worker process) gets its own engine.
+_local = threading.local()
+
+def get_ocr_engine():
+    """Get the OCR engine for the current thread, creating it on first use"""
+    engine = getattr(_local, 'engine', None)
+    if engine is None:
+        engine = OCREngine()
+        _local.engine = engine
+    return engine
@@ -1,26 +1,69 @@
 import openai
-import base64
 import json
-import os
+import random
+import time
 from datetime import datetime
-from PIL import Image
-import io
 from config import Config
+from analysis_cache import AnalysisCache
+from image_context import ImageContext
+from image_encoder import VisionImageEncoder, estimate_image_tokens
+from perceptual_hash import PerceptualHashIndex
+from model_catalog import match_model
+from rate_limiter import estimate_request_tokens, get_rate_limiter, get_rate_limiters, retry_after_seconds
+from structured_output import (CascadeStats, ParseStats, analysis_problems, extract_json, merge_other_metrics,
+                               parse_partial_json, response_format)
+from usage_ledger import UsageLedger, parse_prices
 
 class OpenAIProcessor:
     """Process Grafana screenshots using OpenAI's GPT-4 Vision model"""
     
     def __init__(self):
-        self.client = openai.OpenAI(api_key=Config.OPENAI_API_KEY)
+        # Retries are handled in _create_completion so 429s reach the rate limiter
+        self.client = openai.OpenAI(api_key=Config.OPENAI_API_KEY, max_retries=0)
         self.model = Config.OPENAI_MODEL
         self.use_vision = Config.USE_OPENAI_VISION
         self.max_tokens = Config.OPENAI_MAX_TOKENS
         self.temperature = Config.OPENAI_TEMPERATURE
+        self.cache = AnalysisCache() if Config.ANALYSIS_CACHE_ENABLED else None
+        self.phash_index = PerceptualHashIndex() if Config.PHASH_ENABLED else None
+        self.image_encoder = VisionImageEncoder() if Config.VISION_ENCODER == 'budget' else None
+        self.structured_output = Config.OPENAI_STRUCTURED_OUTPUT
+        self.parse_stats = ParseStats()
+        self.streaming = Config.OPENAI_STREAMING
+        self.max_retries = Config.OPENAI_MAX_RETRIES
+        self.usage_ledger = UsageLedger() if Config.USAGE_LEDGER_ENABLED else None
+        # Dashboard analyses try the cheapest model first; self.model serves custom prompts
+        cascade = Config.OPENAI_CASCADE_MODELS if Config.OPENAI_CASCADE_ENABLED else []
+        self.cascade_models = cascade if len(cascade) > 1 else [self.model]
+        self.cascade_stats = CascadeStats(self.cascade_models)
+        self._check_cascade_pricing()
         
         # Validate API key
         if not Config.OPENAI_API_KEY:
             raise ValueError("OpenAI API key is required. Please set OPENAI_API_KEY in your .env file")
     
+    def _check_cascade_pricing(self):
+        """Warn when an earlier cascade tier costs at least as much per screenshot as the final one"""
+        prices = parse_prices(Config.USAGE_PRICES)
+        
+        def screenshot_cost(model):
+            name = match_model(model, prices)
+            # A typical 1024x768 dashboard at high detail
+            return estimate_image_tokens(1024, 768, 'high', model) * prices[name][0] if name else None
+        
+        final_model = self.cascade_models[-1]
+        final_cost = screenshot_cost(final_model)
+        for model in self.cascade_models[:-1]:
+            cost = screenshot_cost(model)
+            if cost is not None and final_cost and cost >= final_cost:
+                print(f"Warning: cascade tier {model} bills a dashboard image at {cost / final_cost:.1f}x the cost "
+                      f"of {final_model}; reorder OPENAI_CASCADE_MODELS or disable the cascade")
+    
+    @staticmethod
+    def _image_tokens(encoding, model):
+        """Image tokens an encoded payload costs on `model`; vision pricing differs a lot between models"""
+        return estimate_image_tokens(encoding['width'], encoding['height'], encoding['detail'], model)
+    
     def get_system_prompt(self):
         """Get the system prompt for analyzing Grafana dashboards"""
         return """You are an expert Grafana dashboard analyst. You will be given screenshots of Grafana dashboards and need to extract meaningful monitoring data and insights.
@@ -88,6 +131,10 @@ Example JSON structure:
     "network_in": 1.5,
     "network_out": 2.3
   },
+  "other_metrics": [
+    {"name": "request_latency_p95", "value": 230, "unit": "ms"},
+    {"name": "error_rate", "value": 0.4, "unit": "%"}
+  ],
   "health_status": "HEALTHY",
   "alerts": [],
   "insights": ["CPU usage is within normal range", "Memory usage is elevated but stable"]
@@ -113,95 +160,352 @@ Format your response as structured JSON following the schema provided in the sys
         
         return base_prompt
     
-    def encode_image(self, image_path):
-        """Encode image to base64 for OpenAI API"""
+    def prepare_image(self, image):
+        """Encode image for the vision API: payload dict with base64, mime_type, detail and token estimate"""
         try:
-            # Optimize image size for API
-            with Image.open(image_path) as img:
-                # Convert to RGB if necessary
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                
-                # Resize if too large (OpenAI has size limits)
-                max_size = 2048
-                if img.width > max_size or img.height > max_size:
-                    img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-                
-                # Save to bytes
-                img_byte_arr = io.BytesIO()
-                img.save(img_byte_arr, format='JPEG', quality=85)
-                img_byte_arr = img_byte_arr.getvalue()
-                
-                # Encode to base64
-                return base64.b64encode(img_byte_arr).decode('utf-8')
+            # The context reuses pixels already decoded for OCR and memoizes the payload
+            context = ImageContext.ensure(image)
+            if self.image_encoder:
+                return self.image_encoder.encode(context)
+            
+            height, width = context.bgr.shape[:2]
+            scale = min(1.0, 2048 / max(width, height))
+            size = (int(width * scale), int(height * scale))
+            return {
+                'base64': context.jpeg_base64(max_size=2048, quality=85),
+                'mime_type': 'image/jpeg',
+                'format': 'jpeg',
+                'detail': 'auto',
+                'width': size[0],
+                'height': size[1],
+                'crop': None,
+                'estimated_tokens': estimate_image_tokens(size[0], size[1], model=self.model)
+            }
         except Exception as e:
             print(f"Error encoding image: {e}")
             return None
     
-    def analyze_dashboard_image(self, image_path, additional_context=""):
+    def encode_image(self, image):
+        """Encode image to base64 for OpenAI API"""
+        payload = self.prepare_image(image)
+        return payload['base64'] if payload else None
+    
+    @staticmethod
+    def _image_content(payload):
+        """image_url message part for an encoded payload"""
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:{payload['mime_type']};base64,{payload['base64']}",
+                "detail": payload['detail']
+            }
+        }
+    
+    @staticmethod
+    def _encoding_info(payload):
+        """Payload metadata (without the image data) recorded with each analysis"""
+        return {key: value for key, value in payload.items() if key != 'base64'}
+    
+    def _build_messages(self, system_prompt, user_prompt, payload):
+        """Chat messages for one image and prompt"""
+        return [
+            {
+                "role": "system",
+                "content": system_prompt
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": user_prompt
+                    },
+                    self._image_content(payload)
+                ]
+            }
+        ]
+    
+    def _parse_analysis(self, analysis_text, refusal=None, model=None):
+        """Parse the model's JSON answer, keeping the raw text when no JSON object can be recovered"""
+        if refusal:
+            self.parse_stats.record('refused')
+            parsing_error = f"Model refused: {refusal}"
+        else:
+            try:
+                analysis_data = json.loads(analysis_text)
+                if isinstance(analysis_data, dict):
+                    self.parse_stats.record('parsed')
+                    return merge_other_metrics(analysis_data)
+            except (json.JSONDecodeError, TypeError):
+                pass
+            
+            # Markdown fences or chatter around the JSON
+            analysis_data = extract_json(analysis_text)
+            if analysis_data is not None:
+                self.parse_stats.record('recovered')
+                return merge_other_metrics(analysis_data)
+            self.parse_stats.record('failed')
+            parsing_error = "Response was not valid JSON"
+        
+        # If not a JSON object, create structured format
+        return {
+            "raw_analysis": analysis_text,
+            "processed_at": datetime.now().isoformat(),
+            "model_used": model or self.model,
+            "parsing_error": parsing_error
+        }
+    
+    def _get_cache_key(self, base64_image, system_prompt, user_prompt, detail='auto', **extra):
+        """Build the analysis cache key for an encoded image and its prompts"""
+        return AnalysisCache.make_key(
+            base64_image,
+            self.model,
+            f"{system_prompt}\n\n{user_prompt}",
+            self.temperature,
+            max_tokens=self.max_tokens,
+            detail=detail,
+            **extra
+        )
+    
+    def _backoff_delay(self, attempt, error=None):
+        """Seconds to wait before the next attempt: the API's retry-after if given, else full-jitter exponential"""
+        retry_after = retry_after_seconds(error) if error is not None else None
+        if retry_after is not None:
+            return min(retry_after, Config.OPENAI_BACKOFF_MAX)
+        return random.uniform(0, min(Config.OPENAI_BACKOFF_MAX, Config.OPENAI_BACKOFF_BASE * (2 ** attempt)))
+    
+    def _create_completion(self, body, on_partial=None, image_tokens=0):
+        """Run a chat completion within the shared rate limits, retrying 429s and transient failures.
+        Returns (content, refusal, call) where call holds the tokens and latency for the usage ledger"""
+        if self.usage_ledger:
+            self.usage_ledger.check_budget()
+        estimated_tokens = estimate_request_tokens(body, image_tokens)
+        # Each model has its own request/token budget
+        rate_limiter = get_rate_limiter(body['model'])
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            reserved = rate_limiter.acquire(estimated_tokens) if rate_limiter else None
+            try:
+                content, refusal, usage, first_token_at = self._request_completion(body, on_partial)
+            except openai.RateLimitError as e:
+                delay = self._backoff_delay(attempt, e)
+                if rate_limiter:
+                    # Shrinks concurrency and holds back every caller, not just this one
+                    rate_limiter.throttle(reserved, delay)
+                if attempt == self.max_retries:
+                    raise
+                print(f"OpenAI rate limit hit, retrying in {delay:.1f}s")
+                if not rate_limiter:
+                    time.sleep(delay)
+                continue
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                if rate_limiter:
+                    rate_limiter.cancel(reserved)
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._backoff_delay(attempt, e))
+                continue
+            except Exception:
+                if rate_limiter:
+                    rate_limiter.cancel(reserved)
+                raise
+            
+            if rate_limiter:
+                rate_limiter.release(reserved, usage.total_tokens if usage else None)
+            # Latencies include rate-limit waits and retries: what the caller actually experienced
+            finished = time.monotonic()
+            return content, refusal, {
+                'model': body['model'],
+                'prompt_tokens': usage.prompt_tokens if usage else 0,
+                'completion_tokens': usage.completion_tokens if usage else 0,
+                'latency_ms': (finished - started) * 1000,
+                'ttft_ms': (first_token_at - started) * 1000 if first_token_at else None,
+                'attempts': attempt + 1
+            }
+    
+    def _request_completion(self, body, on_partial=None):
+        """One chat completion call; with on_partial, stream it and report what has been parsed so far.
+        Returns (content, refusal, usage, first_token_at); first_token_at is only known when streaming"""
+        if not (on_partial and self.streaming):
+            response = self.client.chat.completions.create(**body)
+            message = response.choices[0].message
+            return message.content, getattr(message, 'refusal', None), response.usage, None
+        
+        content, refusal = [], []
+        usage = first_token_at = None
+        last_partial = None
+        # The final chunk carries usage (and no choices) so the limiter can settle actual tokens
+        for chunk in self.client.chat.completions.create(stream=True, stream_options={'include_usage': True}, **body):
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if getattr(delta, 'refusal', None):
+                refusal.append(delta.refusal)
+            if not delta.content:
+                continue
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+            content.append(delta.content)
+            # Re-parse only when a value or word may have just completed
+            if any(char in delta.content for char in ' \n,]}"'):
+                text = ''.join(content)
+                partial = parse_partial_json(text) if '{' in text else {'analysis': text}
+                if partial and partial != last_partial:
+                    on_partial(partial)
+                    last_partial = partial
+        return ''.join(content) or None, ''.join(refusal) or None, usage, first_token_at
+    
+    def analyze_dashboard_image(self, image, additional_context="", on_partial=None, on_escalate=None):
         """Analyze Grafana dashboard image using OpenAI Vision API"""
+        # on_escalate(info) runs before a rejected tier's answer is replaced by the next tier's stream
         try:
             if not self.use_vision:
-                return self._fallback_text_analysis(image_path)
+                return self._fallback_text_analysis(image)
             
-            # Encode image
-            base64_image = self.encode_image(image_path)
-            if not base64_image:
+            request = self.prepare_analysis_request(image, additional_context)
+            if not request:
                 return None
+            if 'cached' in request:
+                return request['cached']
             
-            # Create messages for the API
-            messages = [
-                {
-                    "role": "system",
-                    "content": self.get_system_prompt()
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": self.get_analysis_prompt(additional_context)
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
+            # Walk up the cascade until an answer passes validation; the last tier's answer is final
+            escalation_problems = []
+            for tier, model in enumerate(self.cascade_models):
+                # Make API call, streaming partial results to on_partial when given
+                image_tokens = self._image_tokens(request['encoding'], model)
+                content, refusal, call = self._create_completion(dict(request['body'], model=model), on_partial,
+                                                                 image_tokens)
+                analysis_data = self._parse_analysis(content, refusal, model)
+                self._record_usage('analysis', analysis_data, call, image=request.get('image'),
+                                   image_tokens=image_tokens)
+                if tier == len(self.cascade_models) - 1:
+                    break
+                problems = analysis_problems(analysis_data)
+                if not problems:
+                    break
+                escalation_problems.append(problems)
+                print(f"Escalating analysis from {model}: {', '.join(problems)}")
+                if on_escalate:
+                    # Partials streamed so far belong to the rejected answer
+                    on_escalate({'from_model': model, 'model': self.cascade_models[tier + 1], 'problems': problems})
+            
+            self.cascade_stats.record(model, escalation_problems)
+            analysis_data['model_used'] = model
+            if len(self.cascade_models) > 1:
+                analysis_data['cascade'] = {
+                    'model': model,
+                    'tier': tier,
+                    'escalation_problems': escalation_problems
                 }
-            ]
+            return self.finish_analysis(request, analysis_data)
             
-            # Make API call
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature
-            )
+        except Exception as e:
+            print(f"Error analyzing image with OpenAI: {e}")
+            return None
+    
+    def prepare_analysis_request(self, image, additional_context="", model=None):
+        """Chat completion request body for an image (first cascade tier unless `model` is given),
+        or {'cached': analysis} when a cache already has it"""
+        try:
+            # Decode once; encoding and perceptual hashing share the pixels
+            context = ImageContext.ensure(image)
             
-            # Parse response
-            analysis_text = response.choices[0].message.content
+            # Encode image within the per-image token budget
+            payload = self.prepare_image(context)
+            if not payload:
+                return None
             
-            # Try to parse as JSON
-            try:
-                analysis_data = json.loads(analysis_text)
-            except json.JSONDecodeError:
-                # If not valid JSON, create structured format
-                analysis_data = {
-                    "raw_analysis": analysis_text,
-                    "processed_at": datetime.now().isoformat(),
-                    "model_used": self.model,
-                    "parsing_error": "Response was not valid JSON"
-                }
+            system_prompt = self.get_system_prompt()
+            user_prompt = self.get_analysis_prompt(additional_context)
             
-            return analysis_data
+            # Identical screenshot + request parameters -> reuse the earlier analysis
+            # Cascaded answers are only as good as the chain that produced them
+            cache_params = {'structured_output': self.structured_output}
+            if len(self.cascade_models) > 1:
+                cache_params['cascade'] = self.cascade_models
+            cache_key = self._get_cache_key(payload['base64'], system_prompt, user_prompt, payload['detail'],
+                                            **cache_params)
+            cached = self.cache.get(cache_key) if self.cache else None
+            if cached is not None:
+                self._record_usage('analysis', cached, image=context.filename, cache_hit='exact')
+                return {'cached': cached}
             
+            # Near-identical screenshot (clock tick, cursor, jitter) -> reuse a recent analysis
+            image_hash = request_signature = None
+            if self.phash_index:
+                image_hash = self.phash_index.compute(context)
+            if image_hash is not None:
+                request_signature = self._get_cache_key('', system_prompt, user_prompt, payload['detail'],
+                                                        **cache_params)
+                near_duplicate = self.phash_index.lookup(image_hash, request_signature)
+                if near_duplicate is not None:
+                    self._record_usage('analysis', near_duplicate, image=context.filename, cache_hit='near_duplicate')
+                    return {'cached': near_duplicate}
+            
+            body = {
+                'model': model or self.cascade_models[0],
+                'messages': self._build_messages(system_prompt, user_prompt, payload),
+                'max_tokens': self.max_tokens,
+                'temperature': self.temperature
+            }
+            # Have the API enforce the analysis schema instead of hoping the prompt is followed
+            if response_format(self.structured_output):
+                body['response_format'] = response_format(self.structured_output)
+            
+            return {
+                'body': body,
+                'cache_key': cache_key,
+                'encoding': self._encoding_info(payload),
+                'image_hash': image_hash,
+                'request_signature': request_signature,
+                'image': context.filename,
+                'model': body['model']
+            }
         except Exception as e:
-            print(f"Error analyzing image with OpenAI: {e}")
+            print(f"Error preparing analysis request: {e}")
             return None
     
-    def _fallback_text_analysis(self, image_path):
+    def complete_analysis(self, request, analysis_text, refusal=None, call=None):
+        """Turn the model's answer to a prepared request into the analysis dict, cache it and log its usage"""
+        analysis_data = self._parse_analysis(analysis_text, refusal, request['model'])
+        analysis_data['model_used'] = (call or {}).get('model') or request['model']
+        if call:
+            self._record_usage('batch' if call.get('batch') else 'analysis', analysis_data, call,
+                               image=request.get('image'),
+                               image_tokens=self._image_tokens(request['encoding'], request['model']))
+        return self.finish_analysis(request, analysis_data)
+    
+    def finish_analysis(self, request, analysis_data):
+        """Attach encoding details to an accepted analysis and cache it"""
+        analysis_data['image_encoding'] = request['encoding']
+        
+        # Don't cache unparseable responses so a re-upload gets another chance
+        if 'parsing_error' not in analysis_data:
+            if self.cache:
+                self.cache.put(request['cache_key'], analysis_data)
+            if self.phash_index and request.get('image_hash') is not None:
+                self.phash_index.add(request['image_hash'], request['request_signature'], analysis_data)
+        
+        return analysis_data
+    
+    def _record_usage(self, kind, analysis, call=None, image=None, cache_hit=None, image_tokens=0):
+        """Append one call (or cache hit) to the usage ledger"""
+        if not self.usage_ledger:
+            return
+        overview = analysis.get('dashboard_overview') if isinstance(analysis, dict) else None
+        self.usage_ledger.record(
+            kind,
+            (call or {}).get('model', self.model),
+            call,
+            dashboard=overview.get('title') if isinstance(overview, dict) else None,
+            image=image,
+            cache_hit=cache_hit,
+            image_tokens=image_tokens
+        )
+    
+    def _fallback_text_analysis(self, image):
         """Fallback method if Vision API is not available"""
         try:
             # This could integrate with the existing OCR processor
@@ -215,68 +519,82 @@ Format your response as structured JSON following the schema provided in the sys
             print(f"Error in fallback analysis: {e}")
             return None
     
-    def process_image_with_custom_prompt(self, image_path, custom_prompt):
+    def process_image_with_custom_prompt(self, image, custom_prompt, on_partial=None):
         """Process image with a custom user-provided prompt"""
         try:
             if not self.use_vision:
-                return self._fallback_text_analysis(image_path)
+                return self._fallback_text_analysis(image)
             
             # Encode image
-            base64_image = self.encode_image(image_path)
-            if not base64_image:
+            payload = self.prepare_image(image)
+            if not payload:
                 return None
+            base64_image = payload['base64']
             
-            # Create messages with custom prompt
-            messages = [
-                {
-                    "role": "system",
-                    "content": "You are an expert at analyzing Grafana dashboards. Analyze the provided dashboard image and respond according to the user's specific instructions."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": custom_prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ]
+            system_prompt = "You are an expert at analyzing Grafana dashboards. Analyze the provided dashboard image and respond according to the user's specific instructions."
             
-            # Make API call
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature
-            )
+            cache_key = self._get_cache_key(base64_image, system_prompt, custom_prompt, payload['detail'])
+            cached = self.cache.get(cache_key) if self.cache else None
+            if cached is not None:
+                self._record_usage('custom_prompt', cached, cache_hit='exact')
+                return cached
             
-            # Parse response
-            analysis_text = response.choices[0].message.content
+            # Make API call with the custom prompt
+            image_tokens = self._image_tokens(payload, self.model)
+            analysis_text, refusal, call = self._create_completion({
+                'model': self.model,
+                'messages': self._build_messages(system_prompt, custom_prompt, payload),
+                'max_tokens': self.max_tokens,
+                'temperature': self.temperature
+            }, on_partial, image_tokens)
+            analysis_text = analysis_text or refusal
+            self._record_usage('custom_prompt', None, call, image_tokens=image_tokens)
             
-            # Try to parse as JSON, otherwise return as text
+            # Try to parse as JSON (fenced or not), otherwise return as text
             try:
                 analysis_data = json.loads(analysis_text)
-            except json.JSONDecodeError:
-                analysis_data = {
+            except (json.JSONDecodeError, TypeError):
+                analysis_data = extract_json(analysis_text) or {
                     "analysis": analysis_text,
                     "processed_at": datetime.now().isoformat(),
                     "model_used": self.model,
                     "custom_prompt": custom_prompt
                 }
             
+            if self.cache:
+                self.cache.put(cache_key, analysis_data)
+            
             return analysis_data
             
         except Exception as e:
             print(f"Error processing image with custom prompt: {e}")
             return None
     
+    def get_parse_stats(self):
+        """Get how often analysis answers parsed, needed recovery, or were unusable"""
+        return {'structured_output': self.structured_output, **self.parse_stats.get_stats()}
+    
+    def get_rate_limit_stats(self):
+        """Get each model's limiter concurrency, remaining budgets and throttling counts"""
+        if not Config.OPENAI_RATE_LIMIT_ENABLED:
+            return {'enabled': False}
+        return {model: limiter.get_stats() for model, limiter in get_rate_limiters().items()}
+    
+    def get_usage_summary(self, days=7):
+        """Get token, latency and cost aggregates from the usage ledger"""
+        return self.usage_ledger.summary(days) if self.usage_ledger else {'enabled': False}
+    
+    def get_cascade_stats(self):
+        """Get how many analyses each model tier answered and why they escalated"""
+        return self.cascade_stats.get_stats()
+    
+    def get_cache_stats(self):
+        """Get hit rates for the exact and near-duplicate analysis caches"""
+        return {
+            'exact': self.cache.get_stats() if self.cache else None,
+            'near_duplicate': self.phash_index.get_stats() if self.phash_index else None
+        }
+    
     def extract_metrics_from_analysis(self, analysis_data):
         """Extract structured metrics from OpenAI analysis"""
         metrics = {}
@@ -0,0 +1,71 @@
+import cv2
+from config import Config
+
+# Tesseract page segmentation modes used per panel
+PSM_SINGLE_BLOCK = 6   # compact stat/table panels: one uniform block of text
+PSM_SPARSE_TEXT = 11   # graph panels: title, legend and axis labels scattered around
+
+class PanelSegmenter:
+    """Find Grafana panel rectangles in a dashboard screenshot"""
+
+    def __init__(self, min_area_ratio=None, max_panels=None):
+        self.min_area_ratio = min_area_ratio if min_area_ratio is not None else Config.PANEL_MIN_AREA_RATIO
+        self.max_panels = max_panels or Config.PANEL_MAX_COUNT
+
+    def find_panels(self, context):
+        """Return panel bounding boxes (x, y, w, h) in reading order"""
+        gray = context.gray
+        height, width = gray.shape
+        image_area = height * width
+        min_area = image_area * self.min_area_ratio
+
+        # Panel borders and background changes show up as edges; close small
+        # gaps so each panel outline becomes a single contour
+        edges = cv2.Canny(gray, 30, 100)
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
+        closed = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel, iterations=2)
+        contours, _ = cv2.findContours(closed, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+        candidates = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            box_area = w * h
+            if box_area < min_area or box_area > image_area * 0.9:
+                continue
+            # Keep only roughly rectangular outlines
+            if cv2.contourArea(contour) < box_area * 0.8:
+                continue
+            candidates.append((x, y, w, h))
+
+        panels = self._drop_nested(candidates)
+        return self._reading_order(panels)[:self.max_panels]
+
+    def _drop_nested(self, boxes):
+        """Keep outermost boxes; inner borders and widgets inside a panel are dropped"""
+        boxes = sorted(boxes, key=lambda box: box[2] * box[3], reverse=True)
+        kept = []
+        for box in boxes:
+            if not any(self._contains(outer, box) for outer in kept):
+                kept.append(box)
+        return kept
+
+    @staticmethod
+    def _contains(outer, inner, tolerance=4):
+        """Whether inner lies within outer (allowing a few pixels of slack)"""
+        ox, oy, ow, oh = outer
+        ix, iy, iw, ih = inner
+        return (ix >= ox - tolerance and iy >= oy - tolerance and
+                ix + iw <= ox + ow + tolerance and iy + ih <= oy + oh + tolerance)
+
+    @staticmethod
+    def _reading_order(boxes, row_tolerance=20):
+        """Sort boxes top-to-bottom, then left-to-right within a row"""
+        return sorted(boxes, key=lambda box: (box[1] // row_tolerance, box[0]))
+
+    @staticmethod
+    def choose_psm(box):
+        """Pick the page segmentation mode that suits a panel's shape"""
+        _, _, w, h = box
+        if h <= 200 or w * h <= 300 * 200:
+            return PSM_SINGLE_BLOCK
+        return PSM_SPARSE_TEXT
@@ -0,0 +1,129 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+import cv2
+import numpy as np
+from config import Config
+from image_context import ImageContext
+
+def dhash(gray, hash_size=8):
+    """Difference hash: compare horizontally adjacent pixels of a tiny thumbnail"""
+    resized = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = resized[:, 1:] > resized[:, :-1]
+    return _bits_to_int(bits)
+
+def phash(gray, hash_size=8, highfreq_factor=4):
+    """Perceptual hash: sign of the low-frequency DCT coefficients against their median"""
+    size = hash_size * highfreq_factor
+    resized = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_freq = cv2.dct(resized)[:hash_size, :hash_size]
+    # Skip the DC term so overall brightness doesn't dominate the median
+    median = np.median(low_freq.flatten()[1:])
+    return _bits_to_int(low_freq > median)
+
+def detail_level(gray, size=32):
+    """Grey-level standard deviation of a small thumbnail: how much structure a hash can pick up"""
+    thumbnail = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+    return float(thumbnail.std())
+
+def _bits_to_int(bits):
+    """Pack a boolean array into an integer"""
+    value = 0
+    for bit in bits.flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+def hamming_distance(a, b):
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count('1')
+
+HASH_FUNCTIONS = {'phash': phash, 'dhash': dhash}
+
+class PerceptualHashIndex:
+    """Index of recently analyzed screenshots for reusing analyses of near-duplicates"""
+
+    def __init__(self, algorithm=None, threshold=None, max_entries=None, max_age=None, min_detail=None):
+        self.algorithm = algorithm or Config.PHASH_ALGORITHM
+        self.threshold = threshold if threshold is not None else Config.PHASH_THRESHOLD
+        self.min_detail = min_detail if min_detail is not None else Config.PHASH_MIN_DETAIL
+        self.max_entries = max_entries or Config.PHASH_MAX_ENTRIES
+        self.max_age = max_age if max_age is not None else Config.PHASH_MAX_AGE
+        self._hash_function = HASH_FUNCTIONS[self.algorithm]
+        # hash -> (signature, stored_at, analysis), oldest first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.refreshes = 0
+        self.low_detail = 0
+
+    def compute(self, image):
+        """Hash an image (path, bytes or ImageContext); None when it has too little detail to compare"""
+        context = ImageContext.ensure(image)
+
+        def compute_hash():
+            # Blank and near-constant screenshots hash to (nearly) the same value whatever they show
+            if detail_level(context.gray) < self.min_detail:
+                with self._lock:
+                    self.low_detail += 1
+                return None
+            return self._hash_function(context.gray)
+
+        return context.get_or_compute(f'{self.algorithm}_hash', compute_hash)
+
+    def lookup(self, image_hash, signature):
+        """Find a prior analysis for a near-duplicate image made with the same request signature"""
+        now = time.time()
+        best = None
+        with self._lock:
+            self.lookups += 1
+            stale = False
+            for stored_hash, (stored_signature, stored_at, analysis) in self._entries.items():
+                if stored_signature != signature:
+                    continue
+                distance = hamming_distance(image_hash, stored_hash)
+                if distance > self.threshold:
+                    continue
+                if self.max_age > 0 and now - stored_at > self.max_age:
+                    # Same dashboard, but the analysis is old enough to be worth redoing
+                    stale = True
+                    continue
+                if best is None or distance < best[0]:
+                    best = (distance, analysis)
+
+            if best is None:
+                if stale:
+                    self.refreshes += 1
+                return None
+
+            self.hits += 1
+        return copy.deepcopy(best[1])
+
+    def add(self, image_hash, signature, analysis):
+        """Record a fresh analysis, replacing near-duplicates it supersedes"""
+        with self._lock:
+            superseded = [
+                stored_hash for stored_hash, (stored_signature, _, _) in self._entries.items()
+                if stored_signature == signature and hamming_distance(image_hash, stored_hash) <= self.threshold
+            ]
+            for stored_hash in superseded:
+                del self._entries[stored_hash]
+
+            self._entries[image_hash] = (signature, time.time(), copy.deepcopy(analysis))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self):
+        """Get lookup, hit and refresh counters"""
+        with self._lock:
+            return {
+                'algorithm': self.algorithm,
+                'threshold': self.threshold,
+                'entries': len(self._entries),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'refreshes': self.refreshes,
+                'low_detail': self.low_detail,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.0
+            }
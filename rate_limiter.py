@@ -0,0 +1,185 @@
+import threading
+import time
+from config import Config
+from model_catalog import base_model, match_model
+
+# Rough text tokens per character for budgeting before the API reports real usage
+CHARS_PER_TOKEN = 4
+
+def estimate_request_tokens(body, image_tokens=0):
+    """Tokens a chat completion counts against the per-minute limit: prompt text, images and max_tokens"""
+    chars = 0
+    for message in body.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            chars += len(content)
+        else:
+            chars += sum(len(part.get('text', '')) for part in content or [])
+    return chars // CHARS_PER_TOKEN + image_tokens + body.get('max_tokens', 0)
+
+def retry_after_seconds(error):
+    """Delay the API asked for in a 429 response (retry-after-ms / retry-after), or None"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    for header, scale in (('retry-after-ms', 1000.0), ('retry-after', 1.0)):
+        value = response.headers.get(header)
+        if value:
+            try:
+                return float(value) / scale
+            except ValueError:
+                pass
+    return None
+
+class TokenBucket:
+    """Continuously refilling per-minute budget; may run into debt when actual usage exceeds a reservation"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken (requests larger than the bucket wait for a full one)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= amount
+
+    def give(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+def parse_rate_limits(spec):
+    """'model=requests/tokens,...' per minute -> {model: (requests, tokens)}"""
+    limits = {}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        model, _, values = item.partition('=')
+        requests, _, tokens = values.partition('/')
+        try:
+            limits[model.strip()] = (int(requests), int(tokens))
+        except ValueError:
+            print(f"Ignoring invalid rate limit entry: {item}")
+    return limits
+
+class OpenAIRateLimiter:
+    """Request/token budgets plus an AIMD concurrency limit for one model's OpenAI calls"""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_concurrency=None, min_concurrency=None):
+        requests_per_minute = requests_per_minute if requests_per_minute is not None else Config.OPENAI_REQUESTS_PER_MINUTE
+        tokens_per_minute = tokens_per_minute if tokens_per_minute is not None else Config.OPENAI_TOKENS_PER_MINUTE
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_concurrency = max_concurrency or Config.OPENAI_MAX_CONCURRENCY
+        self.min_concurrency = max(1, min_concurrency or Config.OPENAI_MIN_CONCURRENCY)
+        self.decrease = Config.OPENAI_CONCURRENCY_DECREASE
+        # Start at the ceiling; 429s push the limit down, successes creep it back up
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._changed = threading.Condition()
+        self.calls = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self, estimated_tokens):
+        """Block until a concurrency slot and both budgets allow a call; returns the tokens reserved"""
+        started = time.monotonic()
+        with self._changed:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.in_flight >= int(self.limit):
+                    wait = None  # until a call finishes
+                else:
+                    wait = max(self.requests.wait_time(1, now) if self.requests else 0.0,
+                               self.tokens.wait_time(estimated_tokens, now) if self.tokens else 0.0)
+                    if not wait:
+                        break
+                self._changed.wait(wait)
+
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(estimated_tokens)
+            self.in_flight += 1
+            self.calls += 1
+            self.wait_seconds += time.monotonic() - started
+        return estimated_tokens
+
+    def release(self, reserved, used_tokens=None):
+        """Finish a successful call: settle its token reservation against actual usage and widen the limit"""
+        with self._changed:
+            self.in_flight -= 1
+            if self.tokens and used_tokens is not None:
+                if used_tokens < reserved:
+                    self.tokens.give(reserved - used_tokens)
+                else:
+                    self.tokens.take(used_tokens - reserved)
+            # Additive increase: about one more slot per `limit` successful calls
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._changed.notify_all()
+
+    def cancel(self, reserved):
+        """Finish a call that failed for reasons unrelated to rate limits"""
+        with self._changed:
+            self.in_flight -= 1
+            self._changed.notify_all()
+
+    def throttle(self, reserved, delay):
+        """Finish a call rejected with 429: halve the limit and hold every caller back for `delay` seconds"""
+        with self._changed:
+            self.in_flight -= 1
+            self.throttled += 1
+            self.limit = max(self.min_concurrency, self.limit * self.decrease)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            self._changed.notify_all()
+
+    def get_stats(self):
+        """Get the current concurrency limit, budgets left and how often calls were throttled"""
+        with self._changed:
+            now = time.monotonic()
+            for bucket in (self.requests, self.tokens):
+                if bucket:
+                    bucket._refill(now)
+            return {
+                'concurrency_limit': int(self.limit),
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self.in_flight,
+                'requests_available': int(self.requests.level) if self.requests else None,
+                'tokens_available': int(self.tokens.level) if self.tokens else None,
+                'calls': self.calls,
+                'throttled': self.throttled,
+                'blocked_for': max(0.0, round(self.blocked_until - now, 3)),
+                'average_wait': self.wait_seconds / self.calls if self.calls else 0.0
+            }
+
+MODEL_RATE_LIMITS = parse_rate_limits(Config.OPENAI_MODEL_RATE_LIMITS)
+_shared_limiters = {}
+_shared_lock = threading.Lock()
+
+def get_rate_limiter(model=None):
+    """Get the limiter every call to `model` in this process shares, or None when disabled"""
+    if not Config.OPENAI_RATE_LIMIT_ENABLED:
+        return None
+    # OpenAI budgets each model separately; dated snapshots count against their base model
+    model = model or Config.OPENAI_MODEL
+    name = match_model(model, MODEL_RATE_LIMITS) or base_model(model)
+    with _shared_lock:
+        if name not in _shared_limiters:
+            _shared_limiters[name] = OpenAIRateLimiter(*MODEL_RATE_LIMITS.get(name, (None, None)))
+        return _shared_limiters[name]
+
+def get_rate_limiters():
+    """Every limiter created so far, by model"""
+    with _shared_lock:
+        return dict(_shared_limiters)
@@ -0,0 +1,291 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from config import Config
+from batch_executor import OrderedResultEmitter
+from columnar_writer import COLUMNAR_FORMATS
+from datasource_query import flatten_panels
+from image_context import ImageContext
+from storage import atomic_write
+
+class RenderCache:
+    """Rendered panel PNGs keyed by (dashboard uid, panel id, time-range bucket)"""
+
+    def __init__(self, cache_dir=None, max_age=None):
+        self.cache_dir = cache_dir or Config.RENDER_CACHE_FOLDER
+        self.max_age = max_age if max_age is not None else Config.RENDER_CACHE_MAX_AGE
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, uid, panel_id, bucket):
+        return os.path.join(self.cache_dir, f"{uid}_{panel_id}_{bucket}.png")
+
+    def get(self, uid, panel_id, bucket):
+        """Cached PNG bytes, or None"""
+        try:
+            with open(self._path(uid, panel_id, bucket), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, uid, panel_id, bucket, data):
+        """Store a rendered PNG"""
+        path = self._path(uid, panel_id, bucket)
+        try:
+            atomic_write(path, data)
+        except OSError as e:
+            print(f"Error caching render {path}: {e}")
+
+    def _analysis_path(self, uid, panel_id, method):
+        return os.path.join(self.cache_dir, f"{uid}_{panel_id}.{method}.json")
+
+    def get_analysis(self, uid, panel_id, method, data):
+        """Analysis stored for these exact PNG bytes, or None"""
+        try:
+            with open(self._analysis_path(uid, panel_id, method), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry.get('analysis') if entry.get('digest') == hashlib.sha256(data).hexdigest() else None
+
+    def put_analysis(self, uid, panel_id, method, data, analysis):
+        """Remember a panel's analysis alongside the digest of the PNG it was made from"""
+        path = self._analysis_path(uid, panel_id, method)
+        try:
+            atomic_write(path, json.dumps({'digest': hashlib.sha256(data).hexdigest(), 'analysis': analysis},
+                                          default=str))
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error caching analysis {path}: {e}")
+
+    def prune(self):
+        """Delete renders older than the maximum age"""
+        cutoff = time.time() - self.max_age
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+class PanelRenderPipeline:
+    """Render every dashboard panel through Grafana and analyze the PNGs into one report per run"""
+
+    def __init__(self, grafana_client, batch_executor, report_generator, llm_report_generator,
+                 image_processor=None, openai_processor=None, rollups=None, cache=None, batch_runner=None,
+                 hybrid_processor=None):
+        self.grafana_client = grafana_client
+        self.batch_executor = batch_executor
+        self.report_generator = report_generator
+        self.llm_report_generator = llm_report_generator
+        self.image_processor = image_processor
+        self.openai_processor = openai_processor
+        self.rollups = rollups
+        self.cache = cache or RenderCache()
+        self.batch_runner = batch_runner
+        self.hybrid_processor = hybrid_processor
+        self.processing_method = Config.RENDER_PROCESSING_METHOD
+        self.output_format = Config.RENDER_OUTPUT_FORMAT
+        # Hybrid results share the LLM analysis structure
+        self.llm_shaped = self.processing_method in ('llm', 'hybrid')
+        self._render_slots = threading.Semaphore(Config.GRAFANA_MAX_CONCURRENCY)
+        self._stats_lock = threading.Lock()
+        self.renders = 0
+        self.cache_hits = 0
+        self.reused = 0
+
+    def time_window(self, now=None):
+        """Render window aligned to the bucket size, so reruns within a bucket reuse renders"""
+        bucket_ms = Config.RENDER_BUCKET_SECONDS * 1000
+        now_ms = int((now or time.time()) * 1000)
+        bucket = now_ms // bucket_ms
+        time_to = bucket * bucket_ms
+        return bucket, time_to - Config.RENDER_TIME_RANGE * 1000, time_to
+
+    def collect_panels(self):
+        """List (uid, dashboard title, panel) for every data panel of the selected dashboards"""
+        if Config.RENDER_DASHBOARD_UIDS:
+            uids = Config.RENDER_DASHBOARD_UIDS
+        else:
+            uids = [item['uid'] for item in self.grafana_client.get_dashboards() if item.get('uid')]
+
+        jobs = []
+        for uid, model in self.grafana_client.get_dashboards_by_uid(uids).items():
+            if not model:
+                continue
+            dashboard = model.get('dashboard', {})
+            for panel in flatten_panels(dashboard.get('panels')):
+                if panel.get('id') is not None and panel.get('targets'):
+                    jobs.append((uid, dashboard.get('title', ''), panel))
+        return jobs
+
+    def _render(self, uid, panel_id, bucket, time_from, time_to):
+        """Panel PNG from the cache or Grafana's renderer"""
+        data = self.cache.get(uid, panel_id, bucket)
+        if data is not None:
+            with self._stats_lock:
+                self.cache_hits += 1
+            return data
+        # Bound concurrent renders separately from the analysis workers
+        with self._render_slots:
+            data = self.grafana_client.get_dashboard_snapshot(
+                uid, panel_id=panel_id,
+                width=Config.RENDER_PANEL_WIDTH, height=Config.RENDER_PANEL_HEIGHT,
+                time_from=time_from, time_to=time_to
+            )
+        if data:
+            with self._stats_lock:
+                self.renders += 1
+            self.cache.put(uid, panel_id, bucket, data)
+        return data
+
+    def _open_report_stream(self, filename_base):
+        """Open a streaming report for tabular formats; None for TXT/JSON"""
+        llm = self.llm_shaped
+        if self.output_format == 'csv':
+            filename = f"{filename_base}.csv"
+            if llm:
+                return self.llm_report_generator.open_llm_csv_stream(filename)
+            return self.report_generator.open_csv_stream(filename)
+        if self.output_format in COLUMNAR_FORMATS:
+            filename = f"{filename_base}{COLUMNAR_FORMATS[self.output_format]}"
+            if llm:
+                return self.llm_report_generator.open_llm_columnar_stream(self.output_format, filename)
+            return self.report_generator.open_columnar_stream(self.output_format, filename)
+        return None
+
+    def run(self):
+        """Render, analyze and report every panel; returns the report path or None"""
+        self.cache.prune()
+        self.renders = 0
+        self.cache_hits = 0
+        self.reused = 0
+        bucket, time_from, time_to = self.time_window()
+        jobs = self.collect_panels()
+        if not jobs:
+            print("No dashboard panels to render")
+            return None
+
+        if self.processing_method == 'llm':
+            analyze = self.openai_processor.analyze_dashboard_image
+        elif self.processing_method == 'hybrid':
+            analyze = self.hybrid_processor.process_image
+        else:
+            analyze = None  # OCR is CPU-bound and runs on the OCR process pool instead
+
+        def render(job):
+            """PNG bytes plus the analysis stored for identical bytes on an earlier run, if any"""
+            uid, _, panel = job
+            data = self._render(uid, panel['id'], bucket, time_from, time_to)
+            if not data:
+                return None, None
+            return data, self.cache.get_analysis(uid, panel['id'], self.processing_method, data)
+
+        def store(job, data, result):
+            """Keep a successful analysis so an unchanged render is not analyzed again"""
+            uid, _, panel = job
+            # Like finish_analysis, never keep an unparseable answer: the next run deserves another try
+            if result and 'error' not in result and 'parsing_error' not in result:
+                self.cache.put_analysis(uid, panel['id'], self.processing_method, data, result)
+
+        def image_for(job, data):
+            uid, _, panel = job
+            return ImageContext.from_bytes(data, filename=f"{uid}_panel{panel['id']}.png")
+
+        def render_and_analyze(job):
+            """Runs on the I/O worker pool: each PNG goes to analysis as soon as it renders"""
+            data, result = render(job)
+            if not data:
+                return None
+            if result is not None:
+                with self._stats_lock:
+                    self.reused += 1
+                return result
+            result = analyze(image_for(job, data))
+            store(job, data, result)
+            return result
+
+        filename_base = f"scheduled_render_{datetime.now().strftime(Config.REPORT_TIMESTAMP_FORMAT)}"
+        report_stream = self._open_report_stream(filename_base)
+        processed_data = []
+        processed_count = 0
+
+        def emit(index, result):
+            nonlocal processed_count
+            if not result:
+                return
+            uid, title, panel = jobs[index]
+            image_info = result.setdefault('image_info', {})
+            image_info.update({
+                'filename': f"{uid}_panel{panel['id']}.png",
+                'dashboard_uid': uid,
+                'dashboard_title': title,
+                'panel_id': panel['id'],
+                'panel_title': panel.get('title', ''),
+                'processing_method': self.processing_method
+            })
+            # The dashboard is known, so don't rely on reading its title off a single panel
+            if self.llm_shaped:
+                result.setdefault('dashboard_overview', {})['title'] = title
+            else:
+                result.setdefault('metrics', {})['dashboard_title'] = title
+            processed_count += 1
+            if self.rollups:
+                self.rollups.record(result)
+            if report_stream:
+                report_stream.write(result)
+            else:
+                processed_data.append(result)
+
+        try:
+            if analyze is None or (self.batch_runner and self.processing_method == 'llm'):
+                # Render on the I/O pool first, then analyze the changed PNGs on the OCR process pool
+                # or in one offline batch job
+                renders = self.batch_executor.process_llm_batch(render, jobs)
+                emitter = OrderedResultEmitter(emit)
+                pending = []
+                for index, (data, result) in enumerate(renders):
+                    if data and result is None:
+                        pending.append(index)
+                        continue
+                    if result is not None:
+                        self.reused += 1
+                    emitter(index, result)
+                images = [image_for(jobs[index], renders[index][0]) for index in pending]
+
+                def on_analyzed(position, result):
+                    index = pending[position]
+                    store(jobs[index], renders[index][0], result)
+                    emitter(index, result)
+
+                if analyze is None:
+                    self.batch_executor.process_ocr_batch(images, on_result=on_analyzed, keep_results=False)
+                elif images:
+                    for position, result in enumerate(self.batch_runner.run(images)):
+                        on_analyzed(position, result)
+            else:
+                self.batch_executor.process_llm_batch(render_and_analyze, jobs,
+                                                      on_result=OrderedResultEmitter(emit), keep_results=False)
+        finally:
+            if report_stream:
+                report_stream.close()
+
+        print(f"Rendered {self.renders} panel(s), reused {self.cache_hits} cached render(s) "
+              f"and {self.reused} unchanged analysis(es), reported {processed_count} of {len(jobs)}")
+
+        if not processed_count:
+            if report_stream:
+                os.remove(report_stream.filepath)
+                self.report_generator.catalog.remove(os.path.basename(report_stream.filepath))
+            return None
+        if report_stream:
+            return report_stream.filepath
+
+        if self.llm_shaped:
+            if self.output_format == 'txt':
+                return self.llm_report_generator.generate_llm_txt_report(processed_data, f"{filename_base}.txt")
+            return self.llm_report_generator.generate_llm_json_report(processed_data, f"{filename_base}.json")
+        if self.output_format == 'txt':
+            return self.report_generator.generate_txt_report(processed_data, f"{filename_base}.txt")
+        return self.report_generator.generate_json_report(processed_data, f"{filename_base}.json")
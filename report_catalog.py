@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+from datetime import datetime
+from config import Config
+from storage import connect_database, prepare_database
+
+# Higher is worse; used to roll many dashboards up into one report-level status
+HEALTH_SEVERITY = {
+    'OK': 1, 'UP': 1, 'HEALTHY': 1,
+    'WARNING': 2,
+    'DOWN': 3, 'ERROR': 3, 'UNHEALTHY': 3,
+    'CRITICAL': 4
+}
+
+# Filename prefix -> report kind, longest prefixes first
+REPORT_KINDS = [
+    ('comparative_dashboard_analysis_', 'comparative'),
+    ('llm_grafana_report_', 'llm_report'),
+    ('dashboard_summary_', 'dashboard_summary'),
+    ('grafana_summary_', 'summary'),
+    ('grafana_report_', 'ocr_report'),
+    ('weekly_summary_', 'weekly_summary'),
+    ('daily_summary_', 'daily_summary'),
+    ('scheduled_render_', 'scheduled_render'),
+]
+
+def guess_kind(filename):
+    """Infer a report kind from its filename"""
+    for prefix, kind in REPORT_KINDS:
+        if filename.startswith(prefix):
+            return kind
+    return 'other'
+
+class ReportSummary:
+    """Collect dashboard titles and the worst health status while a report is written"""
+
+    MAX_TITLES = 50
+
+    def __init__(self):
+        self.dashboard_titles = []
+        self.health_status = None
+
+    def add(self, dashboard_title=None, statuses=()):
+        """Record one dashboard's title and status indicators"""
+        if dashboard_title and dashboard_title not in self.dashboard_titles and len(self.dashboard_titles) < self.MAX_TITLES:
+            self.dashboard_titles.append(dashboard_title)
+        for status in statuses:
+            status = str(status).upper()
+            if status in HEALTH_SEVERITY and (
+                    self.health_status is None or HEALTH_SEVERITY[status] > HEALTH_SEVERITY[self.health_status]):
+                self.health_status = status
+
+    def track(self, row_builder, describe):
+        """Wrap a row builder so every record written also feeds this summary"""
+        def build(record):
+            self.add(*describe(record))
+            return row_builder(record)
+        return build
+
+    @classmethod
+    def from_records(cls, records, describe):
+        """Summarize records that are already in memory"""
+        summary = cls()
+        for record in records:
+            summary.add(*describe(record))
+        return summary
+
+class ReportCatalog:
+    """SQLite index of generated reports, replacing scans of the output folder"""
+
+    def __init__(self, db_path=None, output_folder=None):
+        self.db_path = db_path or Config.REPORT_CATALOG_PATH
+        self.output_folder = output_folder or Config.OUTPUT_FOLDER
+        self._init_lock = threading.Lock()
+
+        prepare_database(self.db_path)
+        self._init_db()
+
+    def _init_db(self):
+        """Create the catalog table and backfill it from the output folder on first use"""
+        with self._init_lock:
+            conn = connect_database(self.db_path)
+            try:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS reports (
+                        filename TEXT PRIMARY KEY,
+                        kind TEXT NOT NULL,
+                        format TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        created_at TEXT NOT NULL,
+                        dashboard_titles TEXT,
+                        health_status TEXT
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_created ON reports (created_at)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_kind ON reports (kind, created_at)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_format ON reports (format, created_at)")
+                is_empty = conn.execute("SELECT 1 FROM reports LIMIT 1").fetchone() is None
+            finally:
+                conn.close()
+
+        if is_empty:
+            self.backfill()
+
+    def backfill(self):
+        """Index reports already on disk (one-off scan when the catalog is new)"""
+        if not os.path.exists(self.output_folder):
+            return 0
+        count = 0
+        for entry in os.scandir(self.output_folder):
+            if entry.is_file():
+                stat = entry.stat()
+                self.record(entry.path, created_at=datetime.fromtimestamp(stat.st_mtime), size=stat.st_size)
+                count += 1
+        if count:
+            print(f"Indexed {count} existing report(s) into the report catalog")
+        return count
+
+    def record(self, filepath, kind=None, summary=None, created_at=None, size=None):
+        """Add or update the catalog entry for a report that was just written"""
+        try:
+            filename = os.path.basename(filepath)
+            if size is None:
+                size = os.path.getsize(filepath)
+            created_at = created_at or datetime.now()
+            file_format = os.path.splitext(filename)[1].lstrip('.').lower()
+            titles = summary.dashboard_titles if summary else []
+
+            conn = connect_database(self.db_path)
+            try:
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO reports
+                        (filename, kind, format, size, created_at, dashboard_titles, health_status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (filename, kind or guess_kind(filename), file_format, size, created_at.isoformat(),
+                     json.dumps(titles), summary.health_status if summary else None)
+                )
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Error recording report {filepath} in catalog: {e}")
+
+    def remove(self, filename):
+        """Drop a report from the catalog"""
+        conn = connect_database(self.db_path)
+        try:
+            conn.execute("DELETE FROM reports WHERE filename = ?", (filename,))
+        finally:
+            conn.close()
+
+    def _where(self, kind=None, file_format=None, start=None, end=None):
+        """Build a WHERE clause for the common filters"""
+        clauses, params = [], []
+        if kind:
+            clauses.append("kind = ?")
+            params.append(kind)
+        if file_format:
+            clauses.append("format = ?")
+            params.append(file_format)
+        if start:
+            clauses.append("created_at >= ?")
+            params.append(start.isoformat())
+        if end:
+            clauses.append("created_at < ?")
+            params.append(end.isoformat())
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def list_reports(self, kind=None, file_format=None, start=None, end=None, limit=100, offset=0):
+        """List reports newest first; returns (reports, total matching). limit=None means no limit"""
+        where, params = self._where(kind, file_format, start, end)
+        conn = connect_database(self.db_path)
+        try:
+            total = conn.execute(f"SELECT COUNT(*) FROM reports{where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM reports{where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                params + [limit if limit is not None else -1, offset]
+            ).fetchall()
+        finally:
+            conn.close()
+
+        return [self._row_to_dict(row) for row in rows], total
+
+    def count_by_format(self, start=None, end=None):
+        """Count reports per file format within a date range"""
+        where, params = self._where(start=start, end=end)
+        conn = connect_database(self.db_path)
+        try:
+            rows = conn.execute(f"SELECT format, COUNT(*) AS n FROM reports{where} GROUP BY format", params).fetchall()
+        finally:
+            conn.close()
+        return {row['format']: row['n'] for row in rows}
+
+    @staticmethod
+    def _row_to_dict(row):
+        """Convert a catalog row to the API representation"""
+        return {
+            'filename': row['filename'],
+            'kind': row['kind'],
+            'format': row['format'],
+            'size': row['size'],
+            'created': row['created_at'],
+            'modified': row['created_at'],
+            'dashboard_titles': json.loads(row['dashboard_titles']) if row['dashboard_titles'] else [],
+            'health_status': row['health_status']
+        }
@@ -1,48 +1,92 @@
-import pandas as pd
-import csv
 import json
 from datetime import datetime
 import os
 from config import Config
+from report_catalog import ReportCatalog, ReportSummary
+from tabular_writer import StreamingCSVWriter
+from columnar_writer import (StreamingColumnarWriter, COLUMNAR_FORMATS, ocr_report_schema,
+                             to_float, to_int, to_timestamp)
+
+# Fixed CSV schema; columns a row has no value for are left empty
+CSV_COLUMNS = [
+    'filename', 'processed_at', 'dashboard_title', 'image_size', 'file_size',
+    'primary_value', 'primary_unit', 'total_numbers', 'percentage_values', 'status',
+    'panel_titles', 'time_metrics', 'memory_metrics', 'raw_text_length'
+]
 
 class ReportGenerator:
     """Generate reports from processed image data"""
     
-    def __init__(self):
+    def __init__(self, catalog=None):
         self.output_folder = Config.OUTPUT_FOLDER
         os.makedirs(self.output_folder, exist_ok=True)
+        self.catalog = catalog or ReportCatalog()
+    
+    @staticmethod
+    def _describe(data):
+        """Dashboard title and status indicators of one record, for the report catalog"""
+        metrics = data.get('metrics', {})
+        return metrics.get('dashboard_title'), metrics.get('status_indicators', [])
+    
+    def _record(self, filepath, processed_data=None, summary=None):
+        """Index a finished report in the catalog"""
+        if summary is None and processed_data is not None:
+            records = processed_data if isinstance(processed_data, list) else [processed_data]
+            summary = ReportSummary.from_records(records, self._describe)
+        self.catalog.record(filepath, summary=summary)
+    
+    def open_csv_stream(self, filename=None):
+        """Open a CSV report that rows can be appended to as images finish"""
+        if filename is None:
+            timestamp = datetime.now().strftime(Config.REPORT_TIMESTAMP_FORMAT)
+            filename = f"grafana_report_{timestamp}.csv"
+        
+        filepath = os.path.join(self.output_folder, filename)
+        summary = ReportSummary()
+        return StreamingCSVWriter(filepath, CSV_COLUMNS, row_builder=summary.track(self._extract_row_data, self._describe),
+                                  on_close=lambda writer: self._record(writer.filepath, summary=summary))
     
     def generate_csv_report(self, processed_data, filename=None):
         """Generate CSV report from processed data"""
         try:
-            if filename is None:
-                timestamp = datetime.now().strftime(Config.REPORT_TIMESTAMP_FORMAT)
-                filename = f"grafana_report_{timestamp}.csv"
-            
-            filepath = os.path.join(self.output_folder, filename)
-            
-            # Prepare data for CSV
-            rows = []
+            if isinstance(processed_data, dict):
+                # Single image processed
+                processed_data = [processed_data]
             
-            if isinstance(processed_data, list):
-                # Multiple images processed
+            # Rows are written one at a time, so any iterable of results works
+            with self.open_csv_stream(filename) as writer:
                 for data in processed_data:
-                    row = self._extract_row_data(data)
-                    rows.append(row)
-            else:
-                # Single image processed
-                row = self._extract_row_data(processed_data)
-                rows.append(row)
+                    writer.write(data)
             
-            # Create DataFrame
-            df = pd.DataFrame(rows)
+            return writer.filepath
+        except Exception as e:
+            print(f"Error generating CSV report: {e}")
+            return None
+    
+    def open_columnar_stream(self, output_format='parquet', filename=None):
+        """Open a Parquet or Arrow report that rows can be appended to in batches"""
+        if filename is None:
+            timestamp = datetime.now().strftime(Config.REPORT_TIMESTAMP_FORMAT)
+            filename = f"grafana_report_{timestamp}{COLUMNAR_FORMATS[output_format]}"
+        
+        filepath = os.path.join(self.output_folder, filename)
+        summary = ReportSummary()
+        return StreamingColumnarWriter(filepath, ocr_report_schema(), summary.track(self._extract_columnar_row, self._describe),
+                                       output_format, on_close=lambda writer: self._record(writer.filepath, summary=summary))
+    
+    def generate_columnar_report(self, processed_data, output_format='parquet', filename=None):
+        """Generate Parquet or Arrow report from processed data"""
+        try:
+            if isinstance(processed_data, dict):
+                processed_data = [processed_data]
             
-            # Write to CSV
-            df.to_csv(filepath, index=False)
+            with self.open_columnar_stream(output_format, filename) as writer:
+                for data in processed_data:
+                    writer.write(data)
             
-            return filepath
+            return writer.filepath
         except Exception as e:
-            print(f"Error generating CSV report: {e}")
+            print(f"Error generating {output_format} report: {e}")
             return None
     
     def generate_txt_report(self, processed_data, filename=None):
@@ -70,6 +114,7 @@ class ReportGenerator:
                     f.write("-" * 30 + "\n")
                     self._write_data_to_txt(f, processed_data)
             
+            self._record(filepath, processed_data)
             return filepath
         except Exception as e:
             print(f"Error generating TXT report: {e}")
@@ -92,6 +137,7 @@ class ReportGenerator:
             with open(filepath, 'w', encoding='utf-8') as f:
                 json.dump(report_data, f, indent=2, ensure_ascii=False)
             
+            self._record(filepath, processed_data)
             return filepath
         except Exception as e:
             print(f"Error generating JSON report: {e}")
@@ -151,6 +197,37 @@ class ReportGenerator:
         
         return row
     
+    def _extract_columnar_row(self, data):
+        """Extract a typed row (nested lists kept as lists) for Parquet/Arrow"""
+        metrics = data.get('metrics', {})
+        image_info = data.get('image_info', {})
+        size = image_info.get('size') or (None, None)
+        
+        panels = []
+        for panel in data.get('panels', []):
+            x, y, w, h = panel.get('bbox', [None] * 4)
+            panels.append({
+                'x': x, 'y': y, 'width': w, 'height': h,
+                'psm': panel.get('psm'),
+                'text': panel.get('text', ''),
+                'numbers': [to_float(value) for value, _ in panel.get('metrics', {}).get('numbers', [])]
+            })
+        
+        return {
+            'filename': image_info.get('filename', ''),
+            'processed_at': to_timestamp(data.get('processed_at')),
+            'dashboard_title': metrics.get('dashboard_title', ''),
+            'image_width': to_int(size[0]),
+            'image_height': to_int(size[1]),
+            'file_size': to_int(image_info.get('file_size')),
+            'numbers': [{'value': to_float(value), 'unit': unit} for value, unit in metrics.get('numbers', [])],
+            'percentages': [to_float(p) for p in metrics.get('percentages', [])],
+            'status_indicators': list(metrics.get('status_indicators', [])),
+            'panel_titles': list(metrics.get('panel_titles', [])),
+            'panels': panels,
+            'raw_text_length': len(data.get('raw_text', ''))
+        }
+    
     def _write_data_to_txt(self, file, data):
         """Write single data entry to text file"""
         # Basic information
@@ -243,6 +320,7 @@ class ReportGenerator:
                     for title in sorted(dashboard_titles):
                         f.write(f"  - {title}\n")
             
+            self._record(filepath, processed_data_list)
             return filepath
         except Exception as e:
             print(f"Error generating summary report: {e}")
@@ -0,0 +1,187 @@
+import math
+from datetime import datetime
+from config import Config
+from storage import connect_database, prepare_database
+from columnar_writer import to_float
+from report_catalog import HEALTH_SEVERITY
+
+PERIODS = ('day', 'week')
+
+def bucket_for(period, when):
+    """Bucket key for a timestamp: '2024-05-06' for days, '2024-W19' for ISO weeks"""
+    if period == 'day':
+        return when.strftime('%Y-%m-%d')
+    year, week, _ = when.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def metric_value(value):
+    """A reported value as a finite float, or None; NaN/inf would violate the rollup columns"""
+    number = to_float(value)
+    return number if number is not None and math.isfinite(number) else None
+
+def describe_analysis(result):
+    """Reduce an OCR or LLM result to (dashboard, health, alert count, {metric: [values]})"""
+    metric_values = {}
+
+    if 'dashboard_overview' in result or 'health_status' in result:
+        # LLM analysis: scalar metrics summary plus explicit health and alerts
+        dashboard = result.get('dashboard_overview', {}).get('title') or 'Unknown'
+        health = str(result.get('health_status') or 'UNKNOWN').upper()
+        alert_count = len(result.get('alerts', []))
+        for name, value in result.get('metrics', {}).items():
+            number = metric_value(value)
+            if number is not None:
+                metric_values[name] = [number]
+        return dashboard, health, alert_count, metric_values
+
+    # OCR result: health is the worst status indicator, alerts are the unhealthy ones
+    metrics = result.get('metrics', {})
+    dashboard = metrics.get('dashboard_title') or 'Unknown'
+    statuses = [str(status).upper() for status in metrics.get('status_indicators', [])]
+    known = [status for status in statuses if status in HEALTH_SEVERITY]
+    health = max(known, key=HEALTH_SEVERITY.get) if known else 'UNKNOWN'
+    alert_count = sum(1 for status in known if HEALTH_SEVERITY[status] >= HEALTH_SEVERITY['DOWN'])
+    percentages = [number for number in (metric_value(p) for p in metrics.get('percentages', [])) if number is not None]
+    if percentages:
+        metric_values['percentage'] = percentages
+    return dashboard, health, alert_count, metric_values
+
+class MetricRollups:
+    """Daily and weekly per-dashboard aggregates, updated incrementally as analyses land"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.ROLLUP_DB_PATH
+        prepare_database(self.db_path)
+        self._init_db()
+
+    def _init_db(self):
+        """Create the rollup tables"""
+        conn = connect_database(self.db_path)
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rollup_dashboards (
+                    period TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    dashboard TEXT NOT NULL,
+                    analyses INTEGER NOT NULL DEFAULT 0,
+                    alerts INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (period, bucket, dashboard)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rollup_health (
+                    period TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    dashboard TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (period, bucket, dashboard, status)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rollup_metrics (
+                    period TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    dashboard TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    total REAL NOT NULL,
+                    min_value REAL NOT NULL,
+                    max_value REAL NOT NULL,
+                    PRIMARY KEY (period, bucket, dashboard, metric)
+                )
+            """)
+        finally:
+            conn.close()
+
+    def record(self, result, when=None):
+        """Fold one analysis into the day and week buckets it belongs to"""
+        try:
+            when = when or datetime.now()
+            dashboard, health, alert_count, metric_values = describe_analysis(result)
+
+            conn = connect_database(self.db_path)
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for period in PERIODS:
+                    key = (period, bucket_for(period, when), dashboard)
+                    conn.execute(
+                        """
+                        INSERT INTO rollup_dashboards (period, bucket, dashboard, analyses, alerts)
+                        VALUES (?, ?, ?, 1, ?)
+                        ON CONFLICT (period, bucket, dashboard)
+                        DO UPDATE SET analyses = analyses + 1, alerts = alerts + excluded.alerts
+                        """,
+                        key + (alert_count,)
+                    )
+                    conn.execute(
+                        """
+                        INSERT INTO rollup_health (period, bucket, dashboard, status, count)
+                        VALUES (?, ?, ?, ?, 1)
+                        ON CONFLICT (period, bucket, dashboard, status) DO UPDATE SET count = count + 1
+                        """,
+                        key + (health,)
+                    )
+                    for metric, values in metric_values.items():
+                        conn.execute(
+                            """
+                            INSERT INTO rollup_metrics
+                                (period, bucket, dashboard, metric, count, total, min_value, max_value)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                            ON CONFLICT (period, bucket, dashboard, metric) DO UPDATE SET
+                                count = count + excluded.count,
+                                total = total + excluded.total,
+                                min_value = MIN(min_value, excluded.min_value),
+                                max_value = MAX(max_value, excluded.max_value)
+                            """,
+                            key + (metric, len(values), sum(values), min(values), max(values))
+                        )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Error updating rollups: {e}")
+
+    def get_rollup(self, period, when=None):
+        """Read the aggregates of one day or week bucket, keyed by dashboard"""
+        bucket = bucket_for(period, when or datetime.now())
+        dashboards = {}
+
+        conn = connect_database(self.db_path)
+        try:
+            for row in conn.execute(
+                    "SELECT dashboard, analyses, alerts FROM rollup_dashboards WHERE period = ? AND bucket = ?",
+                    (period, bucket)):
+                dashboards[row['dashboard']] = {
+                    'analyses': row['analyses'],
+                    'alerts': row['alerts'],
+                    'health': {},
+                    'metrics': {}
+                }
+            for row in conn.execute(
+                    "SELECT dashboard, status, count FROM rollup_health WHERE period = ? AND bucket = ?",
+                    (period, bucket)):
+                if row['dashboard'] in dashboards:
+                    dashboards[row['dashboard']]['health'][row['status']] = row['count']
+            for row in conn.execute(
+                    "SELECT * FROM rollup_metrics WHERE period = ? AND bucket = ?", (period, bucket)):
+                if row['dashboard'] in dashboards:
+                    dashboards[row['dashboard']]['metrics'][row['metric']] = {
+                        'count': row['count'],
+                        'min': row['min_value'],
+                        'max': row['max_value'],
+                        'mean': row['total'] / row['count']
+                    }
+        finally:
+            conn.close()
+
+        return {
+            'period': period,
+            'bucket': bucket,
+            'total_analyses': sum(d['analyses'] for d in dashboards.values()),
+            'total_alerts': sum(d['alerts'] for d in dashboards.values()),
+            'dashboards': dashboards
+        }
@@ -1,9 +1,13 @@
 import schedule
+import threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 from grafana_client import GrafanaClient
+from dashboard_cache import DashboardMetadataCache, diff_dashboards
 from report_generator import ReportGenerator
+from rollups import MetricRollups
+from config import Config
 
 class GrafanaScheduler:
     """Automated scheduler for Grafana monitoring"""
@@ -11,6 +15,11 @@ class GrafanaScheduler:
     def __init__(self):
         self.grafana_client = GrafanaClient()
         self.report_generator = ReportGenerator()
+        self.rollups = MetricRollups()
+        # Last collected dashboard list lives next to the metadata cache
+        self.dashboard_state = self.grafana_client.metadata_cache or DashboardMetadataCache()
+        self.render_pipeline = None
+        self._render_thread = None
         self.is_running = False
     
     def schedule_monitoring(self):
@@ -19,24 +28,43 @@ class GrafanaScheduler:
         schedule.every(1).hours.do(self.collect_dashboard_info)
         schedule.every(1).days.do(self.generate_daily_report)
         schedule.every().monday.at("09:00").do(self.generate_weekly_report)
+        if Config.SCHEDULED_RENDER_ENABLED:
+            schedule.every(Config.RENDER_INTERVAL_MINUTES).minutes.do(self.render_dashboard_panels)
         
         print("Monitoring scheduler started...")
         print("- Dashboard info collection: Every hour")
         print("- Daily reports: Every day")
         print("- Weekly reports: Every Monday at 9:00 AM")
+        if Config.SCHEDULED_RENDER_ENABLED:
+            print(f"- Panel rendering and analysis: Every {Config.RENDER_INTERVAL_MINUTES} minutes")
     
     def collect_dashboard_info(self):
         """Collect dashboard information"""
         try:
             print(f"[{datetime.now()}] Collecting dashboard information...")
             
-            dashboards = self.grafana_client.get_dashboards()
+            # Bypass the search TTL so the hourly diff sees the current state
+            dashboards = self.grafana_client.search_dashboards(use_cache=False)
+            if dashboards is None:
+                print("Dashboard search failed; skipping this collection")
+                return
+            
+            # Store only what changed since the previous collection
+            previous = self.dashboard_state.load_snapshot('dashboard_list')
+            diff = diff_dashboards(previous or [], dashboards)
+            
+            if previous is not None and not any(diff.values()):
+                print("No dashboard changes since the last collection")
+                return
             
             # Create a summary report
             summary_data = {
                 'collected_at': datetime.now().isoformat(),
                 'total_dashboards': len(dashboards),
-                'dashboards': dashboards
+                'baseline': previous is None,
+                'added': diff['added'],
+                'removed': diff['removed'],
+                'changed': diff['changed']
             }
             
             # Generate JSON report
@@ -44,43 +72,104 @@ class GrafanaScheduler:
             filename = f"dashboard_summary_{timestamp}.json"
             
             self.report_generator.generate_json_report(summary_data, filename)
+            self.dashboard_state.save_snapshot('dashboard_list', dashboards)
             print(f"Dashboard summary saved: {filename}")
             
         except Exception as e:
             print(f"Error collecting dashboard info: {e}")
     
+    def _get_render_pipeline(self):
+        """Build the render pipeline on first use; it loads the OCR/LLM analyzers"""
+        if self.render_pipeline is None:
+            from batch_executor import BatchExecutor
+            from render_pipeline import PanelRenderPipeline
+            from llm_report_generator import LLMReportGenerator
+            
+            image_processor = openai_processor = None
+            batch_runner = hybrid_processor = None
+            if Config.RENDER_PROCESSING_METHOD == 'hybrid':
+                from openai_processor import OpenAIProcessor
+                from hybrid_router import HybridProcessor
+                openai_processor = OpenAIProcessor()
+                hybrid_processor = HybridProcessor(openai_processor)
+            elif Config.RENDER_PROCESSING_METHOD == 'llm':
+                from openai_processor import OpenAIProcessor
+                openai_processor = OpenAIProcessor()
+                if Config.OPENAI_BATCH_ENABLED:
+                    from batch_api import BatchAnalysisRunner
+                    batch_runner = BatchAnalysisRunner(openai_processor)
+            else:
+                from image_processor import ImageProcessor
+                image_processor = ImageProcessor()
+            
+            self.render_pipeline = PanelRenderPipeline(
+                self.grafana_client,
+                BatchExecutor(),
+                self.report_generator,
+                LLMReportGenerator(self.report_generator.catalog),
+                image_processor=image_processor,
+                openai_processor=openai_processor,
+                rollups=self.rollups,
+                batch_runner=batch_runner,
+                hybrid_processor=hybrid_processor
+            )
+        return self.render_pipeline
+    
+    def render_dashboard_panels(self):
+        """Render every dashboard panel, analyze the images and write one consolidated report"""
+        if not (Config.OPENAI_BATCH_ENABLED and Config.RENDER_PROCESSING_METHOD == 'llm'):
+            self._render_dashboard_panels()
+            return
+        
+        # Batch jobs can take hours; wait for them off the scheduling loop
+        if self._render_thread and self._render_thread.is_alive():
+            print(f"[{datetime.now()}] Previous panel analysis batch still running, skipping this run")
+            return
+        self._render_thread = threading.Thread(target=self._render_dashboard_panels, name='render-batch', daemon=True)
+        self._render_thread.start()
+    
+    def _render_dashboard_panels(self):
+        """Run the render pipeline once and log where the report went"""
+        try:
+            print(f"[{datetime.now()}] Rendering dashboard panels...")
+            
+            report_path = self._get_render_pipeline().run()
+            if report_path:
+                print(f"Panel analysis report saved: {os.path.basename(report_path)}")
+            else:
+                print("No panels could be rendered and analyzed")
+            
+        except Exception as e:
+            print(f"Error rendering dashboard panels: {e}")
+    
     def generate_daily_report(self):
         """Generate daily monitoring report"""
         try:
             print(f"[{datetime.now()}] Generating daily report...")
             
-            # Check if we have any processed data from today
+            # Aggregates were folded in as each analysis landed; nothing is reread here
             output_folder = self.report_generator.output_folder
-            today = datetime.now().strftime('%Y-%m-%d')
+            catalog = self.report_generator.catalog
+            rollup = self.rollups.get_rollup('day')
+            day_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            _, report_count = catalog.list_reports(start=day_start, end=day_start + timedelta(days=1), limit=0)
             
-            daily_files = []
-            if os.path.exists(output_folder):
-                for filename in os.listdir(output_folder):
-                    if today in filename and filename.endswith('.json'):
-                        daily_files.append(filename)
-            
-            if daily_files:
+            if rollup['total_analyses'] or report_count:
                 # Create daily summary
-                summary_content = f"Daily Grafana Monitoring Report - {today}\n"
+                summary_content = f"Daily Grafana Monitoring Report - {rollup['bucket']}\n"
                 summary_content += "=" * 50 + "\n\n"
                 summary_content += f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                summary_content += f"Files processed today: {len(daily_files)}\n\n"
-                
-                for filename in daily_files:
-                    summary_content += f"- {filename}\n"
+                summary_content += f"Reports generated today: {report_count}\n"
+                summary_content += self._format_rollup(rollup)
                 
                 # Save daily summary
-                daily_filename = f"daily_summary_{today}.txt"
+                daily_filename = f"daily_summary_{rollup['bucket']}.txt"
                 daily_path = os.path.join(output_folder, daily_filename)
                 
                 with open(daily_path, 'w', encoding='utf-8') as f:
                     f.write(summary_content)
                 
+                catalog.record(daily_path, kind='daily_summary')
                 print(f"Daily report saved: {daily_filename}")
             else:
                 print("No data to include in daily report")
@@ -93,40 +182,57 @@ class GrafanaScheduler:
         try:
             print(f"[{datetime.now()}] Generating weekly report...")
             
-            # Similar to daily report but for the week
+            # Runs on Monday morning, so summarize the ISO week that just ended
             output_folder = self.report_generator.output_folder
-            week_start = datetime.now().strftime('%Y-%m-%d')
+            catalog = self.report_generator.catalog
+            rollup = self.rollups.get_rollup('week', datetime.now() - timedelta(days=7))
             
-            weekly_content = f"Weekly Grafana Monitoring Report - Week of {week_start}\n"
+            weekly_content = f"Weekly Grafana Monitoring Report - Week {rollup['bucket']}\n"
             weekly_content += "=" * 60 + "\n\n"
             weekly_content += f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
             
-            # Count files from the past week
-            if os.path.exists(output_folder):
-                all_files = os.listdir(output_folder)
-                weekly_content += f"Total files in output folder: {len(all_files)}\n"
-                
-                # Group by file type
-                csv_files = [f for f in all_files if f.endswith('.csv')]
-                txt_files = [f for f in all_files if f.endswith('.txt')]
-                json_files = [f for f in all_files if f.endswith('.json')]
-                
-                weekly_content += f"CSV reports: {len(csv_files)}\n"
-                weekly_content += f"TXT reports: {len(txt_files)}\n"
-                weekly_content += f"JSON reports: {len(json_files)}\n\n"
+            # Count reports from the past week, grouped by file type, from the catalog
+            format_counts = catalog.count_by_format(start=datetime.now() - timedelta(days=7))
+            weekly_content += f"Total reports this week: {sum(format_counts.values())}\n"
+            
+            weekly_content += f"CSV reports: {format_counts.get('csv', 0)}\n"
+            weekly_content += f"TXT reports: {format_counts.get('txt', 0)}\n"
+            weekly_content += f"JSON reports: {format_counts.get('json', 0)}\n"
+            weekly_content += self._format_rollup(rollup)
             
             # Save weekly summary
-            weekly_filename = f"weekly_summary_{week_start}.txt"
+            weekly_filename = f"weekly_summary_{rollup['bucket']}.txt"
             weekly_path = os.path.join(output_folder, weekly_filename)
             
             with open(weekly_path, 'w', encoding='utf-8') as f:
                 f.write(weekly_content)
             
+            catalog.record(weekly_path, kind='weekly_summary')
             print(f"Weekly report saved: {weekly_filename}")
             
         except Exception as e:
             print(f"Error generating weekly report: {e}")
     
+    def _format_rollup(self, rollup):
+        """Render per-dashboard health, alert and metric aggregates as text"""
+        content = f"Dashboards analyzed: {len(rollup['dashboards'])}\n"
+        content += f"Total analyses: {rollup['total_analyses']}\n"
+        content += f"Total alerts: {rollup['total_alerts']}\n\n"
+        
+        for dashboard, stats in sorted(rollup['dashboards'].items()):
+            content += f"{dashboard}\n"
+            content += "-" * 30 + "\n"
+            content += f"  Analyses: {stats['analyses']}\n"
+            content += f"  Alerts: {stats['alerts']}\n"
+            health = ', '.join(f"{status}: {count}" for status, count in sorted(stats['health'].items()))
+            content += f"  Health: {health}\n"
+            for metric, values in sorted(stats['metrics'].items()):
+                content += (f"  {metric}: min {values['min']:.2f}, max {values['max']:.2f}, "
+                            f"mean {values['mean']:.2f} ({values['count']} samples)\n")
+            content += "\n"
+        
+        return content
+    
     def run(self):
         """Run the scheduler"""
         self.is_running = True
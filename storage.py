@@ -0,0 +1,33 @@
+import os
+import sqlite3
+import threading
+
+def prepare_database(db_path):
+    """Create the database's folder and switch it to WAL so the app and scheduler process can share it"""
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = connect_database(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+    finally:
+        conn.close()
+
+def connect_database(db_path):
+    """Open a connection; callers use one per operation so threads never share one"""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def atomic_write(path, data):
+    """Write str or bytes via a temporary file and os.replace so readers never see a partial file"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    mode, encoding = ('wb', None) if isinstance(data, bytes) else ('w', 'utf-8')
+    try:
+        with open(tmp_path, mode, encoding=encoding) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,284 @@
+import json
+import math
+import re
+import threading
+
+def _nullable(schema_type):
+    return {'type': [schema_type, 'null']}
+
+# The structure get_system_prompt describes, as a strict JSON schema: every
+# property is required (unknown values are null) and nothing else is allowed.
+DASHBOARD_ANALYSIS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'dashboard_overview': {
+            'type': 'object',
+            'properties': {
+                'title': {'type': 'string'},
+                'time_range': {'type': 'string'},
+                'panel_count': {'type': 'integer'},
+                'theme': {'type': 'string'}
+            },
+            'required': ['title', 'time_range', 'panel_count', 'theme'],
+            'additionalProperties': False
+        },
+        'panels': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'title': {'type': 'string'},
+                    'type': {'type': 'string'},
+                    'current_value': _nullable('number'),
+                    'unit': {'type': 'string'},
+                    'status': {'type': 'string', 'enum': ['OK', 'WARNING', 'CRITICAL', 'UNKNOWN']},
+                    'threshold': _nullable('number')
+                },
+                'required': ['title', 'type', 'current_value', 'unit', 'status', 'threshold'],
+                'additionalProperties': False
+            }
+        },
+        'metrics': {
+            'type': 'object',
+            'properties': {
+                'cpu_usage': _nullable('number'),
+                'memory_usage': _nullable('number'),
+                'disk_usage': _nullable('number'),
+                'network_in': _nullable('number'),
+                'network_out': _nullable('number')
+            },
+            'required': ['cpu_usage', 'memory_usage', 'disk_usage', 'network_in', 'network_out'],
+            'additionalProperties': False
+        },
+        # Everything else the dashboard shows (latency, error rate, request counts, ...); the strict
+        # schema can't allow free-form keys in 'metrics', so they come back as a list
+        'other_metrics': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'name': {'type': 'string'},
+                    'value': _nullable('number'),
+                    'unit': {'type': 'string'}
+                },
+                'required': ['name', 'value', 'unit'],
+                'additionalProperties': False
+            }
+        },
+        'health_status': {'type': 'string', 'enum': ['HEALTHY', 'WARNING', 'CRITICAL', 'UNKNOWN']},
+        'alerts': {'type': 'array', 'items': {'type': 'string'}},
+        'insights': {'type': 'array', 'items': {'type': 'string'}}
+    },
+    'required': ['dashboard_overview', 'panels', 'metrics', 'other_metrics', 'health_status', 'alerts', 'insights'],
+    'additionalProperties': False
+}
+
+# Fields an answer must have to be trusted; other_metrics is optional outside strict mode
+CORE_FIELDS = ['dashboard_overview', 'panels', 'metrics', 'health_status', 'alerts', 'insights']
+TYPED_METRICS = tuple(DASHBOARD_ANALYSIS_SCHEMA['properties']['metrics']['properties'])
+
+FENCE_PATTERN = re.compile(r'```(?:json|JSON)?\s*(.*?)```', re.DOTALL)
+
+def response_format(mode):
+    """response_format request parameter for a structured output mode ('json_schema', 'json_object' or 'off')"""
+    if mode == 'json_schema':
+        return {
+            'type': 'json_schema',
+            'json_schema': {'name': 'dashboard_analysis', 'strict': True, 'schema': DASHBOARD_ANALYSIS_SCHEMA}
+        }
+    if mode == 'json_object':
+        return {'type': 'json_object'}
+    return None
+
+def metric_name_key(name):
+    """snake_case metrics key for a displayed metric name ('Request Latency p95' -> 'request_latency_p95')"""
+    return re.sub(r'[^a-z0-9]+', '_', str(name).lower()).strip('_')
+
+def merge_other_metrics(analysis):
+    """Fold other_metrics items into the metrics dict, so reports and rollups see them like the typed ones"""
+    metrics = analysis.get('metrics')
+    if not isinstance(metrics, dict):
+        return analysis
+    for item in analysis.get('other_metrics') or []:
+        if not isinstance(item, dict) or not _is_number(item.get('value')):
+            continue
+        key = metric_name_key(item.get('name', ''))
+        if key:
+            metrics.setdefault(key, item['value'])
+    return analysis
+
+def extract_json(text):
+    """First JSON object in a model answer, tolerating markdown fences and surrounding chatter"""
+    if not text:
+        return None
+    candidates = [match.group(1) for match in FENCE_PATTERN.finditer(text)] + [text]
+    decoder = json.JSONDecoder()
+    for candidate in candidates:
+        start = candidate.find('{')
+        while start != -1:
+            try:
+                value, _ = decoder.raw_decode(candidate, start)
+                if isinstance(value, dict):
+                    return value
+            except ValueError:
+                pass
+            start = candidate.find('{', start + 1)
+    return None
+
+class ParseStats:
+    """Thread-safe counters of how model answers were parsed"""
+
+    OUTCOMES = ('parsed', 'recovered', 'refused', 'failed')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.OUTCOMES, 0)
+
+    def record(self, outcome):
+        """Count one answer: parsed directly, recovered by extract_json, refused, or failed"""
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def get_stats(self):
+        """Get outcome counts and the share of answers that could not be used"""
+        with self._lock:
+            total = sum(self.counts.values())
+            failures = self.counts['refused'] + self.counts['failed']
+            return {
+                **self.counts,
+                'total': total,
+                'failure_rate': failures / total if total else 0.0
+            }
+
+def parse_partial_json(text):
+    """Best-effort parse of a JSON object that is still streaming in"""
+    # Open strings, arrays and objects are closed; a dangling key, number or
+    # literal is dropped by cutting back to the last comma or opening bracket.
+    start = text.find('{') if text else -1
+    if start == -1:
+        return None
+    text = text[start:]
+    closers = []
+    in_string = escape = False
+    safe_end, safe_closers = 1, '}'
+    for position, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            closers.append('}' if char == '{' else ']')
+            safe_end, safe_closers = position + 1, ''.join(reversed(closers))
+        elif char in '}]':
+            if closers:
+                closers.pop()
+            if not closers:
+                text = text[:position + 1]
+                break
+            safe_end, safe_closers = position + 1, ''.join(reversed(closers))
+        elif char == ',':
+            safe_end, safe_closers = position, ''.join(reversed(closers))
+
+    attempts = [text[:safe_end] + safe_closers]
+    # Closing as-is would turn '{"a": 12' (maybe 125 later) into a final-looking 12
+    if not closers or in_string or text.rstrip()[-1] in '"}]':
+        candidate = text
+        if in_string:
+            candidate = (candidate[:-1] if escape else candidate) + '"'
+        attempts.insert(0, candidate + ''.join(reversed(closers)))
+    for attempt in attempts:
+        try:
+            value = json.loads(attempt)
+            if isinstance(value, dict):
+                return value
+        except ValueError:
+            pass
+    return None
+
+# Usage metrics that are percentages of a fixed capacity
+PERCENT_METRICS = ('memory_usage', 'disk_usage')
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def analysis_problems(analysis):
+    """Reasons an analysis can't be trusted as-is (empty list when it looks complete and sane)"""
+    if not isinstance(analysis, dict):
+        return ['not_an_object']
+    if 'parsing_error' in analysis:
+        return ['unparseable']
+
+    problems = [f"missing_{key}" for key in CORE_FIELDS if key not in analysis]
+    overview = analysis.get('dashboard_overview')
+    panels = analysis.get('panels')
+    if not isinstance(panels, list) or not panels:
+        problems.append('no_panels')
+        panels = []
+    if isinstance(overview, dict) and overview.get('panel_count') != len(panels):
+        problems.append('panel_count_mismatch')
+
+    statuses = DASHBOARD_ANALYSIS_SCHEMA['properties']['panels']['items']['properties']['status']['enum']
+    for panel in panels:
+        if not isinstance(panel, dict):
+            problems.append('invalid_panel')
+            continue
+        value = panel.get('current_value')
+        if value is not None and not _is_number(value):
+            problems.append('non_numeric_value')
+        elif value is not None and panel.get('unit') == '%' and value < 0:
+            problems.append('negative_percentage')
+        if panel.get('threshold') is not None and not _is_number(panel['threshold']):
+            problems.append('non_numeric_threshold')
+        if panel.get('status') not in statuses:
+            problems.append('invalid_status')
+
+    metrics = analysis.get('metrics')
+    for name, value in (metrics.items() if isinstance(metrics, dict) else []):
+        if value is None:
+            continue
+        if not _is_number(value):
+            problems.append(f"non_numeric_{name}")
+        # Only the usage figures have a known range; other metrics (e.g. temperatures) may be negative
+        elif (name in TYPED_METRICS and value < 0) or (name in PERCENT_METRICS and value > 100):
+            problems.append(f"out_of_range_{name}")
+
+    # One entry per kind of problem keeps the stats readable
+    return list(dict.fromkeys(problems))
+
+class CascadeStats:
+    """Thread-safe counts of analyses answered by each cascade tier and why they escalated"""
+
+    def __init__(self, models):
+        self.models = list(models)
+        self._lock = threading.Lock()
+        self.answered = dict.fromkeys(self.models, 0)
+        self.escalations = 0
+        self.problems = {}
+
+    def record(self, answered_by, escalation_problems):
+        """Count one analysis: the tier whose answer was kept and the problems of every tier it left"""
+        with self._lock:
+            self.answered[answered_by] = self.answered.get(answered_by, 0) + 1
+            for problems in escalation_problems:
+                self.escalations += 1
+                for problem in problems:
+                    self.problems[problem] = self.problems.get(problem, 0) + 1
+
+    def get_stats(self):
+        """Get per-tier counts and the share of analyses that needed a larger model"""
+        with self._lock:
+            total = sum(self.answered.values())
+            first = self.answered.get(self.models[0], 0) if self.models else 0
+            return {
+                'models': self.models,
+                'analyses': total,
+                'answered_by': dict(self.answered),
+                'escalations': self.escalations,
+                'escalation_rate': (total - first) / total if total else 0.0,
+                'problems': dict(sorted(self.problems.items(), key=lambda item: -item[1]))
+            }
@@ -0,0 +1,34 @@
+import csv
+
+class StreamingCSVWriter:
+    """Append report rows to a CSV file as they are produced, using a fixed column schema"""
+
+    def __init__(self, filepath, columns, row_builder=None, on_close=None):
+        self.filepath = filepath
+        self.columns = list(columns)
+        self.row_builder = row_builder
+        self.on_close = on_close
+        self.rows_written = 0
+        self._file = open(filepath, 'w', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore')
+        self._writer.writeheader()
+
+    def write(self, record):
+        """Convert a record to a row (if a builder was given) and append it"""
+        row = self.row_builder(record) if self.row_builder else record
+        self._writer.writerow(row)
+        self.rows_written += 1
+
+    def close(self):
+        """Flush and close the file"""
+        if not self._file.closed:
+            self._file.close()
+            if self.on_close:
+                self.on_close(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,56 @@
+import io
+
+from PIL import Image
+
+import analysis_cache
+import openai_processor
+from analysis_cache import AnalysisCache
+from config import Config
+
+def solid_png(colour):
+    buffer = io.BytesIO()
+    Image.new('RGB', (320, 200), colour).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+def test_memory_tier_evicts_the_least_recently_used_entry(tmp_path):
+    cache = AnalysisCache(cache_dir=str(tmp_path), memory_entries=2, ttl=0)
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    assert cache.get('a') == {'n': 1}
+    cache.put('c', {'n': 3})
+
+    assert list(cache._memory) == ['a', 'c']
+    assert cache.get_stats()['memory_entries'] == 2
+    # The evicted entry is still served from disk
+    assert cache.get('b') == {'n': 2}
+
+def test_disk_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(analysis_cache.time, 'time', lambda: now[0])
+    AnalysisCache(cache_dir=str(tmp_path), ttl=60).put('key', {'n': 1})
+
+    # A fresh instance has an empty memory tier, so lookups go to disk
+    cache = AnalysisCache(cache_dir=str(tmp_path), ttl=60)
+    now[0] += 30
+    assert cache.get('key') == {'n': 1}
+
+    cache = AnalysisCache(cache_dir=str(tmp_path), ttl=60)
+    now[0] += 60
+    assert cache.get('key') is None
+    assert cache.get_stats()['disk_bytes'] == 0
+
+def test_different_blank_dashboards_do_not_share_an_analysis(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(Config, 'ANALYSIS_CACHE_FOLDER', str(tmp_path))
+    monkeypatch.setattr(Config, 'USAGE_LEDGER_ENABLED', False)
+    monkeypatch.setattr(Config, 'PHASH_ENABLED', True)
+    processor = openai_processor.OpenAIProcessor()
+
+    red = processor.prepare_analysis_request(solid_png('red'))
+    processor.finish_analysis(red, {'health_status': 'CRITICAL'})
+    blue = processor.prepare_analysis_request(solid_png('blue'))
+
+    assert 'cached' not in blue
+    assert processor.phash_index.get_stats()['low_detail'] == 2
+    # The same blank dashboard again is still an exact cache hit
+    assert processor.prepare_analysis_request(solid_png('red'))['cached']['health_status'] == 'CRITICAL'
@@ -0,0 +1,153 @@
+import json
+import os
+
+from batch_api import BatchAnalysisRunner
+from usage_ledger import BudgetExceededError
+
+class StubProcessor:
+    """Stands in for OpenAIProcessor: images are strings, 'cached:x' hits the cache, 'skip' fails to encode"""
+
+    model = 'gpt-4o'
+    cascade_models = ['gpt-4o-mini', 'gpt-4o']
+
+    def __init__(self, usage_ledger=None):
+        self.usage_ledger = usage_ledger
+        self.completed = []
+
+    def prepare_analysis_request(self, image, additional_context="", model=None):
+        if image == 'skip':
+            return None
+        if image.startswith('cached:'):
+            return {'cached': {'image': image, 'cached': True}}
+        return {'model': model, 'image': image, 'body': {'model': model, 'messages': [{'role': 'user', 'content': image}]}}
+
+    def complete_analysis(self, request, text, refusal=None, call=None):
+        self.completed.append(call)
+        return {'image': request['image'], 'text': text, 'model': call['model']}
+
+class StubBackend:
+    """Records submitted JSONL files and answers them with `respond(custom_id, body)` once polled"""
+
+    def __init__(self, respond=None, complete=True):
+        self.respond = respond or (lambda custom_id, body: ('output', reply(custom_id, body)))
+        self.complete = complete
+        self.submitted = {}
+        self.cancelled = []
+        self.files = {}
+
+    def submit(self, jsonl_path, endpoint='/v1/chat/completions'):
+        with open(jsonl_path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        batch_id = f"batch_{len(self.submitted)}"
+        self.submitted[batch_id] = lines
+        output, errors = [], []
+        # Answer in reverse so results can only line up through custom_id
+        for line in reversed(lines):
+            kind, item = self.respond(line['custom_id'], line['body'])
+            (output if kind == 'output' else errors).append(json.dumps(item))
+        self.files[f"{batch_id}_out"] = '\n'.join(output)
+        self.files[f"{batch_id}_err"] = '\n'.join(errors)
+        return batch_id
+
+    def poll(self, batch_id):
+        if not self.complete:
+            return {'status': 'in_progress', 'output_file_id': None, 'error_file_id': None}
+        return {'status': 'completed', 'output_file_id': f"{batch_id}_out",
+                'error_file_id': f"{batch_id}_err" if self.files[f"{batch_id}_err"] else None}
+
+    def download(self, file_id):
+        return self.files[file_id]
+
+    def cancel(self, batch_id):
+        self.cancelled.append(batch_id)
+
+def reply(custom_id, body, status_code=200):
+    content = body['messages'][0]['content']
+    return {'custom_id': custom_id, 'error': None, 'response': {
+        'status_code': status_code,
+        'body': {'model': f"{body['model']}-2024-07-18",
+                 'choices': [{'message': {'content': f"analysis of {content}", 'refusal': None}}],
+                 'usage': {'prompt_tokens': 100, 'completion_tokens': 20}}
+    }}
+
+def make_runner(tmp_path, backend, processor=None, **kwargs):
+    return BatchAnalysisRunner(processor or StubProcessor(), backend=backend, work_dir=str(tmp_path),
+                               poll_interval=0.01, **kwargs)
+
+def test_results_map_back_to_images_by_custom_id(tmp_path):
+    processor = StubProcessor()
+    backend = StubBackend()
+    runner = make_runner(tmp_path, backend, processor)
+
+    results = runner.run(['a', 'cached:b', 'skip', 'c'])
+
+    assert [result and result['image'] for result in results] == ['a', 'cached:b', None, 'c']
+    assert results[0]['text'] == 'analysis of a'
+    assert results[3]['text'] == 'analysis of c'
+    assert results[1]['cached'] is True
+    # Only the uncached, encodable images were sent, to the final cascade tier
+    lines = backend.submitted['batch_0']
+    assert [line['body']['messages'][0]['content'] for line in lines] == ['a', 'c']
+    assert {line['body']['model'] for line in lines} == {'gpt-4o'}
+    assert all(call['batch'] and call['prompt_tokens'] == 100 for call in processor.completed)
+    # Request files hold the encoded images and are removed once submitted
+    assert os.listdir(tmp_path) == []
+
+def test_requests_split_at_request_count_and_size_limits(tmp_path):
+    backend = StubBackend()
+    runner = make_runner(tmp_path, backend)
+    runner.max_requests = 2
+
+    results = runner.run([f"img{i}" for i in range(5)])
+
+    assert [len(lines) for lines in backend.submitted.values()] == [2, 2, 1]
+    assert [result['image'] for result in results] == [f"img{i}" for i in range(5)]
+
+    backend = StubBackend()
+    runner = make_runner(tmp_path, backend)
+    line_size = len(json.dumps({'custom_id': 'x' * 30, 'method': 'POST', 'url': '/v1/chat/completions',
+                                'body': {'model': 'gpt-4o', 'messages': [{'role': 'user', 'content': 'img0'}]}}))
+    runner.max_bytes = line_size * 2
+    runner.run([f"img{i}" for i in range(4)])
+
+    assert len(backend.submitted) >= 2
+    assert sum(len(lines) for lines in backend.submitted.values()) == 4
+
+def test_timeout_cancels_unfinished_batches(tmp_path):
+    backend = StubBackend(complete=False)
+    runner = make_runner(tmp_path, backend, timeout=0.05)
+
+    results = runner.run(['a', 'b'])
+
+    assert results == [None, None]
+    assert backend.cancelled == ['batch_0']
+
+def test_error_file_and_failed_lines_leave_only_those_images_empty(tmp_path):
+    def respond(custom_id, body):
+        content = body['messages'][0]['content']
+        if content == 'bad':
+            return 'error', {'custom_id': custom_id, 'response': None,
+                             'error': {'code': 'invalid_request', 'message': 'image too large'}}
+        if content == 'rate':
+            return 'output', reply(custom_id, body, status_code=429)
+        return 'output', reply(custom_id, body)
+
+    backend = StubBackend(respond)
+    runner = make_runner(tmp_path, backend)
+
+    results = runner.run(['a', 'bad', 'rate', 'b'])
+
+    assert [result and result['image'] for result in results] == ['a', None, None, 'b']
+    assert results[3]['model'] == 'gpt-4o-2024-07-18'
+
+def test_budget_exceeded_submits_nothing(tmp_path):
+    class ExhaustedLedger:
+        def check_budget(self):
+            raise BudgetExceededError("Daily LLM budget reached")
+
+    backend = StubBackend()
+    runner = make_runner(tmp_path, backend, StubProcessor(usage_ledger=ExhaustedLedger()))
+
+    assert runner.run(['a', 'cached:b']) == [None, {'image': 'cached:b', 'cached': True}]
+    assert backend.submitted == {}
+    assert os.listdir(tmp_path) == []
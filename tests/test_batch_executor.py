@@ -0,0 +1,28 @@
+from batch_executor import BatchExecutor, OrderedResultEmitter
+
+def failing_on(bad_index, delivered):
+    def on_result(index, result):
+        if index == bad_index:
+            raise IOError('report disk full')
+        delivered.append((index, result))
+    return on_result
+
+def test_a_failing_callback_fails_only_its_item():
+    for mode in ('serial', 'pool'):
+        delivered = []
+        executor = BatchExecutor(mode=mode, llm_workers=2)
+        try:
+            results = executor.process_llm_batch(lambda item: item * 10, [1, 2, 3],
+                                                 on_result=failing_on(1, delivered))
+        finally:
+            executor.shutdown()
+        assert results == [10, None, 30]
+        assert sorted(delivered) == [(0, 10), (2, 30)]
+
+def test_ordered_emitter_keeps_delivering_after_a_failing_callback():
+    delivered = []
+    emitter = OrderedResultEmitter(failing_on(0, delivered))
+    emitter(2, 'c')
+    emitter(1, 'b')
+    emitter(0, 'a')
+    assert delivered == [(1, 'b'), (2, 'c')]
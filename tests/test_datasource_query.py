@@ -0,0 +1,118 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import datasource_query
+from config import Config
+from grafana_client import GrafanaClient
+
+DASHBOARD = {
+    'dashboard': {
+        'uid': 'node',
+        'title': 'Node Exporter',
+        'templating': {'list': [
+            {'name': 'ds', 'type': 'datasource', 'current': {'value': 'prom-uid'}},
+            {'name': 'job', 'type': 'query', 'multi': True, 'current': {'value': ['node', 'api.v2']}},
+            {'name': 'instance', 'type': 'query', 'includeAll': True, 'current': {'value': '$__all'},
+             'options': [{'value': '$__all'}, {'value': 'host-a'}, {'value': 'host-b'}]},
+            {'name': 'env', 'type': 'custom', 'current': {'value': 'prod'}},
+            {'name': 'cluster', 'type': 'query', 'current': {}},
+        ]},
+        'panels': [
+            {'id': 1, 'title': 'CPU Usage', 'type': 'timeseries',
+             'datasource': {'type': 'prometheus', 'uid': '${ds}'},
+             'targets': [{'refId': 'A', 'expr': 'rate(cpu{job=~"$job",instance=~"${instance}",env="[[env]]"}[$__interval])'}]},
+            {'id': 2, 'title': 'Memory Usage', 'type': 'timeseries',
+             'datasource': {'type': 'prometheus', 'uid': '${ds}'},
+             'targets': [{'refId': 'A', 'expr': 'mem{cluster="$cluster"}'}]},
+        ]
+    }
+}
+
+def frame(value):
+    return {'schema': {'fields': [{'type': 'time'}, {'type': 'number', 'name': 'v'}]},
+            'data': {'values': [[1700000000000], [value]]}}
+
+class StubGrafana(BaseHTTPRequestHandler):
+    """Serves one dashboard model and records every /api/ds/query body"""
+
+    def do_GET(self):
+        if self.path == '/api/dashboards/uid/node':
+            self._send(200, DASHBOARD)
+        else:
+            self._send(404, {'message': 'not found'})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.queries.append(body)
+        self._send(200, {'results': {'A': {'frames': [frame(42.0)]}}})
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def grafana(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubGrafana)
+    server.queries = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(Config, 'GRAFANA_URL', f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(Config, 'DASHBOARD_CACHE_ENABLED', False)
+    monkeypatch.setattr(Config, 'GRAFANA_API_KEY', 'test-key')
+    monkeypatch.setattr(Config, 'GRAFANA_MAX_RETRIES', 0)
+    client = GrafanaClient()
+    yield client, server
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+def test_query_dashboard_interpolates_template_variables(grafana):
+    client, server = grafana
+    analysis = client.query_dashboard('node', time_from='now-6h', time_to='now', max_data_points=720)
+
+    assert len(server.queries) == 1
+    body = server.queries[0]
+    query = body['queries'][0]
+    assert query['expr'] == 'rate(cpu{job=~"(node|api\\.v2)",instance=~"(host-a|host-b)",env="prod"}[30s])'
+    assert query['datasource'] == {'type': 'prometheus', 'uid': 'prom-uid'}
+    assert query['intervalMs'] == 30000
+    assert (body['from'], body['to']) == ('now-6h', 'now')
+
+    cpu, memory = analysis['panels']
+    assert cpu['current_value'] == 42.0
+    assert 'error' not in cpu
+    assert memory['error'] == 'unresolved template variable $cluster'
+
+def test_unknown_dollar_names_are_left_alone():
+    variables = datasource_query.template_variables({}, 60000, 'now-1h', 'now')
+    expr = 'label_replace(up, "x", "$1", "job", "(.*)") [$__range] [$__rate_interval]'
+    assert datasource_query.interpolate(expr, variables, 'prometheus') == \
+        'label_replace(up, "x", "$1", "job", "(.*)") [1h] [$__rate_interval]'
+
+@pytest.mark.parametrize('fmt, expected', [
+    (None, "'a','b''c'"),
+    ('csv', "a,b'c"),
+    ('pipe', "a|b'c"),
+    ('json', '["a", "b\'c"]'),
+    ('doublequote', '"a","b\'c"'),
+])
+def test_multi_value_formats(fmt, expected):
+    variable = {'values': ['a', "b'c"], 'multi': True}
+    assert datasource_query.format_variable(variable, fmt, 'mysql') == expected
+
+def test_all_value_overrides_options():
+    dashboard = {'templating': {'list': [
+        {'name': 'host', 'includeAll': True, 'allValue': '.*', 'current': {'value': ['$__all']}}
+    ]}}
+    variables = datasource_query.template_variables(dashboard, 1000, 'now-1h', 'now')
+    assert datasource_query.interpolate('up{host=~"$host"}', variables, 'prometheus') == 'up{host=~".*"}'
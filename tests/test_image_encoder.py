@@ -0,0 +1,21 @@
+import pytest
+
+from image_encoder import estimate_image_tokens, patch_scaled_size
+
+@pytest.mark.parametrize('model, expected', [
+    ('gpt-4o', 85 + 170 * 4),
+    ('gpt-4o-2024-08-06', 85 + 170 * 4),
+    ('gpt-4o-mini', 2833 + 5667 * 4),
+    ('gpt-4o-mini-2024-07-18', 2833 + 5667 * 4),
+    ('gpt-4.1-mini', 1245),  # 32 x 24 patches x 1.62
+])
+def test_image_tokens_follow_each_models_vision_pricing(model, expected):
+    assert estimate_image_tokens(1024, 768, 'high', model) == expected
+
+def test_low_detail_costs_the_base_tokens():
+    assert estimate_image_tokens(1024, 768, 'low', 'gpt-4o') == 85
+    assert estimate_image_tokens(1024, 768, 'low', 'gpt-4o-mini') == 2833
+
+def test_patch_models_shrink_large_images_to_the_patch_cap():
+    assert patch_scaled_size(1800, 2400) == (1056, 1408)
+    assert estimate_image_tokens(4000, 3000, 'high', 'gpt-4.1-mini') <= 1536 * 1.62 + 1
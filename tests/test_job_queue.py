@@ -0,0 +1,81 @@
+import io
+import time
+
+from werkzeug.datastructures import FileStorage
+
+from analysis_events import AnalysisEventHub
+from job_queue import JobQueue
+from upload_store import UploadStore
+
+def wait_for_status(queue, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get_job(job_id)
+        if job['status'] in ('completed', 'failed'):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+def make_store(tmp_path):
+    return UploadStore(upload_folder=str(tmp_path / 'uploads'), in_memory=True, persist=False,
+                       spool_folder=str(tmp_path / 'spool'))
+
+def test_interrupted_job_is_requeued_and_finished_from_the_persisted_upload(tmp_path):
+    db_path = str(tmp_path / 'jobs.db')
+    store = make_store(tmp_path)
+    item = store.add(FileStorage(io.BytesIO(b'png bytes'), filename='dash.png'))
+    store._writer.shutdown(wait=True)
+
+    # The first process claimed the job and died mid-run
+    crashed = JobQueue(lambda *args: None, db_path=db_path)
+    job_id = crashed.enqueue({'files': [item]}, ['dash.png'])
+    assert crashed._claim_next()[0] == job_id
+    assert crashed.get_job(job_id)['status'] == 'running'
+
+    # A fresh store has no in-memory buffers, only the spooled copy on disk
+    restarted_store = make_store(tmp_path)
+
+    def handler(payload, progress, job_id):
+        source = restarted_store.get_source(payload['files'][0])
+        with open(source, 'rb') as f:
+            data = f.read()
+        progress(0, True)
+        return {'bytes': len(data)}
+
+    queue = JobQueue(handler, db_path=db_path, poll_interval=0.05,
+                     recover=lambda payload: None if not restarted_store.missing(payload['files']) else 'lost')
+    queue.start()
+    try:
+        job = wait_for_status(queue, job_id)
+    finally:
+        queue.stop()
+    assert job['status'] == 'completed'
+    assert job['result'] == {'bytes': len(b'png bytes')}
+    assert job['completed'] == 1
+
+def test_event_subscriber_replays_past_events_then_gets_done_after_the_status_is_stored(tmp_path):
+    events = AnalysisEventHub(retention=60)
+    statuses = []
+
+    def on_finish(job_id, status):
+        statuses.append(queue.get_job(job_id)['status'])
+        events.close(job_id)
+
+    def handler(payload, progress, job_id):
+        for index in range(2):
+            events.publish(job_id, 'result', {'index': index})
+            progress(index, True)
+        return {'report_file': 'report.csv'}
+
+    queue = JobQueue(handler, db_path=str(tmp_path / 'jobs.db'), poll_interval=0.05, on_finish=on_finish)
+    job_id = queue.enqueue({}, ['a.png', 'b.png'])
+    queue.start()
+    try:
+        wait_for_status(queue, job_id)
+    finally:
+        queue.stop()
+
+    # A late subscriber still sees every result, in order, and then the end of the stream
+    received = [(event, data) for seq, event, data in events.listen(job_id, keepalive=0.1) if event]
+    assert received == [('result', {'index': 0}), ('result', {'index': 1}), ('done', {})]
+    assert statuses == ['completed']
@@ -0,0 +1,20 @@
+import rate_limiter
+from config import Config
+
+def test_each_model_gets_its_own_limiter(monkeypatch):
+    monkeypatch.setattr(Config, 'OPENAI_RATE_LIMIT_ENABLED', True)
+    monkeypatch.setattr(rate_limiter, '_shared_limiters', {})
+    monkeypatch.setattr(rate_limiter, 'MODEL_RATE_LIMITS', {'gpt-4o-mini': (500, 200000)})
+
+    mini = rate_limiter.get_rate_limiter('gpt-4o-mini')
+    full = rate_limiter.get_rate_limiter('gpt-4o')
+
+    assert mini is not full
+    assert rate_limiter.get_rate_limiter('gpt-4o-mini-2024-07-18') is mini
+    assert mini.tokens.capacity == 200000
+    assert full.tokens.capacity == Config.OPENAI_TOKENS_PER_MINUTE
+    assert set(rate_limiter.get_rate_limiters()) == {'gpt-4o-mini', 'gpt-4o'}
+
+def test_disabled_limiting_returns_none(monkeypatch):
+    monkeypatch.setattr(Config, 'OPENAI_RATE_LIMIT_ENABLED', False)
+    assert rate_limiter.get_rate_limiter('gpt-4o') is None
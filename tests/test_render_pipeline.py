@@ -0,0 +1,69 @@
+import io
+
+import pytest
+from PIL import Image
+
+import render_pipeline
+from batch_executor import BatchExecutor
+from config import Config
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 20), 'white').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+class StubGrafana:
+    def __init__(self):
+        self.png = png_bytes()
+
+    def get_dashboards_by_uid(self, uids):
+        return {'dash': {'dashboard': {'title': 'Dash', 'panels': [{'id': 1, 'title': 'CPU', 'targets': [{}]}]}}}
+
+    def get_dashboard_snapshot(self, uid, panel_id=None, **kwargs):
+        return self.png
+
+class StubProcessor:
+    def __init__(self, answer):
+        self.answer = answer
+        self.calls = 0
+
+    def analyze_dashboard_image(self, image):
+        self.calls += 1
+        return dict(self.answer)
+
+class StubReports:
+    def generate_llm_json_report(self, data, filename):
+        return filename
+
+@pytest.fixture
+def make_pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'RENDER_DASHBOARD_UIDS', ['dash'])
+    monkeypatch.setattr(Config, 'RENDER_PROCESSING_METHOD', 'llm')
+    monkeypatch.setattr(Config, 'RENDER_OUTPUT_FORMAT', 'json')
+    executor = BatchExecutor(mode='serial')
+
+    def make(processor):
+        return render_pipeline.PanelRenderPipeline(StubGrafana(), executor, None, StubReports(),
+                                                   openai_processor=processor,
+                                                   cache=render_pipeline.RenderCache(str(tmp_path)))
+    yield make
+    executor.shutdown()
+
+def test_unchanged_render_reuses_a_successful_analysis(make_pipeline):
+    processor = StubProcessor({'health_status': 'HEALTHY', 'panels': []})
+    make_pipeline(processor).run()
+    pipeline = make_pipeline(processor)
+    pipeline.run()
+
+    assert processor.calls == 1
+    assert pipeline.reused == 1
+
+def test_unparseable_analysis_is_not_stored(make_pipeline):
+    processor = StubProcessor({'raw_analysis': 'not json', 'parsing_error': 'Response was not valid JSON'})
+    pipeline = make_pipeline(processor)
+    pipeline.run()
+
+    assert pipeline.cache.get_analysis('dash', 1, 'llm', StubGrafana().png) is None
+    pipeline.run()
+    assert processor.calls == 2
+    assert pipeline.reused == 0
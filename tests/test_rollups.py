@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from rollups import MetricRollups
+
+def test_non_finite_metric_values_are_skipped_without_losing_the_analysis(tmp_path):
+    rollups = MetricRollups(db_path=str(tmp_path / 'rollups.db'))
+    when = datetime(2024, 5, 6, 12, 0)
+    analysis = {
+        'dashboard_overview': {'title': 'API'},
+        'health_status': 'warning',
+        'alerts': ['High latency'],
+        'metrics': {'cpu_usage': 40, 'memory_usage': float('nan'), 'disk_usage': 'inf', 'network_in': None}
+    }
+    rollups.record(analysis, when)
+    rollups.record({**analysis, 'metrics': {'cpu_usage': '60%'}}, when)
+
+    dashboard = rollups.get_rollup('day', when)['dashboards']['API']
+    assert dashboard['analyses'] == 2
+    assert dashboard['alerts'] == 2
+    assert dashboard['health'] == {'WARNING': 2}
+    assert dashboard['metrics'] == {'cpu_usage': {'count': 2, 'min': 40.0, 'max': 60.0, 'mean': 50.0}}
+    assert rollups.get_rollup('week', when)['total_analyses'] == 2
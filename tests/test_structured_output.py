@@ -0,0 +1,50 @@
+import pytest
+
+from structured_output import DASHBOARD_ANALYSIS_SCHEMA, analysis_problems, merge_other_metrics, parse_partial_json
+
+@pytest.mark.parametrize('text, expected', [
+    ('{"a": 12', {}),
+    ('{"a": 1, "b": 2', {'a': 1}),
+    ('{"a": [1, 2', {'a': [1]}),
+    ('{"a": 1, "b": tru', {'a': 1}),
+    ('{"a": 1, "b": -', {'a': 1}),
+    ('{"a": 1, "b"', {'a': 1}),
+    ('{"a": "OK', {'a': 'OK'}),
+    ('{"a": {"b": 1}', {'a': {'b': 1}}),
+    ('Here you go: {"a": 1.5} done', {'a': 1.5}),
+])
+def test_partial_json_closes_open_strings_but_drops_dangling_numbers_and_literals(text, expected):
+    assert parse_partial_json(text) == expected
+
+def test_other_metrics_reach_the_metrics_dict_without_overriding_typed_ones():
+    analysis = {
+        'dashboard_overview': {'title': 'API', 'panel_count': 1},
+        'panels': [{'title': 'Latency', 'type': 'graph', 'current_value': 230, 'unit': 'ms', 'status': 'OK', 'threshold': None}],
+        'metrics': {'cpu_usage': 40, 'memory_usage': None, 'disk_usage': None, 'network_in': None, 'network_out': None},
+        'other_metrics': [
+            {'name': 'Request Latency p95', 'value': 230, 'unit': 'ms'},
+            {'name': 'CPU usage', 'value': 99, 'unit': '%'},
+            {'name': 'Queue depth', 'value': None, 'unit': ''},
+            {'name': 'Node temperature', 'value': -5, 'unit': 'C'},
+        ],
+        'health_status': 'HEALTHY',
+        'alerts': [],
+        'insights': [],
+    }
+    assert 'other_metrics' in DASHBOARD_ANALYSIS_SCHEMA['required']
+    metrics = merge_other_metrics(analysis)['metrics']
+    assert metrics['request_latency_p95'] == 230
+    assert metrics['cpu_usage'] == 40
+    assert 'queue_depth' not in metrics
+    assert analysis_problems(analysis) == []
+
+def test_free_form_answers_without_other_metrics_are_not_escalated():
+    analysis = {
+        'dashboard_overview': {'title': 'API', 'panel_count': 1},
+        'panels': [{'title': 'CPU', 'type': 'gauge', 'current_value': 40, 'unit': '%', 'status': 'OK'}],
+        'metrics': {'cpu_usage': 40},
+        'health_status': 'HEALTHY',
+        'alerts': [],
+        'insights': [],
+    }
+    assert analysis_problems(merge_other_metrics(analysis)) == []
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import Config
+from usage_ledger import BudgetExceededError, UsageLedger
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    # USD per 1M tokens, input/output
+    monkeypatch.setattr(Config, 'USAGE_PRICES', 'gpt-4o=2.5/10,gpt-4o-mini=0.15/0.6')
+    monkeypatch.setattr(Config, 'USAGE_DAILY_BUDGET', 1.0)
+    return UsageLedger(db_path=str(tmp_path / 'usage.db'))
+
+def test_summary_aggregates_cost_tokens_and_latency(ledger):
+    today = datetime.now()
+    yesterday = today - timedelta(days=1)
+    ledger.record('analysis', 'gpt-4o-2024-08-06', {'prompt_tokens': 1000, 'completion_tokens': 500,
+                                                   'latency_ms': 800, 'ttft_ms': 200, 'attempts': 2},
+                  dashboard='API', image_tokens=765, when=today)
+    ledger.record('analysis', 'gpt-4o-mini', {'prompt_tokens': 2000, 'completion_tokens': 1000, 'latency_ms': 400},
+                  dashboard='API', when=yesterday)
+    ledger.record('analysis', 'gpt-4o', {'prompt_tokens': 1000, 'completion_tokens': 500},
+                  dashboard='API', cache_hit='exact', when=today)
+    ledger.record('custom_prompt', 'gpt-4o', {'prompt_tokens': 100, 'completion_tokens': 0, 'latency_ms': 100},
+                  when=today)
+
+    summary = ledger.summary(days=7)
+    day, previous_day = today.strftime('%Y-%m-%d'), yesterday.strftime('%Y-%m-%d')
+
+    assert summary['calls'] == 3
+    assert summary['cache_hits'] == 1
+    assert summary['cache_hit_rate'] == 0.25
+    assert summary['prompt_tokens'] == 4100
+    assert summary['completion_tokens'] == 2000
+    assert summary['image_tokens'] == 765
+    assert summary['retried_calls'] == 1
+    # 1000 * 2.5 + 500 * 10, 2000 * 0.15 + 1000 * 0.6 and 100 * 2.5 per 1M tokens; cache hits are free
+    assert summary['cost'] == pytest.approx(0.0075 + 0.0009 + 0.00025)
+    assert summary['cost_per_day'][day] == {'calls': 2, 'cache_hits': 1, 'tokens': 3100,
+                                            'cost': pytest.approx(0.00775)}
+    assert summary['cost_per_day'][previous_day]['cost'] == pytest.approx(0.0009)
+    assert list(summary['cost_per_day']) == [previous_day, day]
+    assert summary['by_model']['gpt-4o-mini'] == {'calls': 1, 'prompt_tokens': 2000, 'completion_tokens': 1000,
+                                                  'cost': pytest.approx(0.0009)}
+    assert summary['by_dashboard'] == {'API': {'calls': 2, 'cache_hits': 1, 'tokens': 6000,
+                                               'cost': pytest.approx(0.0084), 'tokens_per_call': 3000.0}}
+    assert summary['latency_ms'] == {'p50': 400, 'p95': 800, 'p99': 800}
+    assert summary['ttft_ms'] == {'p50': 200, 'p95': 200, 'p99': 200}
+    assert summary['budget']['spent_today'] == pytest.approx(0.00775)
+
+def test_empty_ledger_summary(ledger):
+    summary = ledger.summary()
+    assert summary['calls'] == 0
+    assert summary['cost'] == 0
+    assert summary['latency_ms'] == {'p50': None, 'p95': None, 'p99': None}
+    assert summary['budget']['remaining_today'] == 1.0
+
+def test_budget_hook_fires_once_per_day_and_calls_are_refused(ledger):
+    notified = []
+    ledger.add_budget_hook(lambda day, spent, budget: notified.append((day, spent, budget)))
+    ledger.check_budget()
+
+    # 100k output tokens at $10 per 1M
+    ledger.record('analysis', 'gpt-4o', {'prompt_tokens': 0, 'completion_tokens': 100_000})
+    for _ in range(2):
+        with pytest.raises(BudgetExceededError):
+            ledger.check_budget()
+
+    assert notified == [(datetime.now().strftime('%Y-%m-%d'), pytest.approx(1.0), 1.0)]
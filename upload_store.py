@@ -0,0 +1,117 @@
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.utils import secure_filename
+from config import Config
+from image_context import ImageContext
+
+class UploadStore:
+    """Hold uploaded images in memory for processing and keep a copy on disk for recovery"""
+
+    def __init__(self, upload_folder=None, in_memory=None, persist=None, spool_folder=None, max_buffer_bytes=None):
+        self.upload_folder = upload_folder or Config.UPLOAD_FOLDER
+        self.in_memory = Config.IN_MEMORY_UPLOADS if in_memory is None else in_memory
+        self.persist = Config.PERSIST_UPLOADS if persist is None else persist
+        self.spool_folder = spool_folder or Config.UPLOAD_SPOOL_FOLDER
+        self.max_buffer_bytes = Config.UPLOAD_BUFFER_MAX_BYTES if max_buffer_bytes is None else max_buffer_bytes
+        self._buffers = {}
+        self._buffered_bytes = 0
+        self._writes = {}
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload-writer')
+        os.makedirs(self.upload_folder, exist_ok=True)
+        os.makedirs(self.spool_folder, exist_ok=True)
+
+    def add(self, file):
+        """Accept an uploaded file and describe it for a job payload"""
+        filename = secure_filename(file.filename)
+        upload_id = uuid.uuid4().hex
+        unique_filename = f"{uuid.uuid4()}_{filename}"
+        filepath = os.path.join(self.upload_folder, unique_filename)
+
+        if not self.in_memory:
+            # Save uploaded file; workers read it back from disk
+            file.save(filepath)
+            return {'upload_id': upload_id, 'filename': filename, 'filepath': filepath}
+
+        # Read the request stream once; workers decode straight from this buffer
+        data = file.read()
+        item = {'upload_id': upload_id, 'filename': filename, 'filepath': filepath}
+        if not self.persist:
+            # Originals aren't kept, but a queued job must survive a restart: spool until it finishes
+            item['filepath'] = None
+            item['spool_path'] = os.path.join(self.spool_folder, unique_filename)
+        disk_path = item['filepath'] or item['spool_path']
+
+        with self._lock:
+            buffered = self._buffered_bytes + len(data) <= self.max_buffer_bytes
+            if buffered:
+                self._buffers[upload_id] = data
+                self._buffered_bytes += len(data)
+
+        if buffered:
+            # Write without blocking the hot path; workers use the buffer meanwhile
+            future = self._writer.submit(self._write, disk_path, data)
+            with self._lock:
+                self._writes[upload_id] = future
+        else:
+            # Over the memory bound: workers will read this one from disk, so it must be there first
+            self._write(disk_path, data)
+        return item
+
+    def _write(self, filepath, data):
+        """Persist an upload's original bytes"""
+        try:
+            with open(filepath, 'wb') as f:
+                f.write(data)
+        except Exception as e:
+            print(f"Error saving upload {filepath}: {e}")
+
+    @staticmethod
+    def _disk_path(item):
+        return item.get('filepath') or item.get('spool_path')
+
+    def get_source(self, item):
+        """Get something the processors accept: an in-memory context, or the path on disk"""
+        with self._lock:
+            data = self._buffers.get(item.get('upload_id'))
+        if data is not None:
+            return ImageContext(data, filename=item['filename'], path=item.get('filepath'))
+        # Not buffered (over the memory bound, or the job was recovered after a restart): read from disk
+        return self._disk_path(item)
+
+    def missing(self, items):
+        """Filenames of uploads that are neither buffered nor on disk"""
+        with self._lock:
+            buffered = set(self._buffers)
+        return [item['filename'] for item in items
+                if item.get('upload_id') not in buffered
+                and not (self._disk_path(item) and os.path.exists(self._disk_path(item)))]
+
+    def discard(self, items):
+        """Release in-memory buffers and spooled copies once a job no longer needs them"""
+        with self._lock:
+            writes = []
+            for item in items:
+                data = self._buffers.pop(item.get('upload_id'), None)
+                if data is not None:
+                    self._buffered_bytes -= len(data)
+                writes.append(self._writes.pop(item.get('upload_id'), None))
+        for item, write in zip(items, writes):
+            if not item.get('spool_path'):
+                continue
+            if write is None:
+                self._remove(item['spool_path'])
+            else:
+                # The background write may still be pending; remove the copy once it lands
+                write.add_done_callback(lambda _, path=item['spool_path']: self._remove(path))
+
+    def _remove(self, path):
+        """Delete a spooled upload"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error removing spooled upload {path}: {e}")
@@ -0,0 +1,222 @@
+import threading
+from datetime import datetime, timedelta
+from config import Config
+from model_catalog import match_model
+from storage import connect_database, prepare_database
+
+def parse_prices(spec):
+    """'model=input/output,...' (USD per 1M tokens) -> {model: (input, output)}"""
+    prices = {}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        model, _, rates = item.partition('=')
+        input_price, _, output_price = rates.partition('/')
+        try:
+            prices[model.strip()] = (float(input_price), float(output_price or 0))
+        except ValueError:
+            print(f"Ignoring invalid price entry: {item}")
+    return prices
+
+def percentile(values, q):
+    """Nearest-rank percentile of a sorted list, or None when empty"""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * q // 100))
+    return values[int(rank) - 1]
+
+# Cache hits are logged with the kind of hit ('exact', 'near_duplicate'); real calls leave it empty
+CACHE_HIT = "COALESCE(cache_hit, '') != ''"
+
+class BudgetExceededError(RuntimeError):
+    """Raised instead of calling the API once the daily spend budget is used up"""
+
+class UsageLedger:
+    """Append-only record of every LLM call's tokens, latency and cost"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.USAGE_DB_PATH
+        self.prices = parse_prices(Config.USAGE_PRICES)
+        self.daily_budget = Config.USAGE_DAILY_BUDGET
+        self.budget_hooks = []
+        self._notified_day = None
+        self._lock = threading.Lock()
+        prepare_database(self.db_path)
+        self._init_db()
+
+    def _init_db(self):
+        """Create the ledger table"""
+        conn = connect_database(self.db_path)
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS usage_calls (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recorded_at TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    dashboard TEXT,
+                    image TEXT,
+                    cache_hit TEXT,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    completion_tokens INTEGER NOT NULL DEFAULT 0,
+                    image_tokens INTEGER NOT NULL DEFAULT 0,
+                    latency_ms REAL,
+                    ttft_ms REAL,
+                    attempts INTEGER NOT NULL DEFAULT 1,
+                    cost REAL NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_calls_day ON usage_calls (day)")
+        finally:
+            conn.close()
+
+    def price_for(self, model):
+        """(input, output) USD per 1M tokens; dated snapshots match their base model's price"""
+        name = match_model(model, self.prices)
+        return self.prices[name] if name else (0.0, 0.0)
+
+    def cost(self, model, prompt_tokens, completion_tokens, batch=False):
+        """USD cost of one call"""
+        input_price, output_price = self.price_for(model)
+        cost = (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+        return cost * Config.USAGE_BATCH_PRICE_RATIO if batch else cost
+
+    def record(self, kind, model, call=None, dashboard=None, image=None, cache_hit=None, image_tokens=0, when=None):
+        """Append one call; `call` holds prompt/completion tokens, latency_ms, ttft_ms, attempts and batch"""
+        try:
+            call = call or {}
+            when = when or datetime.now()
+            prompt_tokens = call.get('prompt_tokens') or 0
+            completion_tokens = call.get('completion_tokens') or 0
+            cost = 0.0 if cache_hit else self.cost(model, prompt_tokens, completion_tokens, call.get('batch', False))
+            conn = connect_database(self.db_path)
+            try:
+                conn.execute(
+                    """
+                    INSERT INTO usage_calls (recorded_at, day, kind, model, dashboard, image, cache_hit,
+                        prompt_tokens, completion_tokens, image_tokens, latency_ms, ttft_ms, attempts, cost)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (when.isoformat(), when.strftime('%Y-%m-%d'), kind, model, dashboard, image, cache_hit,
+                     prompt_tokens, completion_tokens, image_tokens or 0,
+                     call.get('latency_ms'), call.get('ttft_ms'), call.get('attempts', 1), cost)
+                )
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Error recording LLM usage: {e}")
+
+    def spent_on(self, day):
+        """USD spent on one 'YYYY-MM-DD' day"""
+        conn = connect_database(self.db_path)
+        try:
+            row = conn.execute("SELECT COALESCE(SUM(cost), 0) AS spent FROM usage_calls WHERE day = ?", (day,)).fetchone()
+            return row['spent']
+        finally:
+            conn.close()
+
+    def add_budget_hook(self, hook):
+        """Call hook(day, spent, budget) the first time a day's spend reaches the budget"""
+        self.budget_hooks.append(hook)
+
+    def check_budget(self):
+        """Raise BudgetExceededError when today's spend has reached USAGE_DAILY_BUDGET (0 = no budget)"""
+        if not self.daily_budget:
+            return
+        day = datetime.now().strftime('%Y-%m-%d')
+        spent = self.spent_on(day)
+        if spent < self.daily_budget:
+            return
+        with self._lock:
+            notify = self._notified_day != day
+            self._notified_day = day
+        if notify:
+            for hook in self.budget_hooks:
+                try:
+                    hook(day, spent, self.daily_budget)
+                except Exception as e:
+                    print(f"Error in budget hook: {e}")
+        raise BudgetExceededError(f"Daily LLM budget of ${self.daily_budget:.2f} reached (${spent:.2f} spent on {day})")
+
+    def summary(self, days=7):
+        """Aggregate the last `days` days: latency percentiles, tokens per dashboard, cost per day and by model"""
+        since = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        # Sums run in SQLite; only the latencies needed for percentiles are fetched
+        conn = connect_database(self.db_path)
+        try:
+            totals = conn.execute(f"""
+                SELECT COUNT(*) AS rows, COALESCE(SUM({CACHE_HIT}), 0) AS cache_hits,
+                    COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+                    COALESCE(SUM(completion_tokens), 0) AS completion_tokens,
+                    COALESCE(SUM(CASE WHEN {CACHE_HIT} THEN 0 ELSE image_tokens END), 0) AS image_tokens,
+                    COALESCE(SUM(cost), 0) AS cost,
+                    COALESCE(SUM(NOT {CACHE_HIT} AND attempts > 1), 0) AS retried_calls
+                FROM usage_calls WHERE day >= ?
+            """, (since,)).fetchone()
+            per_day = {
+                row['day']: {'calls': row['calls'], 'cache_hits': row['cache_hits'],
+                             'tokens': row['tokens'], 'cost': row['cost']}
+                for row in conn.execute(f"""
+                    SELECT day, SUM(NOT {CACHE_HIT}) AS calls, SUM({CACHE_HIT}) AS cache_hits,
+                        SUM(prompt_tokens + completion_tokens) AS tokens, SUM(cost) AS cost
+                    FROM usage_calls WHERE day >= ? GROUP BY day ORDER BY day
+                """, (since,))
+            }
+            per_model = {
+                row['model']: {'calls': row['calls'], 'prompt_tokens': row['prompt_tokens'],
+                               'completion_tokens': row['completion_tokens'], 'cost': row['cost']}
+                for row in conn.execute(f"""
+                    SELECT model, SUM(NOT {CACHE_HIT}) AS calls, SUM(prompt_tokens) AS prompt_tokens,
+                        SUM(completion_tokens) AS completion_tokens, SUM(cost) AS cost
+                    FROM usage_calls WHERE day >= ? GROUP BY model
+                """, (since,))
+            }
+            per_dashboard = {
+                row['dashboard']: {'calls': row['calls'], 'cache_hits': row['cache_hits'], 'tokens': row['tokens'],
+                                   'cost': row['cost'],
+                                   'tokens_per_call': row['tokens'] / row['calls'] if row['calls'] else 0.0}
+                for row in conn.execute(f"""
+                    SELECT COALESCE(NULLIF(dashboard, ''), 'Unknown') AS dashboard,
+                        SUM(NOT {CACHE_HIT}) AS calls, SUM({CACHE_HIT}) AS cache_hits,
+                        SUM(prompt_tokens + completion_tokens) AS tokens, SUM(cost) AS cost
+                    FROM usage_calls WHERE day >= ? AND kind != 'custom_prompt'
+                    GROUP BY COALESCE(NULLIF(dashboard, ''), 'Unknown')
+                """, (since,))
+            }
+            latencies = self._sorted_column(conn, 'latency_ms', since)
+            ttfts = self._sorted_column(conn, 'ttft_ms', since)
+        finally:
+            conn.close()
+
+        rows, cache_hits = totals['rows'], totals['cache_hits']
+        today = datetime.now().strftime('%Y-%m-%d')
+        spent_today = per_day.get(today, {}).get('cost', 0.0)
+        return {
+            'since': since,
+            'calls': rows - cache_hits,
+            'cache_hits': cache_hits,
+            'cache_hit_rate': cache_hits / rows if rows else 0.0,
+            'prompt_tokens': totals['prompt_tokens'],
+            'completion_tokens': totals['completion_tokens'],
+            'image_tokens': totals['image_tokens'],
+            'cost': totals['cost'],
+            'latency_ms': {f"p{q}": percentile(latencies, q) for q in (50, 95, 99)},
+            'ttft_ms': {f"p{q}": percentile(ttfts, q) for q in (50, 95, 99)},
+            'retried_calls': totals['retried_calls'],
+            'cost_per_day': per_day,
+            'by_model': per_model,
+            'by_dashboard': per_dashboard,
+            'budget': {
+                'daily_budget': self.daily_budget or None,
+                'spent_today': spent_today,
+                'remaining_today': max(0.0, self.daily_budget - spent_today) if self.daily_budget else None
+            }
+        }
+
+    @staticmethod
+    def _sorted_column(conn, column, since):
+        """Ascending non-null values of a timing column over the calls that reached the API"""
+        return [row[0] for row in conn.execute(
+            f"SELECT {column} FROM usage_calls WHERE day >= ? AND NOT {CACHE_HIT} AND {column} IS NOT NULL "
+            f"ORDER BY {column}", (since,))]